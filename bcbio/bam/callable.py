@@ -9,25 +9,24 @@ Regions are split to try to maintain relative uniformity across the
 genome and avoid extremes of large blocks or large numbers of
 small blocks.
 """
+import bisect
+import collections
 import contextlib
 import copy
-import operator
+import json
 import os
 import shutil
 
 import numpy
-try:
-    import pybedtools
-except ImportError:
-    pybedtools = None
 import pysam
 
 from bcbio import bam, broad, utils
+from bcbio.bam import ref
 from bcbio.log import logger
 from bcbio.distributed import multi, prun
 from bcbio.distributed.split import parallel_split_combine
 from bcbio.distributed.transaction import file_transaction
-from bcbio.pipeline import shared
+from bcbio.pipeline import intervals, shared
 
 def parallel_callable_loci(in_bam, ref_file, config):
     num_cores = config["algorithm"].get("num_cores", 1)
@@ -56,15 +55,13 @@ def combine_bed(in_files, out_file, config):
 
 @multi.zeromq_aware_logging
 def calc_callable_loci(data, region=None, out_file=None):
-    """Determine callable bases for input BAM using Broad's CallableLoci walker.
+    """Determine callable bases for input BAM, marking no coverage and excessive coverage regions.
 
-    http://www.broadinstitute.org/gatk/gatkdocs/
-    org_broadinstitute_sting_gatk_walkers_coverage_CallableLoci.html
+    Calculates depth directly from the BAM file by default, or uses Broad's
+    CallableLoci walker with `callable_method: gatk`.
     """
-    broad_runner = broad.runner_from_config(data["config"])
     if out_file is None:
         out_file = "%s-callable.bed" % os.path.splitext(data["work_bam"])[0]
-    out_summary = "%s-callable-summary.txt" % os.path.splitext(data["work_bam"])[0]
     variant_regions = data["config"]["algorithm"].get("variant_regions", None)
     # set a maximum depth to avoid calling in repetitive regions with excessive coverage
     max_depth = int(1e6 if data["config"]["algorithm"].get("coverage_depth", "").lower() == "super-high"
@@ -72,31 +69,183 @@ def calc_callable_loci(data, region=None, out_file=None):
     if not utils.file_exists(out_file):
         with file_transaction(out_file) as tx_out_file:
             bam.index(data["work_bam"], data["config"])
-            params = ["-T", "CallableLoci",
-                      "-R", data["sam_ref"],
-                      "-I", data["work_bam"],
-                      "--minDepth", "0",
-                      "--downsample_to_coverage", str(max_depth + 1000),
-                      "--minMappingQuality", "0",
-                      "--maxFractionOfReadsWithLowMAPQ", "1.1",
-                      "--maxDepth", str(max_depth),
-                      "--out", tx_out_file,
-                      "--summary", out_summary]
             ready_region = shared.subset_variant_regions(variant_regions, region, tx_out_file)
-            if ready_region:
-                params += ["-L", ready_region]
             if ((variant_regions and ready_region and os.path.isfile(ready_region))
                  or not variant_regions or not region):
-                broad_runner.run_gatk(params, data=data, region=region,
-                                      memory_retry=True)
+                if data["config"]["algorithm"].get("callable_method", "native") == "gatk":
+                    _calc_callable_gatk(data, region, ready_region, max_depth, tx_out_file)
+                else:
+                    _calc_callable_native(data, ready_region, max_depth, tx_out_file)
             else:
                 with open(out_file, "w") as out_handle:
-                    for tregion in get_ref_bedtool(data["sam_ref"], data["config"]):
+                    for tregion in get_ref_intervals(data["sam_ref"], data["config"]):
                         if tregion.chrom == region:
                             out_handle.write("%s\t%s\t%s\tNO_COVERAGE\n" %
                                              (tregion.chrom, tregion.start, tregion.stop))
     return [{"callable_bed": out_file, "config": data["config"], "work_bam": data["work_bam"]}]
 
+def _calc_callable_gatk(data, region, ready_region, max_depth, out_file):
+    """Determine callable bases using Broad's CallableLoci walker.
+
+    http://www.broadinstitute.org/gatk/gatkdocs/
+    org_broadinstitute_sting_gatk_walkers_coverage_CallableLoci.html
+    """
+    broad_runner = broad.runner_from_config(data["config"])
+    ref.index_ref(data["sam_ref"], data["config"])
+    out_summary = "%s-callable-summary.txt" % os.path.splitext(data["work_bam"])[0]
+    params = ["-T", "CallableLoci",
+              "-R", data["sam_ref"],
+              "-I", data["work_bam"],
+              "--minDepth", "0",
+              "--downsample_to_coverage", str(max_depth + 1000),
+              "--minMappingQuality", "0",
+              "--maxFractionOfReadsWithLowMAPQ", "1.1",
+              "--maxDepth", str(max_depth),
+              "--out", out_file,
+              "--summary", out_summary]
+    if ready_region:
+        params += ["-L", ready_region]
+    broad_runner.run_gatk(params, data=data, region=region, memory_retry=True)
+
+# Native calculation of callable regions from read depth
+
+# Reads skipped when calculating depth: unmapped, secondary, failing QC and duplicates,
+# matching the default GATK read filters
+_SKIP_FLAGS = 0x4 | 0x100 | 0x200 | 0x400
+# CIGAR operations covering reference bases in pileups: match, deletion, sequence match
+# and mismatch. Skipped regions (N) from spliced alignments do not count
+_CIGAR_COVER = set([0, 2, 7, 8])
+_CIGAR_SKIP = 3
+# Bases of a chromosome to calculate depth for at once
+_DEPTH_WINDOW = int(1e6)
+_STATES = ["NO_COVERAGE", "CALLABLE", "EXCESSIVE_COVERAGE", "REF_N"]
+
+def _calc_callable_native(data, ready_region, max_depth, out_file):
+    """Determine callable bases from read depth calculated directly from the BAM file.
+
+    Produces the same states as CallableLoci with the parameters used above,
+    without starting a JVM: REF_N for N bases in the reference, NO_COVERAGE
+    without reads, EXCESSIVE_COVERAGE at or above max_depth, the comparison
+    CallableLoci makes against --maxDepth, and otherwise CALLABLE.
+
+    - Depth counts reads passing the default GATK read filters, like the raw
+      depth CallableLoci uses for these states.
+    - Depth includes deletions, which are part of GATK pileups, and leaves out
+      skipped (N) regions of spliced reads, which are not.
+    - There are no base or mapping quality filters. With --minDepth 0,
+      --minMappingQuality 0 and --maxFractionOfReadsWithLowMAPQ above 1,
+      quality only affects the LOW_COVERAGE and POOR_MAPPING_QUALITY states,
+      which CallableLoci never reports with these parameters.
+    """
+    ref.fasta_idx(data["sam_ref"], data["config"])
+    with contextlib.closing(pysam.Samfile(data["work_bam"], "rb")) as bam_handle:
+        with contextlib.closing(pysam.Fastafile(data["sam_ref"])) as ref_handle:
+            with open(out_file, "w") as out_handle:
+                for chrom, start, end in _native_regions(ready_region, bam_handle):
+                    for rstart, rend, state in _region_states(bam_handle, ref_handle, chrom,
+                                                              start, end, max_depth):
+                        out_handle.write("%s\t%s\t%s\t%s\n" % (chrom, rstart, rend, _STATES[state]))
+
+def _native_regions(ready_region, bam_handle):
+    """Retrieve sorted, non-overlapping (chrom, start, end) regions to calculate depth over.
+
+    ready_region is None for the whole genome, a chromosome name or a BED file of regions.
+    """
+    sizes = dict(zip(bam_handle.references, bam_handle.lengths))
+    if ready_region is None:
+        return [(c, 0, sizes[c]) for c in bam_handle.references]
+    elif isinstance(ready_region, (list, tuple)):
+        return [tuple(ready_region)]
+    elif not os.path.isfile(ready_region):
+        return [(ready_region, 0, sizes[ready_region])]
+    by_chrom = collections.defaultdict(list)
+    with open(ready_region) as in_handle:
+        for line in in_handle:
+            parts = line.split("\t")
+            if (len(parts) >= 3 and parts[0] in sizes
+                  and not line.startswith(("#", "track", "browser"))):
+                chrom = parts[0]
+                by_chrom[chrom].append((max(0, int(parts[1])), min(int(parts[2]), sizes[chrom])))
+    out = []
+    for chrom in (c for c in bam_handle.references if c in by_chrom):
+        cur = None
+        for start, end in sorted(by_chrom[chrom]):
+            if cur and start <= cur[1]:
+                cur = (cur[0], max(cur[1], end))
+            else:
+                if cur:
+                    out.append((chrom,) + cur)
+                cur = (start, end)
+        if cur:
+            out.append((chrom,) + cur)
+    return out
+
+def _region_states(bam_handle, ref_handle, chrom, start, end, max_depth):
+    """Generate (start, end, state) runs of callable states across a region of a chromosome.
+
+    Works over windows of the region, joining runs with the same state across windows.
+    """
+    cur = None
+    for wstart in xrange(start, end, _DEPTH_WINDOW):
+        wend = min(end, wstart + _DEPTH_WINDOW)
+        starts = []
+        ends = []
+        for read in bam_handle.fetch(chrom, wstart, wend):
+            if not read.flag & _SKIP_FLAGS and read.aend is not None:
+                for rstart, rend in _covered_spans(read):
+                    starts.append(rstart)
+                    ends.append(rend)
+        ref_seq = ref_handle.fetch(chrom, wstart, wend)
+        for run in _window_states(starts, ends, ref_seq, wstart, wend, max_depth):
+            if cur and cur[1] == run[0] and cur[2] == run[2]:
+                cur = (cur[0], run[1], cur[2])
+            else:
+                if cur:
+                    yield cur
+                cur = run
+    if cur:
+        yield cur
+
+def _covered_spans(read):
+    """Retrieve (start, end) reference spans covered by a read, splitting at skipped regions.
+    """
+    if not any(op == _CIGAR_SKIP for op, _ in read.cigar):
+        return [(read.pos, read.aend)]
+    out = []
+    pos = read.pos
+    for op, length in read.cigar:
+        if op in _CIGAR_COVER:
+            if out and out[-1][1] == pos:
+                out[-1] = (out[-1][0], pos + length)
+            else:
+                out.append((pos, pos + length))
+            pos += length
+        elif op == _CIGAR_SKIP:
+            pos += length
+    return out
+
+def _window_states(starts, ends, ref_seq, wstart, wend, max_depth):
+    """Calculate runs of callable states in a window from read start and end positions.
+
+    Depth comes from the cumulative sum of read start and end events, clipping
+    reads to the window. Returns a list of (start, end, state) runs, with states
+    as indexes into _STATES.
+    """
+    size = wend - wstart
+    starts = numpy.clip(numpy.asarray(starts, dtype=numpy.int64) - wstart, 0, size)
+    ends = numpy.clip(numpy.asarray(ends, dtype=numpy.int64) - wstart, 0, size)
+    depth = numpy.cumsum(numpy.bincount(starts, minlength=size + 1) -
+                         numpy.bincount(ends, minlength=size + 1))[:size]
+    states = numpy.ones(size, dtype=numpy.int8)
+    states[depth == 0] = 0
+    states[depth >= max_depth] = 2
+    ref_bases = numpy.fromstring(ref_seq.upper(), dtype="S1")
+    states[:len(ref_bases)][ref_bases == "N"] = 3
+    breaks = numpy.flatnonzero(numpy.diff(states)) + 1
+    run_starts = numpy.concatenate(([0], breaks))
+    run_ends = numpy.concatenate((breaks, [size]))
+    return [(wstart + int(s), wstart + int(e), int(states[s])) for s, e in zip(run_starts, run_ends)]
+
 def sample_callable_bed(bam_file, ref_file, config):
     """Retrieve callable regions for a sample subset by defined analysis regions.
     """
@@ -105,56 +254,39 @@ def sample_callable_bed(bam_file, ref_file, config):
     input_regions_bed = config["algorithm"].get("variant_regions", None)
     if not utils.file_uptodate(out_file, callable_bed):
         with file_transaction(out_file) as tx_out_file:
-            callable_regions = pybedtools.BedTool(callable_bed)
-            filter_regions = callable_regions.filter(lambda x: x.name == "CALLABLE")
+            filter_regions = intervals.Intervals.from_bed(callable_bed, names=["CALLABLE"])
             if input_regions_bed:
                 if not utils.file_uptodate(out_file, input_regions_bed):
-                    input_regions = pybedtools.BedTool(input_regions_bed)
+                    input_regions = intervals.Intervals.from_bed(input_regions_bed)
                     filter_regions.intersect(input_regions).saveas(tx_out_file)
             else:
                 filter_regions.saveas(tx_out_file)
     return out_file
 
-def get_ref_bedtool(ref_file, config):
-    """Retrieve a pybedtool BedTool object with reference sizes from input reference.
+# Whole genome Intervals, by reference path and modification time
+_ref_intervals = {}
+
+def get_ref_intervals(ref_file, config):
+    """Retrieve Intervals with the full extent of each sequence in the input reference.
     """
-    broad_runner = broad.runner_from_config(config)
-    ref_dict = broad_runner.run_fn("picard_index_ref", ref_file)
-    ref_lines = []
-    with contextlib.closing(pysam.Samfile(ref_dict, "r")) as ref_sam:
-        for sq in ref_sam.header["SQ"]:
-            ref_lines.append("%s\t%s\t%s" % (sq["SN"], 0, sq["LN"]))
-    return pybedtools.BedTool("\n".join(ref_lines), from_string=True)
+    key = (os.path.abspath(ref_file), os.path.getmtime(ref_file))
+    if key not in _ref_intervals:
+        _ref_intervals[key] = intervals.Intervals.from_tuples(
+            (c.name, 0, c.size) for c in ref.file_contigs(ref_file, config))
+    return _ref_intervals[key]
 
 def _get_nblock_regions(in_file, min_n_size):
     """Retrieve coordinates of regions in reference genome with no mapping.
     These are potential breakpoints for parallelizing analysis.
     """
-    out_lines = []
+    out = []
     with open(in_file) as in_handle:
         for line in in_handle:
             contig, start, end, ctype = line.rstrip().split()
             if (ctype in ["REF_N", "NO_COVERAGE", "EXCESSIVE_COVERAGE"] and
                   int(end) - int(start) > min_n_size):
-                out_lines.append("%s\t%s\t%s\n" % (contig, start, end))
-    return pybedtools.BedTool("\n".join(out_lines), from_string=True)
-
-def _combine_regions(all_regions, ref_regions):
-    """Combine multiple BEDtools regions of regions into sorted final BEDtool.
-    """
-    chrom_order = {}
-    for i, x in enumerate(ref_regions):
-        chrom_order[x.chrom] = i
-    def wchrom_key(x):
-        chrom, start, end = x
-        return (chrom_order[chrom], start, end)
-    all_intervals = []
-    for region_group in all_regions:
-        for region in region_group:
-            all_intervals.append((region.chrom, int(region.start), int(region.stop)))
-    all_intervals.sort(key=wchrom_key)
-    bed_lines = ["%s\t%s\t%s" % (c, s, e) for (c, s, e) in all_intervals]
-    return pybedtools.BedTool("\n".join(bed_lines), from_string=True)
+                out.append((contig, start, end))
+    return intervals.Intervals.from_tuples(out)
 
 def _add_config_regions(nblock_regions, ref_regions, config):
     """Add additional nblock regions based on configured regions to call.
@@ -162,19 +294,13 @@ def _add_config_regions(nblock_regions, ref_regions, config):
     """
     input_regions_bed = config["algorithm"].get("variant_regions", None)
     if input_regions_bed:
-        input_regions = pybedtools.BedTool(input_regions_bed)
-        # work around problem with single region not subtracted correctly.
-        if len(input_regions) == 1:
-            str_regions = str(input_regions[0]).strip()
-            input_regions = pybedtools.BedTool("%s\n%s" % (str_regions, str_regions),
-                                               from_string=True)
+        input_regions = intervals.Intervals.from_bed(input_regions_bed)
         input_nblock = ref_regions.subtract(input_regions)
-        if input_nblock == ref_regions:
+        if input_nblock.total_size() == ref_regions.total_size():
             raise ValueError("Input variant_region file (%s) "
                              "excludes all genomic regions. Do the chromosome names "
                              "in the BED file match your genome (chr1 vs 1)?" % input_regions_bed)
-        all_intervals = _combine_regions([input_nblock, nblock_regions], ref_regions)
-        return all_intervals.merge()
+        return input_nblock.union(nblock_regions)
     else:
         return nblock_regions
 
@@ -182,28 +308,45 @@ class NBlockRegionPicker:
     """Choose nblock regions reasonably spaced across chromosomes.
 
     This avoids excessively large blocks and also large numbers of tiny blocks
-    by splitting to a defined number of blocks.
+    by splitting to a defined number of blocks. With a histogram of callable
+    bases from _callable_cost_histogram, blocks get spaced by expected calling
+    cost instead of genomic distance, so densely covered regions split into
+    more blocks than sparsely covered ones.
 
     Assumes to be iterating over an ordered input file and needs re-initiation
     with each new file processed as it keeps track of previous blocks to
     maintain the splitting.
     """
-    def __init__(self, ref_regions, config):
+    def __init__(self, ref_regions, config, cost_histogram=None):
         self._chr_last_blocks = {}
+        if cost_histogram and sum(cum[-1] for _, cum in cost_histogram.values()) > 0:
+            self._histogram = cost_histogram
+        else:
+            self._histogram = None
         target_blocks = int(config["algorithm"].get("nomap_split_targets", 2000))
         self._target_size = self._get_target_size(target_blocks, ref_regions)
 
     def _get_target_size(self, target_blocks, ref_regions):
         size = 0
         for x in ref_regions:
-            size += (x.end - x.start)
+            size += self._size(x.chrom, x.start, x.end)
         return size // target_blocks
 
+    def _size(self, chrom, start, end):
+        """Size of a region in bases, or in expected cost with a histogram of callable bases.
+        """
+        if self._histogram is None:
+            return end - start
+        elif chrom not in self._histogram:
+            return 0
+        bounds, cum = self._histogram[chrom]
+        return numpy.interp(end, bounds, cum) - numpy.interp(start, bounds, cum)
+
     def include_block(self, x):
         """Check for inclusion of block based on distance from previous.
         """
         last_pos = self._chr_last_blocks.get(x.chrom, 0)
-        if (x.start - last_pos) > self._target_size:
+        if self._size(x.chrom, last_pos, x.start) > self._target_size:
             self._chr_last_blocks[x.chrom] = x.stop
             return True
         else:
@@ -220,15 +363,15 @@ def block_regions(in_bam, ref_file, config):
     nblock_bed = "%s-nblocks%s" % os.path.splitext(callable_bed)
     callblock_bed = "%s-callableblocks%s" % os.path.splitext(callable_bed)
     if not utils.file_uptodate(nblock_bed, callable_bed):
-        ref_regions = get_ref_bedtool(ref_file, config)
+        ref_regions = get_ref_intervals(ref_file, config)
         nblock_regions = _get_nblock_regions(callable_bed, min_n_size)
         nblock_regions = _add_config_regions(nblock_regions, ref_regions, config)
         nblock_regions.saveas(nblock_bed)
-        ref_regions.subtract(nblock_bed).merge(d=min_n_size).saveas(callblock_bed)
+        ref_regions.subtract(nblock_regions).merge(d=min_n_size).saveas(callblock_bed)
     return callblock_bed, nblock_bed, callable_bed
 
 def _write_bed_regions(sample, final_regions, out_file, out_file_ref):
-    ref_regions = get_ref_bedtool(sample["sam_ref"], sample["config"])
+    ref_regions = get_ref_intervals(sample["sam_ref"], sample["config"])
     noanalysis_regions = ref_regions.subtract(final_regions)
     final_regions.saveas(out_file)
     noanalysis_regions.saveas(out_file_ref)
@@ -283,13 +426,140 @@ def _combine_excessive_coverage(samples, ref_regions, min_n_size):
     """Provide a global set of regions with excessive coverage to avoid.
     """
     flag = "EXCESSIVE_COVERAGE"
-    ecs = (pybedtools.BedTool(x["regions"]["callable"]).filter(lambda x: x.name == flag)
+    ecs = (intervals.Intervals.from_bed(x["regions"]["callable"], names=[flag])
            for x in samples if "regions" in x)
-    merge_ecs = _combine_regions(ecs, ref_regions).saveas()
-    if len(merge_ecs) > 0:
-        return merge_ecs.merge(d=min_n_size).filter(lambda x: x.stop - x.start > min_n_size).saveas()
-    else:
-        return merge_ecs
+    merge_ecs = ref_regions.intersect(intervals.union(ecs))
+    return merge_ecs.merge(d=min_n_size).filter(lambda x: x.end - x.start > min_n_size)
+
+def _callable_bases_by_chrom(callable_bed):
+    """Retrieve sorted callable intervals by chromosome, with cumulative callable bases.
+    """
+    by_chrom = {}
+    with open(callable_bed) as in_handle:
+        for line in in_handle:
+            parts = line.rstrip().split("\t")
+            if len(parts) >= 4 and parts[3] == "CALLABLE":
+                by_chrom.setdefault(parts[0], []).append((int(parts[1]), int(parts[2])))
+    out = {}
+    for chrom, regions in by_chrom.items():
+        regions.sort()
+        starts = numpy.array([x[0] for x in regions], dtype=numpy.int64)
+        ends = numpy.array([x[1] for x in regions], dtype=numpy.int64)
+        cum = numpy.concatenate([[0], numpy.cumsum(ends - starts)])
+        out[chrom] = (starts, ends, cum)
+    return out
+
+def _region_callable_bases(callable_info, chrom, starts, ends):
+    """Count callable bases from pre-sorted callable intervals in each of a set of regions.
+    """
+    if chrom not in callable_info:
+        return numpy.zeros(len(starts), dtype=numpy.int64)
+    c_starts, c_ends, cum = callable_info[chrom]
+    lo = numpy.searchsorted(c_ends, starts, side="right")
+    hi = numpy.searchsorted(c_starts, ends, side="left")
+    total = cum[hi] - cum[lo]
+    has_overlap = hi > lo
+    # remove portions of boundary callable intervals outside the region
+    lo_i = numpy.minimum(lo, len(c_starts) - 1)
+    hi_i = numpy.maximum(hi - 1, 0)
+    total -= numpy.where(has_overlap, numpy.maximum(starts - c_starts[lo_i], 0), 0)
+    total -= numpy.where(has_overlap, numpy.maximum(c_ends[hi_i] - ends, 0), 0)
+    return total
+
+# Bases in each bin of the histogram of callable bases used to estimate calling cost
+_COST_BIN_SIZE = 10000
+
+def _callable_cost_histogram(samples, ref_regions):
+    """Coarse cumulative histogram of callable bases summed over all samples.
+
+    Returns bin boundaries and the cumulative callable bases at each boundary
+    for each chromosome, allowing quick estimates of calling cost between any
+    two positions. Returns None without callable regions for samples.
+    """
+    callable_beds = [x["regions"]["callable"] for x in samples if "regions" in x]
+    if len(callable_beds) == 0:
+        return None
+    bounds = {}
+    counts = {}
+    for r in ref_regions:
+        bounds[r.chrom] = numpy.append(numpy.arange(r.start, r.end, _COST_BIN_SIZE), r.end)
+        counts[r.chrom] = numpy.zeros(len(bounds[r.chrom]) - 1, dtype=numpy.int64)
+    for callable_bed in callable_beds:
+        callable_info = _callable_bases_by_chrom(callable_bed)
+        for chrom in bounds:
+            counts[chrom] += _region_callable_bases(callable_info, chrom,
+                                                    bounds[chrom][:-1], bounds[chrom][1:])
+    return dict((c, (bounds[c], numpy.concatenate([[0], numpy.cumsum(counts[c])])))
+                for c in bounds)
+
+def _sample_region_bases(callable_bed, coords):
+    """Count callable bases for a sample in each of a list of (chrom, start, end) regions.
+    """
+    callable_info = _callable_bases_by_chrom(callable_bed)
+    out = numpy.zeros(len(coords), dtype=numpy.int64)
+    chrom_idxs = collections.OrderedDict()
+    for i, (chrom, _, _) in enumerate(coords):
+        chrom_idxs.setdefault(chrom, []).append(i)
+    for chrom, idxs in chrom_idxs.items():
+        starts = numpy.array([coords[i][1] for i in idxs], dtype=numpy.int64)
+        ends = numpy.array([coords[i][2] for i in idxs], dtype=numpy.int64)
+        out[idxs] = _region_callable_bases(callable_info, chrom, starts, ends)
+    return out
+
+def _batch_regions_by_cost(regions, ec_regions, samples, config):
+    """Group adjacent analysis regions into batches of similar expected calling cost.
+
+    Estimates the cost of a region as callable bases summed over all samples,
+    which scales with both region size and the number of samples with
+    coverage. Neighboring regions on a chromosome get combined until reaching
+    the average cost for `nomap_batch_targets` batches, avoiding thousands of
+    tiny tasks which spend more time starting programs than calling. Splitting
+    aims for `nomap_split_targets` regions, so batching needs a lower target to
+    have any effect. Runs with no more regions than the batch target keep them
+    unbatched. Batches never span regions with excessive coverage, which are
+    excluded from calling. Batches do span the no coverage gaps between regions,
+    so calling within a batch uses the separate regions, written out by
+    `combine_sample_regions`.
+    """
+    target_batches = int(config["algorithm"].get("nomap_batch_targets", 500))
+    callable_beds = [x["regions"]["callable"] for x in samples if "regions" in x]
+    coords = [(r.chrom, int(r.start), int(r.stop)) for r in regions]
+    if len(callable_beds) == 0 or len(coords) <= target_batches:
+        return regions
+    costs = numpy.zeros(len(coords), dtype=numpy.int64)
+    for callable_bed in callable_beds:
+        costs += _sample_region_bases(callable_bed, coords)
+    target_cost = max(1, int(costs.sum()) // target_batches)
+    by_chrom = collections.defaultdict(list)
+    for r in ec_regions:
+        by_chrom[r.chrom].append((int(r.start), int(r.stop)))
+    ecs = {}
+    for chrom, xs in by_chrom.items():
+        xs.sort()
+        # furthest end of any excessive coverage region starting at or before each one
+        ecs[chrom] = ([s for s, _ in xs], numpy.maximum.accumulate([e for _, e in xs]))
+    def _crosses_ec(chrom, start, end):
+        if chrom not in ecs:
+            return False
+        starts, max_ends = ecs[chrom]
+        i = bisect.bisect_left(starts, end)
+        return i > 0 and max_ends[i - 1] > start
+    batches = []
+    cur, cur_cost = None, 0
+    for (chrom, start, end), cost in zip(coords, costs):
+        if (cur and cur[0] == chrom and cur_cost + cost <= target_cost
+              and not _crosses_ec(chrom, cur[2], start)):
+            cur = (chrom, cur[1], end)
+            cur_cost += cost
+        else:
+            if cur:
+                batches.append(cur)
+            cur, cur_cost = (chrom, start, end), cost
+    if cur:
+        batches.append(cur)
+    logger.info("Batched %s analysis regions into %s units of similar calling cost" %
+                (len(coords), len(batches)))
+    return intervals.Intervals.from_tuples(batches)
 
 def combine_sample_regions(samples):
     """Create global set of callable regions for multi-sample calling.
@@ -301,19 +571,19 @@ def combine_sample_regions(samples):
     work_dir = samples[0]["dirs"]["work"]
     analysis_file = os.path.join(work_dir, "analysis_blocks.bed")
     no_analysis_file = os.path.join(work_dir, "noanalysis_blocks.bed")
+    callable_file = os.path.join(work_dir, "analysis_callable.bed")
     min_n_size = int(config["algorithm"].get("nomap_split_size", 100))
 
     if not utils.file_exists(analysis_file) or _needs_region_update(analysis_file, samples):
         # Combine all nblocks into a final set of intersecting regions
-        # without callable bases. HT @brentp for intersection approach
-        # https://groups.google.com/forum/?fromgroups#!topic/bedtools-discuss/qA9wK4zN8do
-        nblock_regions = reduce(operator.add,
-                                (pybedtools.BedTool(x["regions"]["nblock"])
-                                 for x in samples if "regions" in x))
-        ref_regions = get_ref_bedtool(samples[0]["sam_ref"], config)
+        # without callable bases, in a single pass over all samples.
+        nblock_regions = intervals.intersect(intervals.Intervals.from_bed(x["regions"]["nblock"])
+                                             for x in samples if "regions" in x)
+        ref_regions = get_ref_intervals(samples[0]["sam_ref"], config)
         ec_regions = _combine_excessive_coverage(samples, ref_regions, min_n_size)
-        block_filter = NBlockRegionPicker(ref_regions, config)
-        nblock_size_filtered = nblock_regions.filter(block_filter.include_block).saveas()
+        block_filter = NBlockRegionPicker(ref_regions, config,
+                                          _callable_cost_histogram(samples, ref_regions))
+        nblock_size_filtered = nblock_regions.filter(block_filter.include_block)
         if len(nblock_size_filtered) > len(ref_regions):
             final_nblock_regions = nblock_size_filtered
         else:
@@ -321,12 +591,61 @@ def combine_sample_regions(samples):
         final_regions = ref_regions.subtract(final_nblock_regions)
         if len(ec_regions) > 0:
             final_regions = final_regions.subtract(ec_regions)
-        final_regions.merge(d=min_n_size)
-        _write_bed_regions(samples[0], final_regions, analysis_file, no_analysis_file)
+        final_regions = final_regions.merge(d=min_n_size)
+        batch_regions = _batch_regions_by_cost(final_regions, ec_regions, samples, config)
+        _write_bed_regions(samples[0], batch_regions, analysis_file, no_analysis_file)
+        if batch_regions is not final_regions:
+            final_regions.saveas(callable_file)
+        elif os.path.exists(callable_file):
+            os.remove(callable_file)
+        _write_region_coverage(samples, batch_regions)
     else:
-        final_regions = pybedtools.BedTool(analysis_file)
-    _analysis_block_stats(final_regions)
-    regions = {"analysis": [(r.chrom, int(r.start), int(r.stop)) for r in final_regions],
+        batch_regions = intervals.Intervals.from_bed(analysis_file)
+    _analysis_block_stats(batch_regions)
+    regions = {"analysis": [(r.chrom, int(r.start), int(r.stop)) for r in batch_regions],
                "noanalysis": no_analysis_file,
                "analysis_bed": analysis_file}
+    if os.path.exists(callable_file):
+        regions["callable_bed"] = callable_file
     return regions
+
+# ## Per-sample index of coverage in analysis regions
+
+def _region_key(region):
+    return "%s:%s-%s" % tuple(region)
+
+def region_coverage_file(callable_bed):
+    return "%s-regioncoverage.json" % os.path.splitext(callable_bed)[0]
+
+def _write_region_coverage(samples, regions):
+    """Store callable bases in each analysis region for every sample.
+
+    Callable bases come from the single pass over reads used to identify
+    callable regions, so regions without any callable bases have no reads
+    for variant callers to use.
+    """
+    coords = [(r.chrom, int(r.start), int(r.stop)) for r in regions]
+    for callable_bed in sorted(set(x["regions"]["callable"] for x in samples if "regions" in x)):
+        bases = _sample_region_bases(callable_bed, coords)
+        out_file = region_coverage_file(callable_bed)
+        with file_transaction(out_file) as tx_out_file:
+            with open(tx_out_file, "w") as out_handle:
+                json.dump(dict((_region_key(r), int(b)) for r, b in zip(coords, bases)), out_handle)
+
+_region_coverage = {}
+
+def region_has_reads(data, region):
+    """Check the per-sample index for reads in an analysis region, before running callers.
+
+    Returns None if the index does not include the region, as with regions
+    from previous versions, leaving the check to variant callers.
+    """
+    index_file = data["config"]["algorithm"].get("region_coverage")
+    if not isinstance(region, (list, tuple)) or not index_file or not os.path.exists(index_file):
+        return None
+    key = (index_file, os.path.getmtime(index_file))
+    if key not in _region_coverage:
+        with open(index_file) as in_handle:
+            _region_coverage[key] = json.load(in_handle)
+    bases = _region_coverage[key].get(_region_key(region))
+    return None if bases is None else bases > 0
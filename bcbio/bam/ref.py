@@ -1,8 +1,10 @@
 """Manipulation functionality to deal with reference files.
 """
 import collections
+import os
+import threading
 
-from bcbio import utils
+from bcbio import broad, utils
 from bcbio.pipeline import config_utils
 from bcbio.provenance import do
 
@@ -16,11 +18,54 @@ def fasta_idx(in_file, config):
         do.run(cmd.format(**locals()), "samtools faidx")
     return fasta_index
 
+ContigInfo = collections.namedtuple("ContigInfo", "name size")
+
 def file_contigs(ref_file, config):
     """Iterator of reference contigs and lengths from a reference file.
     """
-    ContigInfo = collections.namedtuple("ContigInfo", "name size")
-    with open(fasta_idx(ref_file, config)) as in_handle:
+    for name, size in ref_info(ref_file, config)["contigs"]:
+        yield ContigInfo(name, size)
+
+def index_ref(ref_file, config):
+    """Ensure samtools and Picard indexes exist for a reference, as needed by GATK.
+    """
+    return ref_info(ref_file, config, picard_dict=True)
+
+# ## Reference metadata caching
+
+# Parsed reference information, by reference path and modification time. Shared
+# by all calls in a process and stored on disk, so regional tasks avoid
+# re-checking indexes and re-parsing them for every region.
+_REF_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".bcbio", "ref_info.json")
+_ref_info = {}
+_ref_info_lock = threading.Lock()
+
+def ref_info(ref_file, config, picard_dict=False):
+    """Retrieve parsed metadata for a reference, building missing indexes.
+
+    Returns a dictionary with the `fai` index, `contigs` as a list of contig
+    names and sizes and, with picard_dict, the Picard sequence dictionary as `dict`.
+    """
+    key = "%s:%s" % (os.path.abspath(ref_file), os.path.getmtime(ref_file))
+    with _ref_info_lock:
+        if key not in _ref_info:
+            _ref_info.update(utils.read_json_cache(_REF_CACHE_FILE))
+        info = dict(_ref_info.get(key, {}))
+        if not info.get("fai") or not utils.file_exists(info["fai"]):
+            info["fai"] = os.path.abspath(fasta_idx(ref_file, config))
+            info["contigs"] = _read_contigs(info["fai"])
+        if picard_dict and (not info.get("dict") or not utils.file_exists(info["dict"])):
+            broad_runner = broad.runner_from_config(config)
+            info["dict"] = os.path.abspath(broad_runner.run_fn("picard_index_ref", ref_file))
+        if info != _ref_info.get(key):
+            _ref_info[key] = info
+            utils.update_json_cache(_REF_CACHE_FILE, key, info)
+        return info
+
+def _read_contigs(fai_file):
+    contigs = []
+    with open(fai_file) as in_handle:
         for line in (l for l in in_handle if l.strip()):
             name, size = line.split()[:2]
-            yield ContigInfo(name, size)
+            contigs.append((name, int(size)))
+    return contigs
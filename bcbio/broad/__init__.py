@@ -7,9 +7,12 @@ from contextlib import closing
 import copy
 from distutils.version import LooseVersion
 import os
+import re
 import subprocess
+import threading
 
-from bcbio.broad import picardrun
+from bcbio import utils
+from bcbio.broad import jvmserver, picardrun
 from bcbio.pipeline import config_utils
 from bcbio.provenance import do, programs
 from bcbio.utils import curdir_tmpdir
@@ -85,7 +88,7 @@ class BroadRunner:
             p.stdout.close()
             return stdout
         else:
-            do.run(cl, "Picard {0}".format(command), None)
+            do.run(jvmserver.route(cl), "Picard {0}".format(command), None)
 
     def get_picard_version(self, command):
         if self._picard_version is None:
@@ -96,13 +99,17 @@ class BroadRunner:
             picard_jar = self._get_jar(command)
             cl = ["java", "-Xms64m", "-Xmx128m", "-jar", picard_jar]
         else:
+            picard_jar = None
             cl = [self._picard_ref, command]
         cl += ["--version"]
-        p = subprocess.Popen(cl, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        version = float(p.stdout.read().split("(")[0])
+        def _run_version():
+            p = subprocess.Popen(cl, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            version = float(p.stdout.read().split("(")[0])
+            p.wait()
+            p.stdout.close()
+            return version
+        version = _cached_jar_version(picard_jar, _run_version) if picard_jar else _run_version()
         self._picard_version = version
-        p.wait()
-        p.stdout.close()
         return version
 
     def cl_gatk(self, params, tmp_dir):
@@ -179,20 +186,7 @@ class BroadRunner:
             return self._gatk_version
         else:
             gatk_jar = self._get_jar("GenomeAnalysisTK", ["GenomeAnalysisTKLite"])
-            cl = ["java", "-Xms64m", "-Xmx128m", "-jar", gatk_jar, "-version"]
-            with closing(subprocess.Popen(cl, stdout=subprocess.PIPE, stderr=subprocess.STDOUT).stdout) as stdout:
-                out = stdout.read().strip()
-                # versions earlier than 2.4 do not have explicit version command,
-                # parse from error output from GATK
-                if out.find("ERROR") >= 0:
-                    flag = "The Genome Analysis Toolkit (GATK)"
-                    for line in out.split("\n"):
-                        if line.startswith(flag):
-                            version = line.split(flag)[-1].split(",")[0].strip()
-                else:
-                    version = out
-            if version.startswith("v"):
-                version = version[1:]
+            version = _cached_jar_version(gatk_jar, lambda: _run_gatk_version(gatk_jar))
             self._gatk_version = version
             return version
 
@@ -270,6 +264,53 @@ class BroadRunner:
                         pass
         raise ValueError("Could not find jar %s in %s:%s" % (command, self._picard_ref, self._gatk_dir))
 
+def _run_gatk_version(gatk_jar):
+    cl = ["java", "-Xms64m", "-Xmx128m", "-jar", gatk_jar, "-version"]
+    with closing(subprocess.Popen(cl, stdout=subprocess.PIPE, stderr=subprocess.STDOUT).stdout) as stdout:
+        out = stdout.read().strip()
+        version = out
+        # versions earlier than 2.4 do not have explicit version command,
+        # parse from error output from GATK
+        if out.find("ERROR") >= 0:
+            flag = "The Genome Analysis Toolkit (GATK)"
+            for line in out.split("\n"):
+                if line.startswith(flag):
+                    version = line.split(flag)[-1].split(",")[0].strip()
+    if version.startswith("v"):
+        version = version[1:]
+    return version
+
+# ## Version caching
+
+# Versions retrieved from jars, by jar path and modification time. Shared by all
+# runners in a process and stored on disk, since retrieving versions requires
+# starting a JVM.
+_VERSION_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".bcbio", "jar_versions.json")
+_jar_versions = {}
+_jar_versions_lock = threading.Lock()
+
+def _cached_jar_version(jar, get_version):
+    """Retrieve the version for a jar from the cache, or with get_version if not present.
+
+    Only caches output that looks like a version number or GATK nightly build.
+    Other output, like failures to start a JVM or errors from GATK versions
+    before 2.4, gets returned without caching so it is retried on the next call.
+    """
+    key = "%s:%s" % (os.path.abspath(jar), os.path.getmtime(jar))
+    with _jar_versions_lock:
+        if not _is_version(_jar_versions.get(key)):
+            _jar_versions.update(utils.read_json_cache(_VERSION_CACHE_FILE))
+        if not _is_version(_jar_versions.get(key)):
+            version = get_version()
+            if not _is_version(version):
+                return version
+            _jar_versions[key] = version
+            utils.update_json_cache(_VERSION_CACHE_FILE, key, version)
+        return _jar_versions[key]
+
+def _is_version(version):
+    return version is not None and re.match(r"(nightly-|\d+\.\d+)", str(version)) is not None
+
 def _get_picard_ref(config):
     """Handle retrieval of Picard for running, handling multiple cases:
 
@@ -0,0 +1,165 @@
+"""Run Picard commands in a persistent JVM with Nailgun.
+
+Starting a JVM for each Picard call often takes longer than the work on small
+files. With a Nailgun server configured, local runs start a single JVM for each
+block of parallel work and route Picard command lines to it with the Nailgun
+client, avoiding JVM startup for each call.
+
+Configure in the resources section of bcbio_system.yaml:
+
+  jvmserver:
+    jar: /path/to/nailgun-server.jar
+    cmd: ng
+    jvm_opts: ["-Xms1g", "-Xmx16g"]
+
+Commands share the heap of the server, so jvm_opts need to cover memory for
+all concurrent commands, and per-program JVM options do not apply. Commands run
+within the server's working directory, so only command lines with absolute
+paths and a Picard TMP_DIR argument get routed; commands setting JVM system
+properties, like -Djava.io.tmpdir, run in their own JVM. GATK keeps static state
+between walker runs and is not safe to run concurrently in a single JVM, so GATK
+commands always start their own JVM. IPython runs do not use the server.
+
+http://www.martiansoftware.com/nailgun/
+"""
+import contextlib
+import os
+import socket
+import subprocess
+import threading
+import time
+import zipfile
+
+from bcbio.log import logger
+from bcbio.pipeline import config_utils
+
+# Environment variable passing the server port to local worker processes and threads
+PORT_ENV = "BCBIO_JVMSERVER_PORT"
+CMD_ENV = "BCBIO_JVMSERVER_CMD"
+# Seconds to wait for the server to accept connections
+_START_TIMEOUT = 60
+
+def is_configured(config):
+    return bool(config_utils.get_resources("jvmserver", config).get("jar"))
+
+@contextlib.contextmanager
+def local_server(config):
+    """Run a Nailgun server for the duration of a block of local parallel work, if configured.
+    """
+    if not is_configured(config) or os.environ.get(PORT_ENV):
+        yield None
+        return
+    resources = config_utils.get_resources("jvmserver", config)
+    port = _free_port()
+    cl = (["java"] + resources.get("jvm_opts", ["-Xms750m", "-Xmx4g"]) +
+          ["-cp", config_utils.expand_path(resources["jar"]),
+           "com.martiansoftware.nailgun.NGServer", "127.0.0.1:%s" % port])
+    logger.debug("Starting JVM server on port %s" % port)
+    proc = subprocess.Popen(cl, stdout=open(os.devnull, "w"), stderr=subprocess.STDOUT)
+    try:
+        if _wait_for_server(port, proc):
+            os.environ[PORT_ENV] = str(port)
+            os.environ[CMD_ENV] = config_utils.get_program("jvmserver", config, default="ng")
+        else:
+            logger.info("JVM server did not start; running Java commands directly")
+        yield port
+    finally:
+        os.environ.pop(PORT_ENV, None)
+        os.environ.pop(CMD_ENV, None)
+        if proc.poll() is None:
+            proc.terminate()
+            proc.wait()
+
+def _free_port():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+def _wait_for_server(port, proc):
+    start = time.time()
+    while time.time() - start < _START_TIMEOUT and proc.poll() is None:
+        try:
+            socket.create_connection(("127.0.0.1", port), 1).close()
+            return True
+        except socket.error:
+            time.sleep(0.5)
+    return False
+
+# Jars added to the server classpath, by port
+_classpath = set()
+_classpath_lock = threading.Lock()
+
+def route(cl):
+    """Convert a Picard `java ... -jar` command line to run through a running JVM server.
+
+    Returns the original command line when no server is running or the command
+    cannot run within the server.
+    """
+    port = os.environ.get(PORT_ENV)
+    if not port or not isinstance(cl, (list, tuple)) or "-jar" not in cl[:-1]:
+        return cl
+    jvm_opts = [str(x) for x in cl[1:cl.index("-jar")]]
+    jar = cl[cl.index("-jar") + 1]
+    args = [str(x) for x in cl[cl.index("-jar") + 2:]]
+    if (any(x.startswith("-D") for x in jvm_opts) or
+          not any(x.startswith("TMP_DIR=") for x in args) or not _all_absolute(args)):
+        return cl
+    main_class = _main_class(jar)
+    if not main_class:
+        return cl
+    ng = os.environ.get(CMD_ENV, "ng")
+    with _classpath_lock:
+        if (port, jar) not in _classpath:
+            subprocess.check_call([ng, "--nailgun-port", port, "ng-cp", jar])
+            _classpath.add((port, jar))
+    return [ng, "--nailgun-port", port, main_class] + args
+
+# Picard arguments taking files, which may not have a path separator or extension
+_FILE_KEYS = set(["I", "INPUT", "O", "OUTPUT", "R", "REFERENCE_SEQUENCE", "M", "METRICS_FILE",
+                  "TMP_DIR", "CHART", "CHART_OUTPUT", "SUMMARY_OUTPUT", "BAIT_INTERVALS",
+                  "TARGET_INTERVALS", "SEQUENCE_DICTIONARY", "SD", "FASTQ", "F", "FASTQ2", "F2"])
+
+def _all_absolute(args):
+    """Check that file arguments are absolute paths, since the server has its own working directory.
+
+    Picard KEY=value arguments need absolute paths for any value that looks like
+    a file, including outputs that do not exist yet.
+    """
+    for arg in args:
+        if arg.count("=") == 1 and not arg.startswith("-"):
+            key, val = arg.split("=")
+            if _is_relative_path(key, val):
+                return False
+        elif not arg.startswith(("-", "/")) and os.path.exists(arg):
+            return False
+    return True
+
+def _is_relative_path(key, val):
+    if val.startswith("/"):
+        return False
+    if key in _FILE_KEYS or "/" in val:
+        return True
+    try:
+        float(val)
+        return False
+    except ValueError:
+        return os.path.splitext(val)[-1] != ""
+
+_main_classes = {}
+
+def _main_class(jar):
+    """Retrieve the class to run from the manifest of a jar.
+    """
+    if jar not in _main_classes:
+        main_class = None
+        try:
+            with contextlib.closing(zipfile.ZipFile(jar)) as zip_handle:
+                for line in zip_handle.read("META-INF/MANIFEST.MF").splitlines():
+                    if line.startswith("Main-Class:"):
+                        main_class = line.split(":", 1)[-1].strip()
+        except (IOError, KeyError, zipfile.BadZipfile):
+            pass
+        _main_classes[jar] = main_class
+    return _main_classes[jar]
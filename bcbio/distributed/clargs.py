@@ -10,7 +10,9 @@ def to_parallel(args, module="bcbio.distributed"):
                 "scheduler": args.scheduler, "queue": args.queue,
                 "tag": args.tag, "module": module,
                 "resources": args.resources, "timeout": args.timeout,
-                "retries": args.retries}
+                "retries": args.retries,
+                "speculative": getattr(args, "speculative", False),
+                "executor": getattr(args, "executor", None)}
     return parallel
 
 def _get_cores_and_type(numcores, paralleltype, scheduler):
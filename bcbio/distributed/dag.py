@@ -0,0 +1,134 @@
+"""Dependency aware scheduling of pipeline steps.
+
+Represents processing as a directed acyclic graph where each node, identified by
+a key like (sample, step) or (sample, region, step), has explicit inputs from the
+outputs of other nodes. A node runs as soon as its inputs are ready, instead of
+waiting on every other item in a stage: a slow sample in alignment no longer
+holds up downstream work for the remaining samples.
+
+Nodes run in lightweight threads on the controlling process and dispatch remote
+work through the thread safe `run_parallel` functions from
+bcbio.distributed.prun.start, so the same graph runs locally on multiple cores
+or on an IPython cluster.
+"""
+import collections
+import sys
+import threading
+
+from bcbio import log
+
+class Graph:
+    """Directed acyclic graph of processing steps with explicit dependencies.
+    """
+    def __init__(self):
+        self._nodes = collections.OrderedDict()
+
+    def add(self, key, fn, deps=None):
+        """Add a node calculated by `fn` from the outputs of the `deps` nodes.
+
+        `fn` receives the outputs of dependencies, in the order supplied, as
+        arguments. Dependencies need to be present in the graph before adding,
+        which ensures the graph stays acyclic.
+        """
+        deps = list(deps or [])
+        if key in self._nodes:
+            raise ValueError("Duplicate node in processing graph: %s" % str(key))
+        for dep in deps:
+            if dep not in self._nodes:
+                raise ValueError("Dependency %s of %s not found in processing graph" %
+                                 (str(dep), str(key)))
+        self._nodes[key] = (fn, deps)
+        return key
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def run(self, max_concurrent=None):
+        """Run all nodes in the graph, returning a dictionary of outputs by node key.
+
+        max_concurrent limits the number of nodes running at once. On failure,
+        waits for running nodes to finish, skips unstarted nodes and re-raises
+        the first error.
+        """
+        waiting = collections.OrderedDict((k, set(deps)) for k, (_, deps) in self._nodes.items())
+        outputs = {}
+        running = set([])
+        errors = []
+        cond = threading.Condition()
+        handlers = log.current_handlers()
+
+        def _run_node(key):
+            fn, deps = self._nodes[key]
+            try:
+                with log.thread_handlers(handlers):
+                    out = fn(*[outputs[d] for d in deps])
+            except:
+                with cond:
+                    errors.append(sys.exc_info())
+            else:
+                with cond:
+                    outputs[key] = out
+            finally:
+                with cond:
+                    running.discard(key)
+                    cond.notify_all()
+
+        with cond:
+            while 1:
+                if not errors:
+                    for key in [k for k, deps in waiting.items()
+                                if all(d in outputs for d in deps)]:
+                        if max_concurrent and len(running) >= max_concurrent:
+                            break
+                        del waiting[key]
+                        running.add(key)
+                        t = threading.Thread(target=_run_node, args=(key,),
+                                             name="dag-%s" % str(key))
+                        t.daemon = True
+                        t.start()
+                if not running:
+                    break
+                # timeout keeps the wait interruptible with Ctrl-C
+                cond.wait(_WAIT_TIMEOUT)
+        if errors:
+            exc_type, exc_value, exc_tb = errors[0]
+            raise exc_type, exc_value, exc_tb
+        assert not waiting, "Unprocessed nodes in graph: %s" % waiting.keys()
+        return outputs
+
+# Seconds between checks for finished nodes
+_WAIT_TIMEOUT = 5.0
+
+def run_sample_chains(samples, steps, run_parallel):
+    """Run each sample independently through a chain of processing steps.
+
+    samples -- List of sample arguments ([data]) as passed to run_parallel.
+    steps -- Steps to apply in order. Strings name parallel functions to run
+      remotely; callables take the current items for a sample plus run_parallel
+      and return the updated items. Callables can split (disambiguation) and
+      re-combine (split alignment merging) items but should only operate within
+      a single sample.
+
+    Returns the combined output items from all samples.
+    """
+    graph = Graph()
+    finals = []
+    for i, sample in enumerate(samples):
+        prev = graph.add((i, "input"), _constant([sample]))
+        for j, step in enumerate(steps):
+            prev = graph.add((i, j, _step_name(step)), _step_fn(step, run_parallel), [prev])
+        finals.append(prev)
+    outputs = graph.run(len(samples))
+    return [x for key in finals for x in outputs[key]]
+
+def _constant(val):
+    return lambda: val
+
+def _step_name(step):
+    return step if isinstance(step, basestring) else step.__name__
+
+def _step_fn(step, run_parallel):
+    if isinstance(step, basestring):
+        return lambda items: run_parallel(step, items)
+    else:
+        return lambda items: step(items, run_parallel)
@@ -0,0 +1,152 @@
+"""Run local tasks with concurrent.futures executors.
+
+Provides an alternative to the multiprocessing pool in bcbio.distributed.multi,
+selected with the `executor` parallel option:
+
+- processes: A pool of processes, like the default local runner.
+- threads: A pool of threads in the controlling process for tasks in
+  THREAD_SAFE_TASKS, which spend their time waiting on external programs
+  started with bcbio.provenance.do, avoiding process startup and argument
+  serialization. Other tasks change process wide state, like the working
+  directory, and run in a process pool.
+
+Runners return futures for submitted tasks, allowing cancellation and
+iteration over tasks as they complete, and work with dependency aware
+scheduling in bcbio.distributed.dag like the other runners.
+
+Executors start every task with the standard cores per job as soon as a
+worker is free. Unlike the default runner, they do not give idle cores to
+tasks at the end of a stage or delay tasks based on the machine monitor
+(bcbio.distributed.monitor).
+
+Requires concurrent.futures, available as the `futures` package on Python 2.
+"""
+import contextlib
+import copy
+
+try:
+    from concurrent import futures
+except ImportError:
+    futures = None
+
+from bcbio import log
+from bcbio.distributed import ledger, multi
+from bcbio.log import logger
+from bcbio.pipeline import config_utils
+from bcbio.provenance import events
+
+EXECUTORS = ["processes", "threads"]
+
+# Tasks that do not change the working directory or other process wide state,
+# and can run in threads of the controlling process.
+THREAD_SAFE_TASKS = set(["variantcall_sample", "split_variants_by_sample",
+                         "concat_variant_files", "combine_variant_files",
+                         "postprocess_variants", "prep_recal", "write_recal_bam",
+                         "realign_sample", "combine_bed"])
+
+class FuturesRunner:
+    """Run functions, provided by string name, on a concurrent.futures executor.
+
+    Instances work as `run_parallel` functions and are safe to call from
+    multiple threads.
+    """
+    def __init__(self, pool, parallel, thread_pool=None, task_ledger=None, store=None):
+        self._pool = pool
+        self._parallel = parallel
+        self._thread_pool = thread_pool
+        self._task_ledger = task_ledger
+        self._store = store
+
+    def submit(self, fn_name, items):
+        """Submit items for processing, returning a list of futures with the output of each.
+
+        Futures are in the order of items. Futures for tasks finished in previous
+        runs get returned already completed.
+        """
+        items = [x for x in items if x is not None]
+        finished, to_run = ledger.split_finished(self._task_ledger, fn_name, items)
+        done = {}
+        for i, data in finished:
+            done[i] = futures.Future()
+            done[i].set_result(data)
+        run_futures = []
+        if to_run:
+            fn, run_items = multi._prep_items(fn_name, [x for _, x in to_run], self._parallel)
+            cores = self._parallel["cores_per_job"]
+            job_parallel = multi.job_resources(self._parallel)
+            for x in run_items:
+                events.task("task_dispatch", fn_name, x, cores=cores)
+            if self._thread_pool and fn_name in THREAD_SAFE_TASKS:
+                handlers = log.current_handlers()
+                run_futures = [self._thread_pool.submit(_run_in_thread, fn, x, cores, job_parallel,
+                                                        handlers)
+                               for x in run_items]
+            else:
+                if self._store and "wrapper" not in self._parallel:
+                    run_items = self._store.to_refs(run_items)
+                run_futures = [self._pool.submit(multi._run_with_cores, fn, x, cores, job_parallel)
+                               for x in run_items]
+            if self._task_ledger:
+                for (key, _), future in zip(to_run, run_futures):
+                    future.add_done_callback(self._recorder(fn_name, key))
+        run_futures = iter(run_futures)
+        return [done[i] if i in done else next(run_futures) for i in range(len(items))]
+
+    def _recorder(self, fn_name, key):
+        def _record(future):
+            if not future.cancelled() and future.exception() is None:
+                self._task_ledger.record(fn_name, key, future.result() or [])
+        return _record
+
+    def __call__(self, fn_name, items, stream=False):
+        """Run items, returning combined outputs or, with stream, an iterator of
+        outputs in the order tasks finish.
+        """
+        submitted = self.submit(fn_name, items)
+        if stream:
+            return _iter_outputs(futures.as_completed(submitted), submitted)
+        return list(_iter_outputs(submitted, submitted))
+
+def _iter_outputs(ordered, submitted):
+    """Iterate over task outputs, cancelling remaining tasks on failure.
+    """
+    try:
+        for future in ordered:
+            for data in future.result() or []:
+                yield data
+    except:
+        for future in submitted:
+            future.cancel()
+        raise
+
+def _run_in_thread(fn, args, cores, job_parallel, handlers):
+    with log.thread_handlers(handlers):
+        # threads share memory, so tasks get their own copy of arguments to update
+        args = config_utils.add_cores_to_config(copy.deepcopy(args), cores, job_parallel)
+        with events.tracked_task(fn.__name__, args):
+            return fn(args)
+
+@contextlib.contextmanager
+def futures_runner(parallel, config, task_ledger=None, store=None):
+    """Provide a FuturesRunner using the executor specified in the parallel configuration.
+    """
+    if futures is None:
+        raise ImportError("Need concurrent.futures (futures package) for the %s executor"
+                          % parallel["executor"])
+    pool = futures.ProcessPoolExecutor(parallel["num_jobs"])
+    if parallel["executor"] == "threads":
+        thread_pool = futures.ThreadPoolExecutor(parallel["num_jobs"])
+    else:
+        thread_pool = None
+    logger.debug("Running local tasks with %s %s" % (parallel["num_jobs"], parallel["executor"]))
+    try:
+        yield FuturesRunner(pool, parallel, thread_pool, task_ledger, store)
+    except:
+        for p in [pool, thread_pool]:
+            if p:
+                p.shutdown(wait=False)
+        raise
+    else:
+        for p in [pool, thread_pool]:
+            if p:
+                p.shutdown(wait=True)
@@ -8,12 +8,16 @@ Cluster implementation from ipython-cluster-helper:
 
 https://github.com/roryk/ipython-cluster-helper
 """
+import itertools
 import os
+import threading
+import time
 
 from bcbio import utils
 from bcbio.log import logger, get_log_dir
+from bcbio.distributed import ledger
 from bcbio.pipeline import config_utils
-from bcbio.provenance import diagnostics
+from bcbio.provenance import diagnostics, events
 
 from cluster_helper import cluster as ipython_cluster
 
@@ -38,24 +42,181 @@ def _get_ipython_fn(fn_name, parallel):
                               fromlist=["ipythontasks"]),
                    import_fn_name)
 
-def runner(view, parallel, dirs, config):
+def runner(view, parallel, dirs, config, task_ledger=None, store=None):
     """Run a task on an ipython parallel cluster, allowing alternative queue types.
 
     view provides map-style access to an existing Ipython cluster.
+
+    The returned function is safe to call from multiple threads. Access to the
+    IPython client is serialized with a lock, and callers poll for their results
+    so independent submissions can run on the cluster concurrently.
+
+    task_ledger -- Optional bcbio.distributed.ledger.TaskLedger to skip tasks
+      finished in previous runs and record newly finished tasks.
+    store -- Optional bcbio.distributed.objectstore.FileStore for passing large
+      shared sections of sample data to engines by reference.
     """
-    def run(fn_name, items):
-        out = []
+    client_lock = threading.Lock()
+    def run(fn_name, items, stream=False):
+        """Run items, returning combined outputs or, with stream, an iterator of
+        outputs in the order tasks finish.
+        """
         items = [x for x in items if x is not None]
-        items = diagnostics.track_parallel(items, fn_name)
+        finished, to_run = ledger.split_finished(task_ledger, fn_name, items)
+        stored = [x for _, data in finished for x in data]
+        keys = [k for k, _ in to_run]
+        def _record(i, data):
+            if task_ledger:
+                task_ledger.record(fn_name, keys[i], data or [])
+        items = diagnostics.track_parallel([x for _, x in to_run], fn_name)
         fn = _get_ipython_fn(fn_name, parallel)
         logger.info("ipython: %s" % fn_name)
         if len(items) > 0:
+            if store and "wrapper" not in parallel:
+                items = store.to_refs(items)
             items = [config_utils.add_cores_to_config(x, parallel["cores_per_job"], parallel) for x in items]
             if "wrapper" in parallel:
                 wrap_parallel = {k: v for k, v in parallel.items() if k in set(["fresources"])}
                 items = [[fn_name] + parallel.get("wrapper_args", []) + [wrap_parallel] + list(x) for x in items]
-            for data in view.map_sync(fn, items, track=False):
-                if data:
-                    out.extend(data)
-        return out
+            for x in items:
+                events.task("task_dispatch", fn_name, x, cores=parallel["cores_per_job"])
+            if parallel.get("speculative"):
+                speculative = _iter_speculative(view, fn, items, client_lock)
+                if stream:
+                    return itertools.chain(stored, _flatten_recorded(speculative, _record))
+                results = []
+                for i, data in sorted(speculative):
+                    _record(i, data)
+                    results.append(data)
+                return ledger.combine_outputs(finished, results)
+            if stream:
+                with client_lock:
+                    async_results = [view.apply_async(fn, x) for x in items]
+                return itertools.chain(stored, _iter_finished(async_results, client_lock, _record))
+            with client_lock:
+                async_result = view.map_async(fn, items, track=False)
+            while 1:
+                with client_lock:
+                    if async_result.ready():
+                        results = async_result.get()
+                        break
+                time.sleep(_POLL_INTERVAL)
+            for i, data in enumerate(results):
+                _record(i, data)
+        else:
+            results = []
+        out = ledger.combine_outputs(finished, results)
+        return iter(out) if stream else out
     return run
+
+def _iter_finished(async_results, client_lock, on_finish=None):
+    """Iterate over outputs from IPython asynchronous results as each task finishes.
+
+    on_finish, if provided, gets called with the index and output of each finished task.
+    """
+    pending = list(enumerate(async_results))
+    while pending:
+        with client_lock:
+            finished = [(i, r) for i, r in pending if r.ready()]
+            outs = [r.get() for _, r in finished]
+        for (i, result), data in zip(finished, outs):
+            pending.remove((i, result))
+            if on_finish:
+                on_finish(i, data)
+            for x in data or []:
+                yield x
+        if pending and not finished:
+            time.sleep(_POLL_INTERVAL)
+
+def _flatten_recorded(finished, on_finish):
+    for i, data in finished:
+        on_finish(i, data)
+        for x in data or []:
+            yield x
+
+def _iter_speculative(view, fn, items, client_lock):
+    """Run items, re-running straggling tasks and yielding (index, output) as each finishes.
+
+    Once most tasks finish, tasks running far longer than the median finished
+    task get launched again on another engine and the first copy to finish
+    provides the output. Task run times count from when the hub first reports
+    a task assigned to an engine, so tasks waiting in the queue do not get
+    re-run early. Aborting does not stop copies already running, so tasks
+    keep existing outputs (bcbio.distributed.transaction.keep_existing) and a
+    copy finishing later does not replace outputs of the first.
+    """
+    with client_lock:
+        launched = [[view.apply_async(fn, x)] for x in items]
+    pending = set(range(len(items)))
+    durations = []
+    started = {}
+    while pending:
+        finished = []
+        with client_lock:
+            running = _running_msg_ids(view.client)
+            for i in sorted(pending):
+                ready = [r for r in launched[i] if r.ready()]
+                successful = [r for r in ready if r.successful()]
+                if successful:
+                    finished.append((i, successful[0]))
+                elif ready and len(ready) == len(launched[i]):
+                    # all copies failed, raising the error
+                    ready[0].get()
+                elif i not in started and running & set(launched[i][0].msg_ids):
+                    started[i] = time.time()
+            outs = [(i, result.get()) for i, result in finished]
+            for i, result in finished:
+                durations.append(_task_seconds(result))
+                for other in launched[i]:
+                    if other is not result and not other.ready():
+                        try:
+                            other.abort()
+                        except Exception:
+                            pass
+        for i, data in outs:
+            pending.discard(i)
+            yield i, data
+        if (pending and durations and
+              len(items) - len(pending) >= len(items) * _SPECULATE_FINISHED):
+            cutoff = max(_SPECULATE_MIN_SECONDS,
+                         sorted(durations)[len(durations) // 2] * _SPECULATE_SCALE)
+            stragglers = [i for i in pending if len(launched[i]) == 1
+                          and i in started and time.time() - started[i] > cutoff]
+            if stragglers:
+                with client_lock:
+                    for i in stragglers:
+                        logger.info("Re-running straggling task on another engine: %s" % fn.__name__)
+                        events.task("retry", fn.__name__, items[i], reason="straggler")
+                        launched[i].append(view.apply_async(fn, items[i]))
+        if pending and not outs:
+            time.sleep(_POLL_INTERVAL)
+
+def _running_msg_ids(client):
+    """Retrieve message ids of tasks assigned to engines, which run one task at a time.
+    """
+    try:
+        status = client.queue_status(verbose=True)
+    except Exception:
+        return set([])
+    out = set([])
+    for engine, queues in status.items():
+        if engine != "unassigned":
+            out.update(queues.get("tasks", []))
+    return out
+
+def _task_seconds(result):
+    """Retrieve run time of a finished task from IPython metadata.
+    """
+    started, completed = result.metadata.get("started"), result.metadata.get("completed")
+    if started and completed:
+        return (completed - started).total_seconds()
+    return 0.0
+
+# Seconds to wait between checks for finished tasks
+_POLL_INTERVAL = 0.5
+# Fraction of finished tasks before re-running stragglers
+_SPECULATE_FINISHED = 0.9
+# Multiple of median task time before considering a task a straggler
+_SPECULATE_SCALE = 3.0
+# Minimum seconds before re-running a straggling task
+_SPECULATE_MIN_SECONDS = 60.0
@@ -4,10 +4,12 @@ import contextlib
 
 from IPython.parallel import require
 
+from bcbio.distributed import objectstore
+from bcbio.distributed.transaction import keep_existing
 from bcbio.ngsalign import alignprep
 from bcbio.pipeline import (config_utils, disambiguate, sample, lane, qcsummary, shared,
                             variation, rnaseq)
-from bcbio.provenance import system
+from bcbio.provenance import events, system
 from bcbio import structural
 from bcbio import chipseq
 from bcbio.variation import (bamprep, coverage, realign, genotype, ensemble, multi, population,
@@ -19,6 +21,7 @@ def _setup_logging(args):
     config = None
     if len(args) == 1 and isinstance(args[0], (list, tuple)):
         args = args[0]
+    objectstore.resolve(args)
     for arg in args:
         if config_utils.is_nested_config_arg(arg):
             config = arg["config"]
@@ -29,8 +32,15 @@ def _setup_logging(args):
     if config is None:
         raise NotImplementedError("No config in %s:" % args[0])
     handler = setup_local_logging(config, config.get("parallel", {}))
+    # speculative runs can start copies of a task, which must not replace each other's outputs
+    speculative = config.get("parallel", {}).get("speculative")
     try:
-        yield None
+        with events.tracked_task(None, args):
+            if speculative:
+                with keep_existing():
+                    yield None
+            else:
+                yield None
     except:
         logger.exception("Unexpected error")
         raise
@@ -0,0 +1,145 @@
+"""Persistent record of finished parallel tasks, enabling fast restarts.
+
+Stage level checkpoints in checkpoints_parallel only get written once an entire
+parallel stage finishes. The ledger complements these by storing the output of
+each individual task, keyed by function name and a hash of the task arguments,
+in a SQLite database. On restart, runners return stored outputs for finished
+tasks without re-running or re-checking them, so a crash late in a stage
+only requires processing the remaining tasks.
+"""
+import contextlib
+import cPickle
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+from bcbio.log import logger
+
+# Keys that change between runs without affecting task outputs
+_VOLATILE_KEYS = set(["entity", "parallel", "num_cores"])
+
+class TaskLedger:
+    """SQLite backed store of outputs for finished tasks.
+
+    Safe to use from multiple threads on the controlling process. Only the
+    controlling process writes, avoiding locking issues on shared filesystems.
+    """
+    def __init__(self, db_file, work_dir):
+        self._db_file = db_file
+        self._work_dir = os.path.normpath(work_dir)
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS tasks "
+                         "(fn_name TEXT, task_key TEXT, output BLOB, "
+                         "PRIMARY KEY (fn_name, task_key))")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        with self._lock:
+            conn = sqlite3.connect(self._db_file, timeout=60)
+            try:
+                with conn:
+                    yield conn
+            finally:
+                conn.close()
+
+    def split_finished(self, fn_name, items):
+        """Separate items into stored outputs of finished tasks and those to run.
+
+        Returns a list of (index, output) for finished tasks, with the index of
+        the task in items, and a list of (task_key, item) to process.
+        """
+        keys = [_task_key(x) for x in items]
+        with self._connect() as conn:
+            stored = {}
+            for key in set(keys):
+                row = conn.execute("SELECT output FROM tasks WHERE fn_name = ? AND task_key = ?",
+                                   (fn_name, key)).fetchone()
+                if row:
+                    stored[key] = cPickle.loads(str(row[0]))
+        finished = []
+        to_run = []
+        for i, (key, item) in enumerate(zip(keys, items)):
+            output = stored.get(key)
+            if output is not None and self._outputs_exist(output):
+                finished.append((i, _remove_volatile_config(output)))
+            else:
+                to_run.append((key, item))
+        return finished, to_run
+
+    def record(self, fn_name, task_key, output):
+        """Store the output of a finished task.
+        """
+        blob = sqlite3.Binary(cPickle.dumps(output, cPickle.HIGHEST_PROTOCOL))
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO tasks (fn_name, task_key, output) VALUES (?, ?, ?)",
+                         (fn_name, task_key, blob))
+
+    def _outputs_exist(self, output):
+        """Ensure files in the work directory referenced by stored outputs are present.
+        """
+        for fname in _iter_strings(output):
+            if (os.path.isabs(fname) and fname.startswith(self._work_dir)
+                  and not os.path.exists(fname)):
+                return False
+        return True
+
+def split_finished(task_ledger, fn_name, items):
+    """Retrieve finished outputs and (task_key, item) pairs to run, with an optional ledger.
+    """
+    if task_ledger is None:
+        return [], [(None, x) for x in items]
+    finished, to_run = task_ledger.split_finished(fn_name, items)
+    if finished:
+        logger.info("Reusing %s of %s finished tasks for %s from checkpoints" %
+                    (len(finished), len(items), fn_name))
+    return finished, to_run
+
+def combine_outputs(finished, outputs):
+    """Combine finished and newly run task outputs into a single list in input order.
+
+    finished -- (index, output) for finished tasks, from split_finished.
+    outputs -- Outputs of newly run tasks, in the order of tasks to process.
+    """
+    by_index = dict(finished)
+    remaining = iter(outputs)
+    out = []
+    for i in range(len(by_index) + len(outputs)):
+        data = by_index[i] if i in by_index else next(remaining)
+        out.extend(data or [])
+    return out
+
+def _task_key(item):
+    """Hash task arguments, ignoring details that change between identical runs.
+    """
+    return hashlib.sha1(json.dumps(_normalize(item), sort_keys=True, default=str)).hexdigest()
+
+def _normalize(x):
+    if isinstance(x, dict):
+        return dict((k, _normalize(v)) for k, v in x.iteritems() if k not in _VOLATILE_KEYS)
+    elif isinstance(x, (list, tuple)):
+        return [_normalize(v) for v in x]
+    else:
+        return x
+
+def _iter_strings(x):
+    if isinstance(x, basestring):
+        yield x
+    elif isinstance(x, dict):
+        for v in x.itervalues():
+            for s in _iter_strings(v):
+                yield s
+    elif isinstance(x, (list, tuple)):
+        for v in x:
+            for s in _iter_strings(v):
+                yield s
+
+def _remove_volatile_config(output):
+    """Remove parallel details from a previous run, like logging ports, in stored outputs.
+    """
+    for data in output:
+        if isinstance(data, dict) and isinstance(data.get("config"), dict):
+            data["config"].pop("parallel", None)
+    return output
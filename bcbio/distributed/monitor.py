@@ -0,0 +1,80 @@
+"""Monitor memory and load on the local machine to adjust task dispatch.
+
+Job counts from bcbio.distributed.resources come from expected memory and
+cores for each program, which can not anticipate several memory intensive
+tasks peaking together, or stages using much less than expected. The monitor
+checks available memory and load average as tasks get dispatched, holding
+back new tasks when memory runs low and allowing extra tasks when the machine
+sits underused.
+
+Configure in the resources section of bcbio_system.yaml:
+
+  monitor:
+    min_free_memory: 0.1
+    extra_jobs: 0.25
+
+min_free_memory is the fraction of machine memory to keep available, and
+extra_jobs the fraction of additional jobs to run on an underused machine.
+Requires psutil; without it tasks get dispatched using the calculated resources.
+"""
+import math
+import os
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from bcbio.pipeline import config_utils
+
+# Available memory and load, as fractions of machine memory and cores, below
+# which a machine counts as underused
+_UNDERUSED_MEMORY = 0.5
+_UNDERUSED_LOAD = 0.5
+# Seconds to wait after starting a task before allowing extra tasks, letting
+# its memory and CPU usage show up in measurements
+_RAMP_TIME = 30.0
+
+class NodeMonitor:
+    """Decide when to delay or add tasks based on measured memory and load.
+    """
+    def __init__(self, min_free_memory=0.1, extra_jobs=0.25):
+        self.min_free_memory = min_free_memory
+        self.extra_jobs = extra_jobs
+        self._last_start = 0
+        self._cores = psutil.cpu_count() if hasattr(psutil, "cpu_count") else psutil.NUM_CPUS
+
+    def free_memory(self):
+        """Fraction of machine memory available to new processes.
+        """
+        mem = psutil.virtual_memory()
+        return float(mem.available) / mem.total
+
+    def can_start(self):
+        """Check for enough available memory to start another task.
+        """
+        return self.free_memory() > self.min_free_memory
+
+    def is_underused(self):
+        """Check for spare memory and CPU, once recently started tasks are running.
+        """
+        if time.time() - self._last_start < _RAMP_TIME:
+            return False
+        return (self.free_memory() > _UNDERUSED_MEMORY and
+                os.getloadavg()[0] < self._cores * _UNDERUSED_LOAD)
+
+    def started(self):
+        self._last_start = time.time()
+
+    def num_extra_jobs(self, num_jobs):
+        return int(math.ceil(num_jobs * self.extra_jobs))
+
+def get_monitor(config):
+    """Retrieve a monitor for the local machine, or None if psutil is not available.
+    """
+    if psutil is None or not hasattr(psutil, "virtual_memory"):
+        return None
+    resources = config_utils.get_resources("monitor", config) if config else {}
+    return NodeMonitor(float(resources.get("min_free_memory", 0.1)),
+                       float(resources.get("extra_jobs", 0.25)))
@@ -1,32 +1,311 @@
 """Run tasks in parallel on a single machine using multiple cores.
 """
+import collections
+import contextlib
+import copy
 import functools
+import itertools
+import multiprocessing
+import sys
+import threading
 
 try:
     import joblib
 except ImportError:
     joblib = False
 
-from bcbio.distributed import resources
+from bcbio import log
+from bcbio.distributed import ledger, monitor, objectstore, resources
 from bcbio.log import logger, setup_local_logging
 from bcbio.pipeline import config_utils
-from bcbio.provenance import diagnostics, system
+from bcbio.provenance import diagnostics, events, system
 
-def runner(parallel, config):
-    """Run functions, provided by string name, on multiple cores on the current machine.
+@contextlib.contextmanager
+def pool_runner(parallel, config, task_ledger=None, store=None):
+    """Run functions on a pool of local processes shared between concurrent callers.
+
+    The returned function is safe to call from multiple threads at once, which
+    allows dependency aware scheduling (bcbio.distributed.dag) to submit work
+    for independent samples as soon as their inputs are ready. The pool size
+    caps total concurrent jobs across all callers.
+
+    task_ledger -- Optional bcbio.distributed.ledger.TaskLedger to skip tasks
+      finished in previous runs and record newly finished tasks.
+    store -- Optional bcbio.distributed.objectstore.FileStore for passing large
+      shared sections of sample data to workers by reference.
+
+    Tasks get started within a budget of cores, so multicore tasks starting
+    when others are finished, at the tail of a stage, use the freed cores.
+    A monitor of machine memory and load (bcbio.distributed.monitor) delays
+    tasks when memory runs low and adds extra tasks when the machine is underused.
+
+    Single job runs, and runs nested within a pool worker, which as a daemonic
+    process cannot start children, run tasks serially in the current process.
     """
-    def run_parallel(fn_name, items):
+    if parallel["num_jobs"] == 1 or multiprocessing.current_process().daemon:
+        pool = None
+        scheduler = _SerialScheduler(parallel)
+    else:
+        node_monitor = monitor.get_monitor(config)
+        extra_jobs = node_monitor.num_extra_jobs(parallel["num_jobs"]) if node_monitor else 0
+        pool = multiprocessing.Pool(parallel["num_jobs"] + extra_jobs)
+        scheduler = _CoreScheduler(pool, parallel, node_monitor, extra_jobs)
+    def run_parallel(fn_name, items, stream=False):
+        """Run items, returning combined outputs or, with stream, an iterator of
+        outputs in the order tasks finish.
+        """
         items = [x for x in items if x is not None]
-        if len(items) == 0:
-            return []
-        items = diagnostics.track_parallel(items, fn_name)
-        logger.info("multiprocessing: %s" % fn_name)
-        fn = get_fn(fn_name, parallel)
-        if "wrapper" in parallel:
-            wrap_parallel = {k: v for k, v in parallel.items() if k in set(["fresources"])}
-            items = [[fn_name] + parallel.get("wrapper_args", []) + [wrap_parallel] + list(x) for x in items]
-        return run_multicore(fn, items, config, parallel=parallel)
-    return run_parallel
+        finished, to_run = ledger.split_finished(task_ledger, fn_name, items)
+        if len(to_run) == 0:
+            out = ledger.combine_outputs(finished, [])
+            return iter(out) if stream else out
+        keys = [k for k, _ in to_run]
+        def _record(i, data):
+            if task_ledger:
+                task_ledger.record(fn_name, keys[i], data or [])
+        fn, items = _prep_items(fn_name, [x for _, x in to_run], parallel)
+        if store and "wrapper" not in parallel:
+            items = store.to_refs(items)
+        results = [scheduler.submit(fn, x) for x in items]
+        if stream:
+            return itertools.chain([x for _, data in finished for x in data],
+                                   _iter_finished(results, _record))
+        outputs = []
+        for i, result in enumerate(results):
+            # timeout keeps the wait interruptible with Ctrl-C
+            data = result.get(_MAX_WAIT)
+            _record(i, data)
+            outputs.append(data)
+        return ledger.combine_outputs(finished, outputs)
+    try:
+        yield run_parallel
+    except:
+        scheduler.close(abort=True)
+        if pool:
+            pool.terminate()
+        raise
+    else:
+        scheduler.close()
+        if pool:
+            pool.close()
+    finally:
+        if pool:
+            pool.join()
+
+class _SerialScheduler:
+    """Run tasks one at a time in the current process, with the interface of _CoreScheduler.
+
+    Tasks get their own copy of arguments, since split regions and samples
+    share unchanged nested sections which tasks may update.
+    """
+    def __init__(self, parallel):
+        self._cores_per_job = parallel["cores_per_job"]
+        self._job_parallel = job_resources(parallel)
+        self._lock = threading.Lock()
+
+    def submit(self, fn, args):
+        task = _Task(fn, args)
+        task.cores = self._cores_per_job
+        with self._lock:
+            events.task("task_dispatch", fn.__name__, args, cores=task.cores)
+            task.result = _SerialResult(_run_with_cores, (fn, copy.deepcopy(args), task.cores,
+                                                          self._job_parallel))
+        task.done.set()
+        return task
+
+    def close(self, abort=False):
+        pass
+
+class _SerialResult:
+    """Output of a function run in the current process, with the interface of pool results.
+    """
+    def __init__(self, fn, args):
+        self._error = None
+        try:
+            self._value = fn(*args)
+        except Exception, e:
+            self._value = None
+            self._error = (e, sys.exc_info()[2])
+
+    def ready(self):
+        return True
+
+    def get(self, timeout=None):
+        if self._error:
+            raise self._error[0], None, self._error[1]
+        return self._value
+
+class _CoreScheduler:
+    """Start tasks on a process pool within a budget of total cores.
+
+    Tasks start in submission order using the standard cores per job. For
+    multicore jobs, tasks started when there are more free cores than waiting
+    tasks get a share of the free cores, up to _MAX_CORE_SCALE times the
+    standard, avoiding idle cores while the last tasks of a stage finish.
+
+    With a node monitor, tasks wait while available memory is low, as long as
+    other tasks are running, and up to extra_jobs more tasks than the budget
+    allows start while the machine is underused.
+    """
+    def __init__(self, pool, parallel, node_monitor=None, extra_jobs=0):
+        self._pool = pool
+        self._cores_per_job = parallel["cores_per_job"]
+        self._free = parallel["num_jobs"] * parallel["cores_per_job"]
+        self._max_cores = min(self._free, self._cores_per_job * _MAX_CORE_SCALE)
+        self._job_parallel = job_resources(parallel)
+        self._monitor = node_monitor
+        self._extra = extra_jobs * self._cores_per_job
+        self._throttled = False
+        self._pending = collections.deque()
+        self._running = []
+        self._closed = False
+        self._cond = threading.Condition()
+        self._handlers = log.current_handlers()
+        self._thread = threading.Thread(target=self._dispatch, name="core-scheduler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, fn, args):
+        """Submit a task, returning a result with the interface of pool.apply_async.
+        """
+        task = _Task(fn, args)
+        with self._cond:
+            self._pending.append(task)
+            self._cond.notify()
+        return task
+
+    def close(self, abort=False):
+        with self._cond:
+            self._closed = True
+            if abort:
+                self._pending.clear()
+                self._running = []
+            self._cond.notify()
+        self._thread.join()
+
+    def _notify(self, _=None):
+        with self._cond:
+            self._cond.notify()
+
+    def _task_cores(self):
+        if self._cores_per_job > 1:
+            share = self._free // (len(self._pending) + 1)
+            return max(self._cores_per_job, min(share, self._max_cores))
+        return self._cores_per_job
+
+    def _dispatch(self):
+        with log.thread_handlers(self._handlers):
+            with self._cond:
+                while not self._closed or self._pending or self._running:
+                    for task in [t for t in self._running if t.result.ready()]:
+                        self._running.remove(task)
+                        self._free += task.cores
+                        task.done.set()
+                    while self._pending and self._can_dispatch():
+                        task = self._pending.popleft()
+                        task.cores = self._task_cores()
+                        if task.cores > self._cores_per_job:
+                            logger.debug("Using %s idle cores for task" % task.cores)
+                        self._free -= task.cores
+                        events.task("task_dispatch", task.fn.__name__, task.args, cores=task.cores)
+                        task.result = self._pool.apply_async(_run_with_cores,
+                                                             (task.fn, task.args, task.cores,
+                                                              self._job_parallel),
+                                                             callback=self._notify)
+                        self._running.append(task)
+                        if self._monitor:
+                            self._monitor.started()
+                    # successful tasks notify; poll to also catch failures
+                    self._cond.wait(_POLL_INTERVAL)
+
+    def _can_dispatch(self):
+        """Check cores in the budget, or extras on an underused machine, and available memory.
+        """
+        if self._free < self._cores_per_job:
+            if not (self._monitor and self._free + self._extra >= self._cores_per_job
+                    and self._monitor.is_underused()):
+                return False
+            logger.debug("Starting extra task on underused machine")
+        if self._monitor and self._running and not self._monitor.can_start():
+            if not self._throttled:
+                logger.info("Delaying new tasks until more memory is available: %.1f%% free"
+                            % (100.0 * self._monitor.free_memory()))
+                self._throttled = True
+            return False
+        self._throttled = False
+        return True
+
+def job_resources(parallel):
+    """Resources calculated for each job, passed to tasks in their configuration.
+
+    Provides the memory available to each job, like IPython runs, so commands
+    retried after memory errors stay within it, and Java options adjusted to
+    fit the memory.
+    """
+    return dict((k, parallel[k]) for k in ["mem", "jvm_opts"] if k in parallel)
+
+def _run_with_cores(fn, args, cores, job_parallel=None):
+    args = objectstore.resolve(config_utils.add_cores_to_config(args, cores, job_parallel))
+    with events.tracked_task(fn.__name__, args):
+        return fn(args)
+
+class _Task:
+    """Result of a task submitted to _CoreScheduler, providing pool result methods.
+    """
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+        self.cores = None
+        self.result = None
+        self.done = threading.Event()
+
+    def ready(self):
+        return self.done.is_set()
+
+    def wait(self, timeout=None):
+        self.done.wait(timeout)
+
+    def get(self, timeout=None):
+        self.done.wait(timeout)
+        if not self.done.is_set():
+            raise multiprocessing.TimeoutError
+        return self.result.get()
+
+# Maximum seconds to wait for a single task result
+_MAX_WAIT = 60 * 60 * 24 * 365
+# Seconds to wait between checks for finished tasks
+_POLL_INTERVAL = 0.5
+# Maximum multiple of standard cores per job given to tasks started with idle cores
+_MAX_CORE_SCALE = 4
+
+def _iter_finished(results, on_finish=None):
+    """Iterate over outputs from asynchronous pool results as each task finishes.
+
+    on_finish, if provided, gets called with the index and output of each finished task.
+    """
+    pending = list(enumerate(results))
+    while pending:
+        finished = [(i, r) for i, r in pending if r.ready()]
+        for i, result in finished:
+            pending.remove((i, result))
+            data = result.get()
+            if on_finish:
+                on_finish(i, data)
+            for x in data or []:
+                yield x
+        if pending and not finished:
+            pending[0][1].wait(_POLL_INTERVAL)
+
+def _prep_items(fn_name, items, parallel):
+    """Retrieve function to run and prepare items with parallel tracking information.
+    """
+    items = diagnostics.track_parallel(items, fn_name)
+    logger.info("multiprocessing: %s" % fn_name)
+    fn = get_fn(fn_name, parallel)
+    if "wrapper" in parallel:
+        wrap_parallel = {k: v for k, v in parallel.items() if k in set(["fresources"])}
+        items = [[fn_name] + parallel.get("wrapper_args", []) + [wrap_parallel] + list(x) for x in items]
+    return fn, items
 
 def get_fn(fn_name, parallel):
     taskmod = "multitasks"
@@ -75,7 +354,11 @@ def run_multicore(fn, items, config, parallel=None):
         parallel = resources.calculate(parallel, items, sysinfo, config,
                                        parallel.get("multiplier", 1),
                                        max_multicore=int(parallel.get("max_multicore", sysinfo["cores"])))
-    items = [config_utils.add_cores_to_config(x, parallel["cores_per_job"]) for x in items]
+    items = [config_utils.add_cores_to_config(x, parallel["cores_per_job"], job_resources(parallel))
+             for x in items]
+    if parallel["num_jobs"] == 1:
+        # joblib runs single jobs in the current process, sharing nested sections of arguments
+        items = [copy.deepcopy(x) for x in items]
     if joblib is None:
         raise ImportError("Need joblib for multiprocessing parallelization")
     out = []
@@ -0,0 +1,135 @@
+"""Content addressed storage of large shared inputs for parallel tasks.
+
+Items passed to parallel functions repeat large nested sections, like resource
+configurations and genome references, for every sample and region. Instead of
+serializing these for each task, the controlling process stores each distinct
+section once and tasks carry small references, which workers resolve on demand.
+
+Local runs use a store in shared memory (/dev/shm) when available, and IPython
+runs use a store on the shared filesystem of the work directory. Both get
+removed when the parallel block finishes.
+"""
+import contextlib
+import cPickle
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+from bcbio import utils
+
+REF_KEY = "__objectstore_ref__"
+
+# Sections of sample dictionaries that stay unchanged within parallel tasks
+_SHARED_SECTIONS = [("config", "resources"), ("genome_resources",), ("reference",),
+                    ("provenance", "programs")]
+
+class FileStore:
+    """Store of pickled objects in a directory, named by content hash.
+    """
+    def __init__(self, store_dir):
+        self.store_dir = utils.safe_makedir(store_dir)
+        self._lock = threading.Lock()
+
+    def put(self, obj):
+        """Store an object, returning a reference to it.
+        """
+        data = cPickle.dumps(obj, cPickle.HIGHEST_PROTOCOL)
+        key = hashlib.sha1(data).hexdigest()
+        out_file = _object_file(self.store_dir, key)
+        with self._lock:
+            if not os.path.exists(out_file):
+                tmp_file = "%s.%s.tmp" % (out_file, os.getpid())
+                with open(tmp_file, "wb") as out_handle:
+                    out_handle.write(data)
+                os.rename(tmp_file, out_file)
+        return {REF_KEY: key, "dir": self.store_dir}
+
+    def to_refs(self, items):
+        """Replace shared sections of sample dictionaries in task arguments with references.
+
+        Copies dictionaries along the path to replaced sections, leaving the
+        input items unchanged. Sections shared between items, like those of
+        regions split from a single sample, only get serialized once.
+        """
+        refs = {}
+        out = []
+        for args in items:
+            out.append([self._dict_to_refs(x, refs) if isinstance(x, dict) else x for x in args])
+        return out
+
+    def _dict_to_refs(self, data, refs):
+        data = dict(data)
+        for section in _SHARED_SECTIONS:
+            cur = data
+            for key in section[:-1]:
+                if not isinstance(cur.get(key), dict):
+                    cur = None
+                    break
+                cur[key] = dict(cur[key])
+                cur = cur[key]
+            if cur is not None and isinstance(cur.get(section[-1]), (dict, list)):
+                obj = cur[section[-1]]
+                if id(obj) not in refs:
+                    refs[id(obj)] = self.put(obj)
+                cur[section[-1]] = refs[id(obj)]
+        return data
+
+def local_store(work_dir):
+    """Provide a temporary store for a local run, in shared memory when available.
+    """
+    base_dir = "/dev/shm" if os.access("/dev/shm", os.W_OK) else os.path.join(work_dir, "tx")
+    return _temp_store(base_dir)
+
+def shared_store(work_dir):
+    """Provide a temporary store on the shared filesystem for distributed runs.
+    """
+    return _temp_store(os.path.join(work_dir, "checkpoints_parallel", "objects"))
+
+@contextlib.contextmanager
+def _temp_store(base_dir):
+    """Store objects in a new directory, removed when the parallel block finishes.
+
+    Tasks only resolve references while running, so stored objects are not
+    needed by later blocks or restarts.
+    """
+    store_dir = tempfile.mkdtemp(prefix="bcbio-objects-", dir=utils.safe_makedir(base_dir))
+    try:
+        yield FileStore(store_dir)
+    finally:
+        shutil.rmtree(store_dir, ignore_errors=True)
+
+def _object_file(store_dir, key):
+    return os.path.join(store_dir, "%s.pkl" % key)
+
+# Worker side cache of pickled objects by key, unpickled for each use so tasks
+# do not share mutable objects
+_worker_cache = {}
+
+def resolve(x):
+    """Replace references in task arguments with stored objects, in place.
+    """
+    if isinstance(x, dict):
+        for k, v in x.items():
+            if isinstance(v, dict) and REF_KEY in v:
+                x[k] = _get(v)
+            else:
+                resolve(v)
+    elif isinstance(x, list):
+        for i, v in enumerate(x):
+            if isinstance(v, dict) and REF_KEY in v:
+                x[i] = _get(v)
+            else:
+                resolve(v)
+    elif isinstance(x, tuple):
+        for v in x:
+            resolve(v)
+    return x
+
+def _get(ref):
+    key = ref[REF_KEY]
+    if key not in _worker_cache:
+        with open(_object_file(ref["dir"], key), "rb") as in_handle:
+            _worker_cache[key] = in_handle.read()
+    return cPickle.loads(_worker_cache[key])
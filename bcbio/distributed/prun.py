@@ -2,24 +2,29 @@
 """
 import contextlib
 import os
+import time
 
 from bcbio import utils
+from bcbio.broad import jvmserver
 from bcbio.log import logger
-from bcbio.provenance import system
-from bcbio.distributed import ipython, multi, resources
+from bcbio.provenance import diagnostics, system
+from bcbio.distributed import executor, ipython, ledger, multi, objectstore, resources
 
 @contextlib.contextmanager
 def start(parallel, items, config, dirs=None, name=None, multiplier=1, max_multicore=None):
     """Start a parallel cluster or machines to be used for running remote functions.
 
     Returns a function used to process, in parallel items with a given function.
+    The function is thread safe, allowing concurrent submission of independent work
+    with bcbio.distributed.dag.
 
     Allows sharing of a single cluster across multiple functions with
     identical resource requirements. Uses local execution for non-distributed
     clusters or completed jobs.
 
     A checkpoint directory keeps track of finished tasks, avoiding spinning up clusters
-    for sections that have been previous processed.
+    for sections that have been previous processed. Within unfinished sections, a
+    ledger of individual finished tasks skips re-running those tasks on restart.
 
     multiplier - Number of expected jobs per initial input item. Used to avoid underscheduling
       cores when an item is split during processing.
@@ -29,28 +34,48 @@ def start(parallel, items, config, dirs=None, name=None, multiplier=1, max_multi
     if name:
         checkpoint_dir = utils.safe_makedir(os.path.join(dirs["work"], "checkpoints_parallel"))
         checkpoint_file = os.path.join(checkpoint_dir, "%s.done" % name)
+        task_ledger = ledger.TaskLedger(os.path.join(checkpoint_dir, "tasks.db"), dirs["work"])
     else:
         checkpoint_file = None
+        task_ledger = None
+    work_dir = dirs["work"] if dirs else os.getcwd()
     sysinfo = system.get_info(dirs, parallel)
     items = [x for x in items if x is not None] if items else []
     parallel = resources.calculate(parallel, items, sysinfo, config, multiplier=multiplier,
                                    max_multicore=int(max_multicore or sysinfo.get("cores", 1)))
+    start_time = time.time()
     try:
         if checkpoint_file and os.path.exists(checkpoint_file):
             logger.info("run local -- checkpoint passed: %s" % name)
             parallel["cores_per_job"] = 1
             parallel["num_jobs"] = 1
-            yield multi.runner(parallel, config)
+            with _local_runner(parallel, config, task_ledger, work_dir) as run_parallel:
+                yield run_parallel
         elif parallel["type"] == "ipython":
-            with ipython.create(parallel, dirs, config) as view:
-                yield ipython.runner(view, parallel, dirs, config)
+            with ipython.create(parallel, dirs, config) as view, \
+                 objectstore.shared_store(work_dir) as store:
+                yield ipython.runner(view, parallel, dirs, config, task_ledger, store)
         else:
-            yield multi.runner(parallel, config)
+            with _local_runner(parallel, config, task_ledger, work_dir) as run_parallel:
+                yield run_parallel
     except:
         raise
     else:
-        for x in ["cores_per_job", "num_jobs", "mem"]:
+        diagnostics.end_parallel(name, parallel, start_time)
+        for x in ["cores_per_job", "num_jobs", "mem", "jvm_opts"]:
             parallel.pop(x, None)
         if checkpoint_file:
             with open(checkpoint_file, "w") as out_handle:
                 out_handle.write("done\n")
+
+@contextlib.contextmanager
+def _local_runner(parallel, config, task_ledger, work_dir):
+    """Run locally with the multiprocessing pool or a configured concurrent.futures executor.
+    """
+    with objectstore.local_store(work_dir) as store, jvmserver.local_server(config):
+        if parallel.get("executor") in executor.EXECUTORS:
+            runner = executor.futures_runner(parallel, config, task_ledger, store)
+        else:
+            runner = multi.pool_runner(parallel, config, task_ledger, store)
+        with runner as run_parallel:
+            yield run_parallel
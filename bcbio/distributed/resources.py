@@ -8,6 +8,7 @@ import math
 
 from bcbio.pipeline import config_utils
 from bcbio.log import logger
+from bcbio.provenance import diagnostics
 
 def _get_resource_programs(progs, algs):
     """Retrieve programs used in analysis based on algorithm configurations.
@@ -49,7 +50,7 @@ def _str_memory_to_gb(memory):
     val = float(memory[:-1])
     units = memory[-1]
     if units.lower() == "m":
-        val = val / 1000.0
+        val = val / 1024.0
     else:
         assert units.lower() == "g", "Unexpected memory units: %s" % memory
     return val
@@ -66,6 +67,46 @@ def _get_prog_memory(resources):
         out = _str_memory_to_gb(memory)
     return out
 
+# Minimum measured runs of a program before using them to estimate requirements
+_MIN_HISTORY = 3
+# Minimum run time, in seconds, of measured runs used to estimate core usage
+_MIN_HISTORY_WALL = 30.0
+# Safety margin applied to measured memory and core usage
+_HISTORY_MARGIN = 1.25
+
+def _adjust_from_history(prog, cores, memory, history):
+    """Adjust cores and memory per core for a program using measurements from previous runs.
+
+    Reduces cores when previous multicore runs did not keep them busy, and
+    returns memory per core from the highest measured usage plus a safety
+    margin. Java programs grow towards their -Xmx heap and other programs size
+    buffers from configured memory, so callers only use lower measured memory
+    along with a heap lowered by _adjust_jvm_opts.
+    """
+    runs = history.get(prog, [])
+    if len(runs) < _MIN_HISTORY:
+        return cores, memory
+    multicore = [x for x in runs if x.get("cores", 1) > 1 and x["wall"] >= _MIN_HISTORY_WALL]
+    if cores > 1 and len(multicore) >= _MIN_HISTORY:
+        used = sorted(x["cpu"] / x["wall"] for x in multicore)
+        cores = max(1, min(cores, int(math.ceil(used[len(used) // 2] * _HISTORY_MARGIN))))
+    # avoid zero memory estimates for tiny programs
+    memory = max(0.1, max(x["maxrss"] / max(x.get("cores", 1), 1) for x in runs) * _HISTORY_MARGIN)
+    return cores, memory
+
+def _adjust_jvm_opts(jvm_opts, memory):
+    """Lower Java heap options to memory per core estimated from previous runs.
+
+    Keeps the heap within the memory reserved for jobs. Never raises the heap,
+    since programs running within their current heap do not need more.
+    """
+    out = []
+    for opt in jvm_opts:
+        if opt.startswith(("-Xmx", "-Xms")) and _str_memory_to_gb(opt[4:]) > memory:
+            opt = "%s%dm" % (opt[:4], int(memory * 1024))
+        out.append(opt)
+    return out
+
 def _scale_cores_to_memory(cores, mem_per_core, sysinfo, system_memory):
     """Scale multicore usage to avoid excessive memory usage based on system information.
     """
@@ -90,6 +131,25 @@ def _scale_jobs_to_memory(jobs, mem_per_core, sysinfo):
     else:
         return jobs
 
+def _max_cores(sysinfo):
+    return max(int(x["cores"]) for x in sysinfo.get("classes", [sysinfo]))
+
+def _select_machine_class(sysinfo, cores, mem_per_core, system_memory):
+    """Pick the machine type to schedule jobs on in clusters with multiple machine types.
+
+    Uses the machine type with the least memory fitting a single job, keeping
+    larger memory machines available for jobs that require them. Falls back to
+    the largest memory machine when no machine types fit.
+    """
+    if not sysinfo.get("classes"):
+        return sysinfo
+    needed = cores * mem_per_core + system_memory
+    fits = [x for x in sysinfo["classes"] if int(x["cores"]) >= cores and float(x["memory"]) >= needed]
+    if fits:
+        return min(fits, key=lambda x: (float(x["memory"]), int(x["cores"])))
+    else:
+        return max(sysinfo["classes"], key=lambda x: (float(x["memory"]), int(x["cores"])))
+
 def calculate(parallel, items, sysinfo, config, multiplier=1,
               max_multicore=None):
     """Determine cores and workers to use for this stage based on used programs.
@@ -98,7 +158,14 @@ def calculate(parallel, items, sysinfo, config, multiplier=1,
     max_multicore specifies an optional limit on the maximum cores. Can use to
     force single core processing during specific tasks.
     sysinfo specifies cores and memory on processing nodes, allowing us to tailor
-    jobs for available resources.
+    jobs for available resources. For clusters with multiple machine types,
+    jobs get sized for the smallest machine type that fits them.
+
+    Measured usage of programs from previous commands, in the diagnostics log,
+    refines the cores and memory specified in the system configuration. Measured
+    memory only lowers the configured memory of Java programs, which get lowered
+    heap options in `jvm_opts`, applied to task configurations by
+    config_utils.add_cores_to_config. Other programs only get memory raised.
     """
     assert len(items) > 0, "Finding job resources but no items to process"
     all_cores = []
@@ -107,10 +174,20 @@ def calculate(parallel, items, sysinfo, config, multiplier=1,
     system_memory = 0.25
     algs = [config_utils.get_algorithm_config(x) for x in items]
     progs = _get_resource_programs(parallel.get("progs", []), algs)
+    history = diagnostics.read_history(config) if progs else {}
+    jvm_opts = {}
     for prog in progs:
         resources = config_utils.get_resources(prog, config)
         cores = resources.get("cores", 1)
         memory = _get_prog_memory(resources)
+        if prog in history:
+            cores, measured = _adjust_from_history(prog, cores, memory, history)
+            adjusted = _adjust_jvm_opts(resources.get("jvm_opts", []), measured)
+            if adjusted != resources.get("jvm_opts", []) and not resources.get("memory"):
+                jvm_opts[prog] = adjusted
+                memory = measured
+            else:
+                memory = max(memory or 0, measured)
         all_cores.append(cores)
         if memory:
             all_memory.append(memory)
@@ -127,11 +204,16 @@ def calculate(parallel, items, sysinfo, config, multiplier=1,
     if max_multicore:
         cores_per_job = min(cores_per_job, max_multicore)
     if "cores" in sysinfo:
-        cores_per_job = min(cores_per_job, int(sysinfo["cores"]))
+        cores_per_job = min(cores_per_job, _max_cores(sysinfo))
     memory_per_core = max(all_memory)
 
     cores_per_job, memory_per_core = _ensure_min_resources(progs, cores_per_job, memory_per_core,
                                                            min_memory=parallel.get("ensure_mem", {}))
+    if sysinfo.get("classes"):
+        sysinfo = _select_machine_class(sysinfo, cores_per_job, memory_per_core, system_memory)
+        cores_per_job = min(cores_per_job, int(sysinfo["cores"]))
+        logger.debug("Scheduling on machines with %s cores and %.1fg memory" %
+                     (sysinfo["cores"], float(sysinfo["memory"])))
 
     total = parallel["cores"]
     if total > cores_per_job:
@@ -154,4 +236,7 @@ def calculate(parallel, items, sysinfo, config, multiplier=1,
     parallel["cores_per_job"] = cores_per_job
     parallel["num_jobs"] = num_jobs
     parallel["mem"] = str(memory_per_job)
+    if jvm_opts:
+        logger.debug("Java options from measured memory usage: %s" % jvm_opts)
+        parallel["jvm_opts"] = jvm_opts
     return parallel
@@ -10,6 +10,10 @@ splitting specific code.
 """
 import copy
 import collections
+import sys
+import threading
+
+from bcbio import log
 
 def grouped_parallel_split_combine(args, split_fn, group_fn, parallel_fn,
                                    parallel_name, ungroup_name, combine_name,
@@ -31,16 +35,27 @@ def grouped_parallel_split_combine(args, split_fn, group_fn, parallel_fn,
     split_args, combine_map, finished_out, extras = _get_split_tasks(args, split_fn, file_key,
                                                                      split_outfile_i)
     grouped_args, grouped_info = group_fn(split_args)
-    split_output = parallel_fn(parallel_name, grouped_args)
-    ready_output, grouped_output = _check_group_status(split_output, grouped_info)
-    ungrouped_output = parallel_fn(ungroup_name, grouped_output)
-    final_output = ready_output + ungrouped_output
-    combine_args, final_args = _organize_output(final_output, combine_map,
-                                                file_key, combine_arg_keys)
-    parallel_fn(combine_name, combine_args)
+    combiner = _ReadyCombiner(parallel_fn, combine_name, combine_map, file_key, combine_arg_keys)
+    ungrouper = _BackgroundRuns(parallel_fn, callback=combiner.add)
+    to_ungroup = []
+    for x in parallel_fn(parallel_name, grouped_args, stream=True):
+        ready, grouped = _check_group_status([x], grouped_info)
+        for data in ready:
+            combiner.add(data)
+        to_ungroup.extend(grouped)
+        if len(to_ungroup) >= _UNGROUP_BATCH:
+            ungrouper.start(ungroup_name, to_ungroup)
+            to_ungroup = []
+    if to_ungroup:
+        ungrouper.start(ungroup_name, to_ungroup)
+    ungrouper.wait()
+    final_args = combiner.finish()
     out = _add_combine_extras(finished_out + final_args, extras)
     return out
 
+# Number of grouped items to collect before starting to split them back into samples
+_UNGROUP_BATCH = 50
+
 def _check_group_status(xs, grouped_info):
     """Identify grouped items that need ungrouping to continue.
     """
@@ -73,16 +88,122 @@ def parallel_split_combine(args, split_fn, parallel_fn,
     """
     split_args, combine_map, finished_out, extras = _get_split_tasks(args, split_fn, file_key,
                                                                      split_outfile_i)
-    split_output = parallel_fn(parallel_name, split_args)
     if combine_name:
-        combine_args, final_args = _organize_output(split_output, combine_map,
-                                                    file_key, combine_arg_keys)
-        parallel_fn(combine_name, combine_args)
+        combiner = _ReadyCombiner(parallel_fn, combine_name, combine_map, file_key, combine_arg_keys)
+        for data in parallel_fn(parallel_name, split_args, stream=True):
+            combiner.add(data)
+        final_args = combiner.finish()
     else:
+        split_output = parallel_fn(parallel_name, split_args)
         final_args = _add_combine_info(split_output, combine_map, file_key)
     out = _add_combine_extras(finished_out + final_args, extras)
     return out
 
+# ## Start combining outputs as soon as they are ready
+
+class _BackgroundRuns:
+    """Run parallel functions in background threads while continuing to submit work.
+
+    callback receives each output item as it finishes, otherwise outputs are
+    ignored. Errors from any run are re-raised on `wait`.
+    """
+    def __init__(self, parallel_fn, callback=None):
+        self._parallel_fn = parallel_fn
+        self._callback = callback
+        self._handlers = log.current_handlers()
+        self._threads = []
+        self._errors = []
+
+    def start(self, fn_name, items):
+        def _run():
+            try:
+                with log.thread_handlers(self._handlers):
+                    for data in self._parallel_fn(fn_name, items, stream=True):
+                        if self._callback:
+                            self._callback(data)
+            except:
+                self._errors.append(sys.exc_info())
+        t = threading.Thread(target=_run, name="bg-%s" % fn_name)
+        t.daemon = True
+        t.start()
+        self._threads.append(t)
+
+    def wait(self):
+        for t in self._threads:
+            # timeout keeps the wait interruptible with Ctrl-C
+            while t.is_alive():
+                t.join(5.0)
+        self._threads = []
+        if self._errors:
+            exc_type, exc_value, exc_tb = self._errors[0]
+            raise exc_type, exc_value, exc_tb
+
+class _ReadyCombiner:
+    """Combine split outputs as soon as all parts of an output file finish.
+
+    Avoids waiting on the slowest region of any sample before starting to
+    combine the others. Outputs with missing parts get combined on `finish`.
+    Parts get combined, and final arguments returned, in the order of the splits.
+    """
+    def __init__(self, parallel_fn, combine_name, combine_map, file_key, combine_arg_keys):
+        self._combine_name = combine_name
+        self._combine_map = combine_map
+        self._file_key = file_key
+        self._combine_arg_keys = combine_arg_keys
+        self._expected = collections.defaultdict(int)
+        for out_file in combine_map.values():
+            self._expected[out_file] += 1
+        self._part_index = dict((x, i) for i, x in enumerate(combine_map.keys()))
+        self._parts = collections.OrderedDict()
+        self._final = {}
+        self._extras = []
+        self._lock = threading.Lock()
+        self._runs = _BackgroundRuns(parallel_fn)
+
+    def add(self, data):
+        with self._lock:
+            cur_file = data.get(self._file_key)
+            if cur_file:
+                if cur_file not in self._combine_map:
+                    raise ValueError("Unexpected output from split parts to %s with %s: %s"
+                                     % (self._combine_name, self._file_key, cur_file))
+                cur_out = self._combine_map[cur_file]
+                if cur_out not in self._parts:
+                    self._parts[cur_out] = []
+                self._parts[cur_out].append(data)
+                if len(self._parts[cur_out]) == self._expected[cur_out]:
+                    self._combine(self._parts.pop(cur_out))
+            else:
+                self._extras.append([data])
+
+    def _combine(self, group):
+        # parts arrive as they finish; combine them in the order they were split
+        group = sorted(group, key=lambda x: self._part_index[x[self._file_key]])
+        combine_args, final_args = _organize_output(group, self._combine_map,
+                                                    self._file_key, self._combine_arg_keys)
+        self._final[combine_args[0][1]] = final_args
+        self._runs.start(self._combine_name, combine_args)
+
+    def finish(self):
+        """Combine any remaining outputs, wait for completion and return final arguments.
+        """
+        with self._lock:
+            for group in self._parts.values():
+                self._combine(group)
+            self._parts = collections.OrderedDict()
+        self._runs.wait()
+        final = [self._final[x] for x in _unique(self._combine_map.values()) if x in self._final]
+        return [x[0] for x in final] + [y for x in final for y in x[1:]] + self._extras
+
+def _unique(xs):
+    seen = set([])
+    out = []
+    for x in xs:
+        if x not in seen:
+            seen.add(x)
+            out.append(x)
+    return out
+
 # ##  Handle information for future combinations
 
 def _add_combine_info(output, combine_map, file_key):
@@ -209,6 +330,21 @@ def _organize_output(output, combine_map, file_key, combine_arg_keys):
                     for (k, v) in out_map.iteritems()]
     return combine_args, [[final_args[x]] for x in already_added] + extras
 
+def _copy_split_args(args):
+    """Copy arguments for a split part, sharing unchanged nested sections between parts.
+
+    Parallel runners serialize arguments for each task, so only sections updated
+    on the controlling process, like provenance tracking, need separate copies.
+    """
+    out = []
+    for x in args:
+        if isinstance(x, dict):
+            x = copy.copy(x)
+            if isinstance(x.get("provenance"), dict):
+                x["provenance"] = copy.copy(x["provenance"])
+        out.append(x)
+    return out
+
 def _get_split_tasks(args, split_fn, file_key, outfile_i=-1):
     """Split up input files and arguments, returning arguments for parallel processing.
 
@@ -216,14 +352,14 @@ def _get_split_tasks(args, split_fn, file_key, outfile_i=-1):
     the processing function. Defaults to the last item in the list.
     """
     split_args = []
-    combine_map = {}
+    combine_map = collections.OrderedDict()
     finished_order = []
     finished_map = {}
     extras = []
     for data in args:
         out_final, out_parts = split_fn(*data)
         for parts in out_parts:
-            split_args.append(copy.deepcopy(data) + list(parts))
+            split_args.append(_copy_split_args(data) + list(parts))
         for part_file in [x[outfile_i] for x in out_parts]:
             combine_map[part_file] = out_final
         if len(out_parts) == 0:
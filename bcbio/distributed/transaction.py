@@ -5,14 +5,33 @@ locations during processing and copied to the final location when finished.
 This ensures output files will be complete independent of method of
 interruption.
 """
+import errno
 import os
 import shutil
 import tempfile
+import threading
 
 import contextlib
 
 from bcbio import utils
 
+_state = threading.local()
+
+@contextlib.contextmanager
+def keep_existing():
+    """Keep existing outputs, instead of replacing them, when transactions finish.
+
+    For tasks that can run as multiple copies at once, like speculative re-runs
+    of straggling tasks, so a copy finishing later discards its outputs rather
+    than replacing ones downstream steps may already be reading.
+    """
+    prev = getattr(_state, "keep_existing", False)
+    _state.keep_existing = True
+    try:
+        yield
+    finally:
+        _state.keep_existing = prev
+
 @contextlib.contextmanager
 def file_transaction(*rollback_files):
     """Wrap file generation in a transaction, moving to output if finishes.
@@ -32,14 +51,34 @@ def file_transaction(*rollback_files):
     else: # worked -- move the temporary files to permanent location
         for safe, orig in zip(safe_names, orig_names):
             if os.path.exists(safe):
-                shutil.move(safe, orig)
+                _move_output(safe, orig)
                 for check_ext, check_idx in exts.iteritems():
                     if safe.endswith(check_ext):
                         safe_idx = safe + check_idx
                         if os.path.exists(safe_idx):
-                            shutil.move(safe_idx, orig + check_idx)
+                            _move_output(safe_idx, orig + check_idx)
         _remove_tmpdirs(safe_names)
 
+def _move_output(safe, orig):
+    """Move a finished output into place, leaving existing outputs when requested.
+
+    Files get hard linked into place, which fails if another copy of the task
+    already created the output, avoiding races between checking and moving.
+    """
+    if getattr(_state, "keep_existing", False):
+        if os.path.lexists(orig):
+            return
+        if os.path.isfile(safe):
+            try:
+                os.link(safe, orig)
+            except OSError, e:
+                if e.errno == errno.EEXIST:
+                    return
+            else:
+                os.remove(safe)
+                return
+    shutil.move(safe, orig)
+
 def _remove_tmpdirs(fnames):
     for x in fnames:
         xdir = os.path.dirname(os.path.abspath(x))
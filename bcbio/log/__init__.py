@@ -1,5 +1,6 @@
 """Utility functionality for logging.
 """
+import contextlib
 import multiprocessing
 import os
 import socket
@@ -10,7 +11,7 @@ import logbook
 import logbook.queues
 
 from bcbio import utils
-from bcbio.log import logbook_zmqpush
+from bcbio.log import diagnosticsdb, logbook_zmqpush
 
 LOG_NAME = "bcbio-nextgen"
 
@@ -22,6 +23,8 @@ def get_log_dir(config):
 logger = logbook.Logger(LOG_NAME)
 logger_cl = logbook.Logger(LOG_NAME + "-commands")
 logger_stdout = logbook.Logger(LOG_NAME + "-stdout")
+logger_diagnostics = logbook.Logger(LOG_NAME + "-diagnostics")
+logger_events = logbook.Logger(LOG_NAME + "-events")
 mpq = multiprocessing.Queue(-1)
 
 def _is_cl(record, _):
@@ -30,8 +33,15 @@ def _is_cl(record, _):
 def _is_stdout(record, _):
     return record.channel == LOG_NAME + "-stdout"
 
+def _is_diagnostics(record, _):
+    return record.channel == LOG_NAME + "-diagnostics"
+
+def _is_events(record, _):
+    return record.channel == LOG_NAME + "-events"
+
 def _not_cl(record, handler):
-    return not _is_cl(record, handler) and not _is_stdout(record, handler)
+    return (not _is_cl(record, handler) and not _is_stdout(record, handler)
+            and not _is_diagnostics(record, handler) and not _is_events(record, handler))
 
 class CloseableNestedSetup(logbook.NestedSetup):
     def close(self):
@@ -51,7 +61,12 @@ class IOSafeMultiProcessingSubscriber(logbook.queues.MultiProcessingSubscriber):
             else:
                 raise
 
-def _create_log_handler(config, add_hostname=False, direct_hostname=False):
+def _create_log_handler(config, add_hostname=False, direct_hostname=False, diagnostics_db=False):
+    """Create handlers for log files, standard streams and email.
+
+    Only the controlling process writes the diagnostics database, with
+    diagnostics_db, so worker processes never open it.
+    """
     logbook.set_datetime_format("local")
     handlers = [logbook.NullHandler()]
     format_str = "".join(["[{record.time:%Y-%m-%d %H:%M}] " if config.get("include_time", True) else "",
@@ -74,6 +89,16 @@ def _create_log_handler(config, add_hostname=False, direct_hostname=False):
         handlers.append(logbook.FileHandler(os.path.join(log_dir, "%s-commands.log" % LOG_NAME),
                                             format_string=format_str, level="DEBUG",
                                             filter=_is_cl))
+        handlers.append(logbook.FileHandler(os.path.join(log_dir, "%s-diagnostics.log" % LOG_NAME),
+                                            format_string="{record.message}", level="DEBUG",
+                                            filter=_is_diagnostics))
+        handlers.append(logbook.FileHandler(os.path.join(log_dir, "%s-events.log" % LOG_NAME),
+                                            format_string="{record.message}", level="DEBUG",
+                                            filter=_is_events))
+        if diagnostics_db:
+            handlers.append(diagnosticsdb.SQLiteDiagnosticsHandler(
+                os.path.join(log_dir, "%s-diagnostics.db" % LOG_NAME), level="DEBUG",
+                filter=_is_diagnostics))
     handlers.append(logbook.StreamHandler(sys.stdout, format_string="{record.message}",
                                           level="DEBUG", filter=_is_stdout))
 
@@ -111,10 +136,10 @@ def create_base_logger(config=None, parallel=None):
         mport = subscriber.socket.bind_to_random_port(uri)
         wport_uri = "%s:%s" % (uri, mport)
         parallel["log_queue"] = wport_uri
-        subscriber.dispatch_in_background(_create_log_handler(config, True))
+        subscriber.dispatch_in_background(_create_log_handler(config, True, diagnostics_db=True))
     elif cores > 1:
         subscriber = IOSafeMultiProcessingSubscriber(mpq)
-        subscriber.dispatch_in_background(_create_log_handler(config))
+        subscriber.dispatch_in_background(_create_log_handler(config, diagnostics_db=True))
     else:
         # Do not need to setup anything for local logging
         pass
@@ -136,6 +161,30 @@ def setup_local_logging(config=None, parallel=None):
     elif cores > 1:
         handler = logbook.queues.MultiProcessingHandler(mpq)
     else:
-        handler = _create_log_handler(config, direct_hostname=wrapper is not None)
+        # single core runs log directly from the controlling process; wrapped
+        # functions run as separate workers
+        handler = _create_log_handler(config, direct_hostname=wrapper is not None,
+                                      diagnostics_db=wrapper is None)
     handler.push_thread()
     return handler
+
+def current_handlers():
+    """Retrieve logging handlers active in the current thread.
+
+    Allows passing the local logging setup along to worker threads, which
+    otherwise only see application wide handlers.
+    """
+    return [h for h in logbook.Handler.stack_manager.iter_context_objects()
+            if h is not getattr(logbook, "default_handler", None)]
+
+@contextlib.contextmanager
+def thread_handlers(handlers):
+    """Activate handlers retrieved with `current_handlers` in a worker thread.
+    """
+    for handler in reversed(handlers):
+        handler.push_thread()
+    try:
+        yield None
+    finally:
+        for handler in handlers:
+            handler.pop_thread()
@@ -0,0 +1,100 @@
+"""Store details of external commands run during processing in a SQLite database.
+
+Commands report their details to the diagnostics logging channel from
+bcbio.provenance.diagnostics. The controlling process receives these from all
+workers and writes them to a single database, avoiding concurrent SQLite
+writes from multiple machines on a shared filesystem.
+"""
+import json
+import os
+import sqlite3
+import threading
+
+import logbook
+
+_COLUMNS = [("program", "TEXT"), ("descr", "TEXT"), ("cmd", "TEXT"), ("entity", "TEXT"),
+            ("sample", "TEXT"), ("region", "TEXT"), ("host", "TEXT"), ("cores", "INTEGER"),
+            ("start_time", "REAL"), ("end_time", "REAL"),
+            ("wall", "REAL"), ("cpu", "REAL"), ("maxrss", "REAL"),
+            ("inblock", "INTEGER"), ("oublock", "INTEGER"),
+            ("exitcode", "INTEGER"), ("succeeded", "INTEGER"),
+            ("rss_peak", "REAL"), ("rss_mean", "REAL"), ("cpu_peak", "REAL"), ("cpu_mean", "REAL"),
+            ("read_bytes", "INTEGER"), ("write_bytes", "INTEGER"), ("processes", "TEXT"),
+            ("output_file", "TEXT")]
+_PARALLEL_COLUMNS = [("name", "TEXT"), ("type", "TEXT"), ("cores", "INTEGER"),
+                     ("start_time", "REAL"), ("end_time", "REAL")]
+_ESCALATION_COLUMNS = [("program", "TEXT"), ("region", "TEXT"), ("memory_scale", "REAL"),
+                       ("cores_scale", "REAL"), ("time", "REAL")]
+# Tables for other events reported on the diagnostics channel
+_EVENT_TABLES = {"parallel": _PARALLEL_COLUMNS, "escalation": _ESCALATION_COLUMNS}
+
+class SQLiteDiagnosticsHandler(logbook.Handler):
+    """Write JSON command records from the diagnostics channel into a commands table.
+
+    Other events go into a table named by the event: finished parallel blocks
+    from bcbio.distributed.prun and memory escalations from retried commands.
+
+    The connection opens on first use in each process, since SQLite
+    connections inherited by forked worker processes are not usable.
+    """
+    def __init__(self, db_file, level=logbook.NOTSET, filter=None, bubble=False):
+        logbook.Handler.__init__(self, level, filter, bubble)
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _get_conn(self):
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.db_file, timeout=60, check_same_thread=False)
+            self._pid = os.getpid()
+            self._create_tables()
+        return self._conn
+
+    def _create_tables(self):
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS commands (id INTEGER PRIMARY KEY, %s)" %
+                               ", ".join("%s %s" % (k, t) for k, t in _COLUMNS))
+            # add columns missing from databases created by previous versions
+            existing = set(x[1] for x in self._conn.execute("PRAGMA table_info(commands)"))
+            for k, t in _COLUMNS:
+                if k not in existing:
+                    self._conn.execute("ALTER TABLE commands ADD COLUMN %s %s" % (k, t))
+            for table, columns in _EVENT_TABLES.items():
+                self._conn.execute("CREATE TABLE IF NOT EXISTS %s (id INTEGER PRIMARY KEY, %s)" %
+                                   (table, ", ".join("%s %s" % (k, t) for k, t in columns)))
+
+    def emit(self, record):
+        try:
+            rec = json.loads(record.message)
+        except ValueError:
+            return
+        if rec.get("event") in _EVENT_TABLES:
+            table, columns = rec["event"], _EVENT_TABLES[rec["event"]]
+        elif rec.get("event"):
+            return
+        else:
+            table, columns = "commands", _COLUMNS
+        vals = [json.dumps(v) if isinstance(v, (dict, list)) else v
+                for v in (rec.get(k) for k, _ in columns)]
+        with self._lock:
+            conn = self._get_conn()
+            with conn:
+                conn.execute("INSERT INTO %s (%s) VALUES (%s)" %
+                             (table, ", ".join(k for k, _ in columns),
+                              ", ".join("?" for _ in columns)),
+                             vals)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+            self._pid = None
+
+def connect(db_file):
+    """Open a diagnostics database for querying, providing rows as dictionaries.
+    """
+    conn = sqlite3.connect(db_file, timeout=60)
+    conn.row_factory = sqlite3.Row
+    return conn
@@ -1,11 +1,16 @@
 """Enable multiple processes to send logs to a central server through ZeroMQ.
 
 Thanks to Zachary Voase: https://github.com/zacharyvoase/logbook-zmqpush
-Slightly modified to support Logbook 0.4.1.
+Slightly modified to support Logbook 0.4.1, with batching and compression
+of records to reduce load on the receiving process with many senders.
 """
+import collections
 import errno
 import json
+import os
 import socket
+import threading
+import zlib
 
 import zmq
 import logbook.queues
@@ -32,31 +37,119 @@ class ZeroMQPushHandler(logbook.queues.ZeroMQHandler):
         >>> handler = ZeroMQPushHandler('tcp://127.0.0.1:5501', hostname=False)
         >>> with handler.applicationbound():
         ...     logbook.debug("No hostname info")
+
+    Records get sent in batches of up to `batch_size` records or `batch_bytes`
+    of serialized records, with a background thread sending partial batches
+    every `batch_interval` seconds. With `compress`, batches are zlib
+    compressed. A `batch_size` of 1 sends each record as it arrives.
+
+    ZeroMQ sockets and threads do not survive a fork, so processes forked from
+    one using the handler get their own socket and flushing thread on first use.
     """
 
     def __init__(self, addr=None, level=logbook.NOTSET, filter=None,
-                 bubble=False, context=None, hostname=True):
+                 bubble=False, context=None, hostname=True, batch_size=200,
+                 batch_bytes=256 * 1024, batch_interval=0.5, compress=True):
         logbook.Handler.__init__(self, level, filter, bubble)
 
         self.hostname = hostname
+        self._addr = addr
+        self._batch_size = batch_size
+        self._batch_bytes = batch_bytes
+        self._batch_interval = batch_interval
+        self._compress = compress
+        self._connect(context)
+
+    def _connect(self, context=None):
+        """Create the socket and batching state for the current process.
+        """
         if context is None:
             context = zmq.Context()
             self._context = context
         else:
             self._context = None
         self.socket = context.socket(zmq.PUSH)
-        if addr is not None:
-            self.socket.connect(addr)
+        if self._addr is not None:
+            self.socket.connect(self._addr)
+        self._pid = os.getpid()
+        self._batch = []
+        self._cur_bytes = 0
+        # sockets are not thread safe, so all sends happen with the lock held
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher = None
+
+    def _check_fork(self):
+        """Reconnect in a forked process, leaving the parent's socket and unsent records alone.
+        """
+        if self._pid != os.getpid():
+            with _fork_lock:
+                if self._pid != os.getpid():
+                    self._connect()
 
     def emit(self, record):
+        self._check_fork()
         if self.hostname:
             inject_hostname.process(record)
-        return super(ZeroMQPushHandler, self).emit(record)
-
-    def close(self):
+        if self._batch_size <= 1:
+            with self._lock:
+                return super(ZeroMQPushHandler, self).emit(record)
+        data = json.dumps(self.export_record(record))
+        with self._lock:
+            self._batch.append(data)
+            self._cur_bytes += len(data)
+            if len(self._batch) >= self._batch_size or self._cur_bytes >= self._batch_bytes:
+                self._send_batch()
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_periodically, name="zmq-log-flush")
+                self._flusher.daemon = True
+                self._flusher.start()
+
+    def flush(self):
+        """Send any records waiting in the current batch.
+        """
+        self._check_fork()
+        with self._lock:
+            self._send_batch()
+
+    def _flush_periodically(self):
+        while not self._stop.wait(self._batch_interval) and not self._stop.is_set():
+            self.flush()
+
+    def _send_batch(self):
+        if self._batch:
+            msg = "[%s]" % ",".join(self._batch)
+            self.socket.send(_COMPRESSED + zlib.compress(msg, 1) if self._compress else msg)
+            self._batch = []
+            self._cur_bytes = 0
+
+    def close(self, linger=None):
+        self._check_fork()
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+        # allow time to deliver final records, like errors from failing tasks
+        self.socket.close(linger=_CLOSE_LINGER if linger is None else linger)
         if self._context:
             self._context.destroy(linger=0)
-        self.socket.close(linger=0)
+
+# Serializes reconnection when multiple threads first log after a fork
+_fork_lock = threading.Lock()
+# Marker for compressed batches of records, distinct from the start of JSON
+_COMPRESSED = "Z"
+# Milliseconds to wait for delivery of unsent records on close
+_CLOSE_LINGER = 2000
+
+def unpack_records(msg):
+    """Retrieve log records from a message with a single record or batch of records.
+    """
+    if msg[:1] == _COMPRESSED:
+        msg = zlib.decompress(msg[1:])
+    data = json.loads(msg)
+    if not isinstance(data, list):
+        data = [data]
+    return [LogRecord.from_dict(x) for x in data]
 
 class ZeroMQPullSubscriber(logbook.queues.ZeroMQSubscriber):
 
@@ -71,6 +164,9 @@ class ZeroMQPullSubscriber(logbook.queues.ZeroMQSubscriber):
 
         >>> subscriber = ZeroMQPullSubscriber('tcp://*:5501')
         >>> log_record = subscriber.recv()
+
+    Handles batched messages from :class:`ZeroMQPushHandler`, returning
+    records one at a time.
     """
 
     def __init__(self, addr=None, context=None):
@@ -79,10 +175,15 @@ class ZeroMQPullSubscriber(logbook.queues.ZeroMQSubscriber):
         self.socket = self.context.socket(zmq.PULL)
         if addr is not None:
             self.socket.bind(addr)
+        self._pending = collections.deque()
 
     def recv(self, timeout=None):
         """Overwrite standard recv for timeout calls to catch interrupt errors.
+
+        Returns records remaining from previously received batches first.
         """
+        if self._pending:
+            return self._pending.popleft()
         if timeout:
             try:
                 testsock = self._zmq.select([self.socket], [], [], timeout)[0]
@@ -94,9 +195,10 @@ class ZeroMQPullSubscriber(logbook.queues.ZeroMQSubscriber):
             if not testsock:
                 return
             rv = self.socket.recv(self._zmq.NOBLOCK)
-            return LogRecord.from_dict(json.loads(rv))
         else:
-            return super(ZeroMQPullSubscriber, self).recv(timeout)
+            rv = self.socket.recv()
+        self._pending.extend(unpack_records(rv))
+        return self._pending.popleft()
 
 @logbook.Processor
 def inject_hostname(log_record):
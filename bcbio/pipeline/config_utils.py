@@ -179,15 +179,25 @@ def get_program(name, config, ptype="cmd", default=None):
     else:
         raise ValueError("Don't understand program type: %s" % ptype)
 
+# Programs found on the PATH, avoiding filesystem checks of each PATH directory
+# for every lookup. Keyed by program and PATH.
+_program_cache = {}
+
 def _get_check_program_cmd(fn):
 
     def wrap(name, config, default):
         program = expand_path(fn(name, config, default))
+        key = (program, os.environ.get("PATH"))
+        if key in _program_cache:
+            return _program_cache[key]
         is_ok = lambda f: os.path.isfile(f) and os.access(f, os.X_OK)
-        if is_ok(program): return program
+        if is_ok(program):
+            _program_cache[key] = program
+            return program
 
         for adir in os.environ['PATH'].split(":"):
             if is_ok(os.path.join(adir, program)):
+                _program_cache[key] = os.path.join(adir, program)
                 return os.path.join(adir, program)
         else:
             raise CmdNotFound(" ".join(map(repr, (fn.func_name, name, config, default))))
@@ -220,10 +230,27 @@ def _get_program_dir(name, config):
     else:
         raise ValueError("Could not find directory in config for %s" % name)
 
+# Jars found in directories, by directory and name, with the directory modification time
+_jar_cache = {}
+
 def get_jar(base_name, dname):
     """Retrieve a jar in the provided directory
+
+    Caches directory listings until the directory changes, avoiding repeated
+    listings on shared filesystems.
     """
-    jars = glob.glob(os.path.join(expand_path(dname), "%s*.jar" % base_name))
+    dname = expand_path(dname)
+    try:
+        mtime = os.path.getmtime(dname)
+    except OSError:
+        mtime = None
+    key = (base_name, dname)
+    if mtime is not None and key in _jar_cache and _jar_cache[key][0] == mtime:
+        jars = _jar_cache[key][1]
+    else:
+        jars = glob.glob(os.path.join(dname, "%s*.jar" % base_name))
+        if mtime is not None:
+            _jar_cache[key] = (mtime, jars)
 
     if len(jars) == 1:
         return jars[0]
@@ -239,10 +266,7 @@ def get_jar(base_name, dname):
 def _dictdissoc(orig, k):
     """Imitates immutability: create a new dictionary with the key dropped.
     """
-    v = orig.pop(k, None)
-    new = copy.deepcopy(orig)
-    orig[k] = v
-    return new
+    return copy.deepcopy(dict((x, v) for x, v in orig.items() if x != k))
 
 def is_std_config_arg(x):
     return isinstance(x, dict) and "algorithm" in x and "resources" in x and not "files" in x
@@ -264,11 +288,18 @@ def get_algorithm_config(xs):
 def add_cores_to_config(args, cores_per_job, parallel=None):
     """Add information about available cores for a job to configuration.
     Ugly hack to update core information in a configuration dictionary.
+
+    parallel provides job resources from bcbio.distributed.resources.calculate,
+    including Java options adjusted from measured memory usage.
     """
     def _update_cores(config):
         config["algorithm"]["num_cores"] = int(cores_per_job)
         if parallel:
             config["parallel"] = _dictdissoc(parallel, "view")
+            if parallel.get("jvm_opts"):
+                resources = config.setdefault("resources", {})
+                for prog, jvm_opts in parallel["jvm_opts"].items():
+                    resources[prog] = dict(resources.get(prog, {}), jvm_opts=jvm_opts)
         return config
     return _update_config(args, _update_cores)
 
@@ -283,17 +314,29 @@ def _update_config(args, update_fn):
     if new_i is None:
         raise ValueError("Could not find configuration in args: %s" % args)
 
-    new_arg = copy.deepcopy(args[new_i])
+    new_arg = copy.copy(args[new_i])
     if is_nested_config_arg(new_arg):
-        new_arg["config"] = update_fn(new_arg["config"])
+        new_arg["config"] = update_fn(_copy_config(new_arg["config"]))
     elif is_std_config_arg(new_arg):
-        new_arg = update_fn(new_arg)
+        new_arg = update_fn(_copy_config(new_arg))
     else:
         raise ValueError("Unexpected configuration dictionary: %s" % new_arg)
     args = list(args)[:]
     args[new_i] = new_arg
     return args
 
+def _copy_config(config):
+    """Copy a configuration for updating, avoiding deep copies of large unchanged sections.
+
+    Copies the algorithm and resources sections, and resources of each program,
+    which get updated for jobs.
+    """
+    config = copy.copy(config)
+    config["algorithm"] = copy.copy(config["algorithm"])
+    if isinstance(config.get("resources"), dict):
+        config["resources"] = dict((k, copy.copy(v)) for k, v in config["resources"].items())
+    return config
+
 def adjust_memory(val, magnitude, direction="increase"):
     """Adjust memory based on number of cores utilized.
     """
@@ -0,0 +1,174 @@
+"""In memory interval algebra on genomic regions using sorted numpy arrays.
+
+Regions for each chromosome are sorted, non-overlapping start and end arrays,
+with union, intersection, subtraction and merging done by vectorized sweeps
+over start and end positions. This avoids writing temporary BED files and
+running bedtools for each step when combining regions across many samples.
+Coordinates are 0-based and half-open, as in BED files.
+"""
+import collections
+
+import numpy
+
+class Region(collections.namedtuple("Region", ["chrom", "start", "end"])):
+    """A single genomic region, with `stop` as an alias for end like pybedtools.
+    """
+    __slots__ = ()
+
+    @property
+    def stop(self):
+        return self.end
+
+class Intervals:
+    """Sets of genomic regions stored as sorted start and end arrays by chromosome.
+
+    Chromosomes retain the order they are first seen in, so sets built from a
+    reference keep reference ordering through operations.
+    """
+    def __init__(self, by_chrom=None):
+        self._by_chrom = collections.OrderedDict()
+        for chrom, (starts, ends) in (by_chrom or {}).items():
+            starts, ends = _normalize(starts, ends)
+            if len(starts) > 0:
+                self._by_chrom[chrom] = (starts, ends)
+
+    @classmethod
+    def from_tuples(cls, regions):
+        """Create from an iterable of (chrom, start, end) tuples or Region-like objects.
+        """
+        by_chrom = collections.OrderedDict()
+        for r in regions:
+            chrom, start, end = (r.chrom, r.start, r.end) if hasattr(r, "chrom") else r[:3]
+            by_chrom.setdefault(chrom, ([], []))
+            by_chrom[chrom][0].append(int(start))
+            by_chrom[chrom][1].append(int(end))
+        return cls(by_chrom)
+
+    @classmethod
+    def from_bed(cls, in_file, names=None):
+        """Read from a BED file, optionally only including regions with names in the 4th column.
+        """
+        def _regions():
+            with open(in_file) as in_handle:
+                for line in in_handle:
+                    if line.startswith(("#", "track", "browser")):
+                        continue
+                    parts = line.rstrip("\r\n").split("\t")
+                    if len(parts) >= 3 and (names is None or (len(parts) > 3 and parts[3] in names)):
+                        yield parts[0], parts[1], parts[2]
+        return cls.from_tuples(_regions())
+
+    def chroms(self):
+        return self._by_chrom.keys()
+
+    def arrays(self, chrom):
+        """Retrieve sorted start and end arrays for a chromosome.
+        """
+        empty = numpy.zeros(0, dtype=numpy.int64)
+        return self._by_chrom.get(chrom, (empty, empty))
+
+    def __len__(self):
+        return sum(len(starts) for starts, _ in self._by_chrom.values())
+
+    def __iter__(self):
+        for chrom, (starts, ends) in self._by_chrom.items():
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                yield Region(chrom, start, end)
+
+    def total_size(self):
+        """Total bases covered by all regions.
+        """
+        return int(sum((ends - starts).sum() for starts, ends in self._by_chrom.values()))
+
+    def union(self, *others):
+        return union([self] + list(others))
+
+    def intersect(self, *others):
+        return intersect([self] + list(others))
+
+    def subtract(self, other):
+        """Remove bases covered by other regions.
+        """
+        out = collections.OrderedDict()
+        for chrom in self.chroms():
+            if chrom in other._by_chrom:
+                # coverage of 1 only occurs within these regions and outside other regions
+                out[chrom] = _sweep([self.arrays(chrom), other.arrays(chrom)], [1, 2],
+                                    lambda x: x == 1)
+            else:
+                out[chrom] = self.arrays(chrom)
+        return Intervals(out)
+
+    def merge(self, d=0):
+        """Merge regions separated by d or fewer bases.
+        """
+        return Intervals(collections.OrderedDict((c, _normalize(s, e, d))
+                                                 for c, (s, e) in self._by_chrom.items()))
+
+    def filter(self, fn):
+        """Retain regions passing a function taking a Region.
+        """
+        return Intervals.from_tuples(r for r in self if fn(r))
+
+    def saveas(self, out_file):
+        """Write regions to a BED file.
+        """
+        with open(out_file, "w") as out_handle:
+            for r in self:
+                out_handle.write("%s\t%s\t%s\n" % r)
+        return out_file
+
+def union(interval_sets):
+    """Combine regions from multiple sets, merging overlapping regions.
+    """
+    by_chrom = collections.OrderedDict()
+    for intervals in interval_sets:
+        for chrom in intervals.chroms():
+            by_chrom.setdefault(chrom, []).append(intervals.arrays(chrom))
+    return Intervals(collections.OrderedDict((c, (numpy.concatenate([s for s, _ in xs]),
+                                                  numpy.concatenate([e for _, e in xs])))
+                                             for c, xs in by_chrom.items()))
+
+def intersect(interval_sets):
+    """Retrieve bases covered by all sets of regions, in a single sweep for each chromosome.
+    """
+    interval_sets = list(interval_sets)
+    if len(interval_sets) == 0:
+        return Intervals()
+    out = collections.OrderedDict()
+    for chrom in interval_sets[0].chroms():
+        if all(chrom in x._by_chrom for x in interval_sets):
+            out[chrom] = _sweep([x.arrays(chrom) for x in interval_sets], [1] * len(interval_sets),
+                                lambda x: x == len(interval_sets))
+    return Intervals(out)
+
+def _sweep(arrays, weights, keep_fn):
+    """Find positions where weighted coverage from sets of non-overlapping regions passes keep_fn.
+
+    Each start adds and each end removes the weight of its set; the coverage
+    between consecutive positions is the cumulative sum of these events.
+    """
+    pos = numpy.concatenate([x for starts, ends in arrays for x in (starts, ends)])
+    delta = numpy.concatenate([numpy.repeat(sign * w, len(starts))
+                               for (starts, ends), w in zip(arrays, weights) for sign in (1, -1)])
+    order = numpy.argsort(pos, kind="mergesort")
+    pos = pos[order]
+    coverage = numpy.cumsum(delta[order])
+    keep = keep_fn(coverage[:-1]) & (pos[1:] > pos[:-1])
+    return pos[:-1][keep], pos[1:][keep]
+
+def _normalize(starts, ends, d=0):
+    """Sort regions and merge those overlapping or separated by d or fewer bases.
+    """
+    starts = numpy.asarray(starts, dtype=numpy.int64)
+    ends = numpy.asarray(ends, dtype=numpy.int64)
+    nonempty = ends > starts
+    starts, ends = starts[nonempty], ends[nonempty]
+    if len(starts) == 0:
+        return starts, ends
+    order = numpy.argsort(starts, kind="mergesort")
+    starts, ends = starts[order], ends[order]
+    max_ends = numpy.maximum.accumulate(ends)
+    block_starts = numpy.flatnonzero(numpy.concatenate([[True], starts[1:] > max_ends[:-1] + d]))
+    block_ends = numpy.concatenate([block_starts[1:] - 1, [len(starts) - 1]])
+    return starts[block_starts], max_ends[block_ends]
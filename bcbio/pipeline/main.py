@@ -13,13 +13,13 @@ import tempfile
 
 from bcbio import install, log, structural, utils, upload
 from bcbio.bam import callable
-from bcbio.distributed import clargs, prun, runfn
+from bcbio.distributed import clargs, dag, prun, runfn
 from bcbio.log import logger
 from bcbio.ngsalign import alignprep
 from bcbio.pipeline import (disambiguate, region, run_info, qcsummary,
                             version, rnaseq)
 from bcbio.pipeline.config_utils import load_system_config
-from bcbio.provenance import programs, system, versioncheck
+from bcbio.provenance import events, programs, system, timing, versioncheck
 from bcbio.server import main as server_main
 from bcbio.solexa.flowcell import get_fastq_dir
 from bcbio.variation.genotype import combine_multiple_callers
@@ -127,7 +127,8 @@ def parse_cl_args(in_args):
     sub_cmds = {"upgrade": install.add_subparser,
                 "server": server_main.add_subparser,
                 "runfn": runfn.add_subparser,
-                "version": programs.add_subparser}
+                "version": programs.add_subparser,
+                "timing": timing.add_subparser}
     parser = argparse.ArgumentParser(
         description="Best-practice pipelines for fully automated high throughput sequencing analysis.")
     sub_cmd = None
@@ -161,6 +162,15 @@ def parse_cl_args(in_args):
                             help=("Number of retries of failed tasks during distributed processing. "
                                   "Default 0 (no retries)"),
                             default=0, type=int)
+        parser.add_argument("--speculative",
+                            help=("Re-run straggling tasks on another engine once most tasks in a "
+                                  "distributed processing step finish, using the first to complete."),
+                            action="store_true", default=False)
+        parser.add_argument("--executor",
+                            help=("Local executor for running tasks, instead of the default multiprocessing "
+                                  "pool. threads avoids process overhead for steps waiting on external "
+                                  "programs. Requires concurrent.futures."),
+                            choices=["processes", "threads"])
         parser.add_argument("-p", "--tag", help="Tag name to label jobs on the cluster",
                             default="")
         parser.add_argument("-w", "--workflow", help="Run a workflow with the given commandline arguments")
@@ -298,54 +308,57 @@ class Variant2Pipeline(AbstractPipeline):
                               (["reference", "fasta"], ["reference", "aligner"], ["files"])),
                         samples, config, dirs, "multicore",
                         multiplier=alignprep.parallel_multiplier(samples)) as run_parallel:
-            logger.info("Timing: alignment")
-            samples = run_parallel("prep_align_inputs", samples)
-            samples = disambiguate.split(samples)
-            samples = run_parallel("process_alignment", samples)
-            samples = alignprep.merge_split_alignments(samples, run_parallel)
-            samples = disambiguate.resolve(samples, run_parallel)
-            samples = run_parallel("postprocess_alignment", samples)
+            events.stage("alignment")
+            # samples progress independently through alignment; regions need all samples
+            samples = dag.run_sample_chains(samples,
+                                            ["prep_align_inputs", _disambiguate_split,
+                                             "process_alignment", alignprep.merge_split_alignments,
+                                             disambiguate.resolve, "postprocess_alignment"],
+                                            run_parallel)
             regions = callable.combine_sample_regions(samples)
             samples = region.add_region_info(samples, regions)
             samples = region.clean_sample_data(samples)
-            logger.info("Timing: coverage")
+            events.stage("coverage")
             samples = coverage.summarize_samples(samples, run_parallel)
 
         ## Variant calling on sub-regions of the input file (full cluster)
         with prun.start(_wres(parallel, ["gatk", "picard", "variantcaller"]),
                         samples, config, dirs, "full",
                         multiplier=len(regions["analysis"]), max_multicore=1) as run_parallel:
-            logger.info("Timing: alignment post-processing")
+            events.stage("alignment post-processing")
             samples = region.parallel_prep_region(samples, regions, run_parallel)
-            logger.info("Timing: variant calling")
+            events.stage("variant calling")
             samples = region.parallel_variantcall_region(samples, run_parallel)
 
         ## Finalize variants (per-sample cluster)
         with prun.start(_wres(parallel, ["gatk", "gatk-vqsr", "snpeff", "bcbio_variation"]),
                         samples, config, dirs, "persample") as run_parallel:
-            logger.info("Timing: variant post-processing")
+            events.stage("variant post-processing")
             samples = run_parallel("postprocess_variants", samples)
-            logger.info("Timing: validation")
+            events.stage("validation")
             samples = run_parallel("compare_to_rm", samples)
             samples = combine_multiple_callers(samples)
         ## Finalizing BAMs and population databases, handle multicore computation
         with prun.start(_wres(parallel, ["gemini", "samtools", "fastqc", "bamtools", "bcbio_variation",
                                          "bcbio-variation-recall"]),
                         samples, config, dirs, "multicore2") as run_parallel:
-            logger.info("Timing: prepped BAM merging")
+            events.stage("prepped BAM merging")
             samples = region.delayed_bamprep_merge(samples, run_parallel)
-            logger.info("Timing: ensemble calling")
+            events.stage("ensemble calling")
             samples = ensemble.combine_calls_parallel(samples, run_parallel)
             samples = validate.summarize_grading(samples)
-            logger.info("Timing: structural variation")
+            events.stage("structural variation")
             samples = structural.run(samples, run_parallel)
-            logger.info("Timing: population database")
+            events.stage("population database")
             samples = population.prep_db_parallel(samples, run_parallel)
-            logger.info("Timing: quality control")
+            events.stage("quality control")
             samples = qcsummary.generate_parallel(samples, run_parallel)
-        logger.info("Timing: finished")
+        events.stage("finished")
         return samples
 
+def _disambiguate_split(samples, run_parallel):
+    return disambiguate.split(samples)
+
 class SNPCallingPipeline(Variant2Pipeline):
     """Back compatible: old name for variant analysis.
     """
@@ -365,14 +378,14 @@ class StandardPipeline(AbstractPipeline):
         ## Alignment and preparation requiring the entire input file (multicore cluster)
         with prun.start(_wres(parallel, ["aligner"]),
                         lane_items, config, dirs, "multicore") as run_parallel:
-            logger.info("Timing: alignment")
+            events.stage("alignment")
             samples = run_parallel("process_alignment", lane_items)
         ## Finalize (per-sample cluster)
         with prun.start(_wres(parallel, ["fastqc", "bamtools"]),
                         samples, config, dirs, "persample") as run_parallel:
-            logger.info("Timing: quality control")
+            events.stage("quality control")
             samples = qcsummary.generate_parallel(samples, run_parallel)
-        logger.info("Timing: finished")
+        events.stage("finished")
         return samples
 
 class MinimalPipeline(StandardPipeline):
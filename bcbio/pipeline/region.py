@@ -8,16 +8,30 @@ import os
 from bcbio.distributed.split import (parallel_split_combine,
                                      grouped_parallel_split_combine, group_combine_parts)
 from bcbio import utils
+from bcbio.bam import callable
 from bcbio.variation import genotype, multi
 
 # ## data preparation
 
 def add_region_info(samples, regions):
     """Add reference to BED file of callable regions to each sample.
+
+    Also records the per-sample index of reads in analysis regions, kept in the
+    algorithm configuration since sample `regions` are removed before calling.
+    When analysis regions get batched, callable regions are the separate regions
+    within batches, which variant calling uses to skip the gaps between them.
     """
     out = []
     for data in samples:
-        data["config"]["algorithm"]["callable_regions"] = regions["analysis_bed"]
+        data["config"]["algorithm"]["callable_regions"] = regions.get("callable_bed",
+                                                                      regions["analysis_bed"])
+        if "callable_bed" in regions:
+            data["config"]["algorithm"]["batch_callable_regions"] = True
+        if "callable" in data.get("regions", {}):
+            data["config"] = dict(data["config"])
+            data["config"]["algorithm"] = dict(data["config"]["algorithm"])
+            data["config"]["algorithm"]["region_coverage"] = \
+                callable.region_coverage_file(data["regions"]["callable"])
         out.append(data)
     return out
 
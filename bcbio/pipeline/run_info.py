@@ -141,7 +141,7 @@ ALGORITHM_KEYS = set(["platform", "aligner", "bam_clean", "bam_sort",
                       "realign", "phasing", "validate",
                       "validate_regions", "validate_genome_build",
                       "clinical_reporting", "nomap_split_size",
-                      "nomap_split_targets", "ensemble", "background",
+                      "nomap_split_targets", "callable_method", "ensemble", "background",
                       "disambiguate", "strandedness", "fusion_mode", "min_read_length"])
 
 def _check_algorithm_keys(item):
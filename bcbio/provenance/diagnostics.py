@@ -6,16 +6,170 @@ The goal is to allow traceability and reproducibility of pipelines.
 
 https://bitbucket.org/caseywdunn/biolite
 """
+import collections
+import json
+import os
+import socket
+import threading
+import time
 
-def start_cmd(cmd, descr, entity):
+from bcbio.log import logger_diagnostics, get_log_dir, LOG_NAME
+
+def start_cmd(descr, data, cmd):
     """Retain details about starting a command, returning a command identifier.
     """
-    pass
+    return {"descr": descr, "program": cmd_program(cmd), "start_time": time.time(),
+            "cmd": " ".join(str(x) for x in cmd) if not isinstance(cmd, basestring) else cmd,
+            "entity": data.get("provenance", {}).get("entity") if isinstance(data, dict) else None,
+            "sample": data_sample(data), "region": data_region(data),
+            "host": socket.gethostname(), "cores": data_cores(data)}
 
-def end_cmd(cmd_id, succeeded=True):
+def end_cmd(cmd_id, succeeded=True, usage=None):
     """Mark a command as finished with success or failure.
+
+    usage contains measured resources for the command: wall time and CPU time in
+    seconds, peak memory in Gb, block input and output operations and the exit
+    code. These get logged to the diagnostics channel, which records them in the
+    diagnostics database and log, providing a history of resource usage for
+    estimating future requirements.
+    """
+    if not cmd_id:
+        return
+    out = dict(cmd_id)
+    out["end_time"] = time.time()
+    out["wall"] = out["end_time"] - out["start_time"]
+    out["succeeded"] = succeeded
+    if usage:
+        out.update(usage)
+    logger_diagnostics.info(json.dumps(out))
+
+def end_parallel(name, parallel, start_time):
+    """Record a finished block of parallel processing with the cores allocated to it.
+
+    Provides the available core hours for each block, for comparison against
+    CPU time used by the commands run within it.
+    """
+    logger_diagnostics.info(json.dumps({"event": "parallel", "name": name, "type": parallel.get("type"),
+                                        "cores": parallel.get("num_jobs", 1) * parallel.get("cores_per_job", 1),
+                                        "start_time": start_time, "end_time": time.time()}))
+
+def data_sample(data):
+    """Name of the sample being processed, if any.
+    """
+    if isinstance(data, dict):
+        if "name" in data:
+            return data["name"][-1]
+        return data.get("description")
+
+def data_region(data):
+    """Region of a sample processed in parallel by region, as chrom:start-end.
+    """
+    if isinstance(data, dict) and data.get("region"):
+        return region_str(data["region"])
+
+def region_str(region):
+    if region:
+        if isinstance(region, (list, tuple)) and len(region) == 3:
+            return "%s:%s-%s" % tuple(region)
+        return str(region)
+
+def data_cores(data):
+    """Cores used by each process for a sample, from the algorithm configuration.
+    """
+    try:
+        return int(data["config"]["algorithm"].get("num_cores", 1))
+    except (KeyError, TypeError, AttributeError):
+        return 1
+
+def cmd_program(cmd):
+    """Identify the program for a command line, matching resource names in bcbio_system.yaml.
+    """
+    if isinstance(cmd, basestring):
+        parts = cmd.replace("set -o pipefail;", "").split()
+    else:
+        parts = [str(x) for x in cmd]
+    if not parts:
+        return None
+    prog = os.path.basename(parts[0])
+    if prog == "java" and "-jar" in parts[:-1]:
+        jar = parts[parts.index("-jar") + 1]
+        jar_name = os.path.basename(jar).lower()
+        if jar_name.startswith("genomeanalysistk"):
+            return "gatk"
+        elif jar_name.startswith("mutect"):
+            return "mutect"
+        elif "picard" in jar.lower():
+            return "picard"
+        else:
+            return os.path.splitext(jar_name)[0]
+    return prog
+
+# Resource usage history from previous commands
+
+_history_cache = {}
+_history_lock = threading.Lock()
+# Number of recent runs of a program used to estimate requirements
+_HISTORY_SIZE = 200
+
+def get_history_file(config):
+    return os.path.join(get_log_dir(config), "%s-diagnostics.log" % LOG_NAME)
+
+def read_history(config):
+    """Retrieve measured resource usage of successful commands, by program.
+
+    Reads incrementally from the diagnostics log, caching previously parsed
+    records, so repeated calls during a run only process newly finished commands.
+    Returns a dictionary of program names to lists of usage dictionaries.
+    """
+    history, _ = _read_history_file(get_history_file(config))
+    return dict((k, list(v)) for k, v in history.items())
+
+def read_escalations(config):
+    """Retrieve memory and core adjustments needed by previous runs of commands.
+
+    Returns a dictionary of (program, region) to the largest memory scaling and
+    smallest core scaling that allowed the command to finish.
+    """
+    _, escalations = _read_history_file(get_history_file(config))
+    return dict(escalations)
+
+def _read_history_file(history_file):
+    if not os.path.exists(history_file):
+        return {}, {}
+    with _history_lock:
+        offset, history, escalations = _history_cache.get(history_file, (0, {}, {}))
+        if os.path.getsize(history_file) < offset:
+            offset, history, escalations = 0, {}, {}
+        with open(history_file) as in_handle:
+            in_handle.seek(offset)
+            for line in in_handle:
+                if not line.endswith("\n"):
+                    break
+                offset += len(line)
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                if rec.get("event") == "escalation":
+                    key = (rec["program"], rec.get("region"))
+                    memory, cores = escalations.get(key, (1.0, 1.0))
+                    escalations[key] = (max(memory, rec["memory_scale"]), min(cores, rec["cores_scale"]))
+                elif rec.get("succeeded") and rec.get("program") and rec.get("maxrss") is not None:
+                    if rec["program"] not in history:
+                        history[rec["program"]] = collections.deque(maxlen=_HISTORY_SIZE)
+                    history[rec["program"]].append(rec)
+        _history_cache[history_file] = (offset, history, escalations)
+        return history, escalations
+
+def record_escalation(program, region, memory_scale, cores_scale):
+    """Record adjustments to memory and cores needed to run a program on a region.
+
+    Scales are relative to the original command, allowing later runs to start
+    with the adjusted resources.
     """
-    pass
+    logger_diagnostics.info(json.dumps({"event": "escalation", "program": program,
+                                        "region": region, "memory_scale": memory_scale,
+                                        "cores_scale": cores_scale, "time": time.time()}))
 
 def track_parallel(items, sub_type):
     """Create entity identifiers to trace the given items in sub-commands.
@@ -2,13 +2,17 @@
 """
 import collections
 import contextlib
+import errno
 import os
+import random
+import re
 import subprocess
+import sys
 import time
 
 from bcbio import utils
 from bcbio.log import logger, logger_cl, logger_stdout
-from bcbio.provenance import diagnostics
+from bcbio.provenance import diagnostics, drain, events, sampler
 
 def run(cmd, descr, data=None, checks=None, region=None, log_error=True,
         log_stdout=False):
@@ -20,41 +24,143 @@ def run(cmd, descr, data=None, checks=None, region=None, log_error=True,
     cmd_id = diagnostics.start_cmd(descr, data, cmd)
     try:
         logger_cl.debug(" ".join(cmd) if not isinstance(cmd, basestring) else cmd)
-        _do_run(cmd, checks, log_stdout)
+        output_file = None if log_stdout else drain.get_output_file(data, cmd_id["program"])
+        usage = _do_run(cmd, checks, log_stdout, sampler.get_interval(data), output_file)
     except:
-        diagnostics.end_cmd(cmd_id, False)
+        diagnostics.end_cmd(cmd_id, False,
+                            {"exitcode": getattr(sys.exc_info()[1], "returncode", None)})
         if log_error:
             logger.exception()
         raise
-    finally:
-        diagnostics.end_cmd(cmd_id)
+    else:
+        diagnostics.end_cmd(cmd_id, True, usage)
 
 def run_memory_retry(cmd, descr, data=None, check=None, region=None):
     """Run command, retrying when detecting fail due to memory errors.
 
-    This is useful for high throughput Java jobs which fail
-    intermittently due to an inability to get system resources.
+    This is useful for high throughput Java jobs which fail due to an inability
+    to get system resources. Each retry increases the Java heap, up to the memory
+    available to the job, or, once at the limit, reduces threads used by GATK.
+    Without a known job memory limit, retries only reduce threads.
+    Retries wait with exponential backoff, and adjustments get recorded in the
+    diagnostics so later runs of the program on the region start with them.
     """
-    max_runs = 5
+    program = diagnostics.cmd_program(cmd)
+    region_id = diagnostics.region_str(region) or diagnostics.data_region(data)
+    memory_limit = _job_memory_limit(data)
+    memory_scale, cores_scale = _previous_escalation(program, region_id, data)
     num_runs = 0
     while 1:
+        cur_cmd, memory_scale, cores_scale = _escalate_cmd(cmd, memory_scale, cores_scale,
+                                                           memory_limit)
         try:
-            run(cmd, descr, data, check, region=region, log_error=False)
+            run(cur_cmd, descr, data, check, region=region, log_error=False)
             break
         except subprocess.CalledProcessError, msg:
-            if num_runs < max_runs and ("insufficient memory" in str(msg) or
-                                        "did not provide enough memory" in str(msg) or
-                                        "A fatal error has been detected" in str(msg) or
-                                        "java.lang.OutOfMemoryError" in str(msg) or
-                                        "Resource temporarily unavailable" in str(msg)):
-                logger.info("Retrying job. Memory or resource issue with run: %s"
-                            % _descr_str(descr, data, region))
-                time.sleep(30)
+            if num_runs < _RETRY_MAX and _is_memory_error(str(msg)):
+                new_memory, new_cores = _next_escalation(cmd, memory_scale, cores_scale,
+                                                         memory_limit)
+                if (new_memory, new_cores) != (memory_scale, cores_scale):
+                    diagnostics.record_escalation(program, region_id, new_memory, new_cores)
+                    memory_scale, cores_scale = new_memory, new_cores
+                delay = (min(_RETRY_MAX_DELAY, _RETRY_DELAY * pow(2, num_runs))
+                         * random.uniform(0.5, 1.0))
+                events.emit("retry", reason="memory", program=program, region=region_id,
+                            sample=diagnostics.data_sample(data), memory_scale=memory_scale,
+                            cores_scale=cores_scale, delay=delay)
+                logger.info("Retrying job in %.0f seconds with %.1fx memory and %.2fx cores. "
+                            "Memory or resource issue with run: %s"
+                            % (delay, memory_scale, cores_scale, _descr_str(descr, data, region)))
+                time.sleep(delay)
                 num_runs += 1
             else:
                 logger.exception()
                 raise
 
+_RETRY_MAX = 5
+# Seconds to wait before the first retry, doubling on each later retry
+_RETRY_DELAY = 5.0
+_RETRY_MAX_DELAY = 120.0
+# Increase in Java heap on each retry
+_MEMORY_STEP = 1.5
+# Fraction of job memory available for the Java heap, leaving room for JVM overhead
+_MEMORY_HEAP_FRACTION = 0.9
+_MEMORY_ERRORS = ["insufficient memory", "did not provide enough memory",
+                  "A fatal error has been detected", "java.lang.OutOfMemoryError",
+                  "Resource temporarily unavailable"]
+_XMX_RE = re.compile(r"-Xmx(\d+(?:\.\d+)?)([gGmM])")
+_THREADS_RE = re.compile(r"(-nc?t) +(\d+)")
+
+def _is_memory_error(msg):
+    return any(x in msg for x in _MEMORY_ERRORS)
+
+def _job_memory_limit(data):
+    """Memory available to the job, in Gb, from job resources calculated for parallel runs.
+    """
+    try:
+        return float(data["config"]["parallel"]["mem"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def _previous_escalation(program, region, data):
+    """Start with memory and core adjustments needed by previous runs of the program on a region.
+    """
+    try:
+        escalations = diagnostics.read_escalations(data["config"])
+    except (KeyError, TypeError):
+        return 1.0, 1.0
+    return escalations.get((program, region), escalations.get((program, None), (1.0, 1.0)))
+
+def _next_escalation(cmd, memory_scale, cores_scale, memory_limit):
+    """Increase memory scaling within the limit, or reduce cores once memory is at the limit.
+    """
+    cur_cmd, cur_memory, _ = _escalate_cmd(cmd, memory_scale, cores_scale, memory_limit)
+    _, new_memory, _ = _escalate_cmd(cmd, memory_scale * _MEMORY_STEP, cores_scale, memory_limit)
+    if new_memory > cur_memory:
+        return new_memory, cores_scale
+    threads = _cmd_threads(cur_cmd)
+    if threads and max(threads) > 1:
+        return cur_memory, cores_scale / 2.0
+    return cur_memory, cores_scale
+
+def _escalate_cmd(cmd, memory_scale, cores_scale, memory_limit):
+    """Scale Java heap and GATK threads in a command, returning the command with applied scales.
+
+    Heap sizes stay within the job memory limit, returning the memory scale actually used.
+    Without a memory limit, heap sizes stay unchanged.
+    """
+    max_memory = max(_cmd_memory(cmd) or [0])
+    if max_memory > 0 and memory_limit:
+        limit_scale = memory_limit * _MEMORY_HEAP_FRACTION / max_memory
+        memory_scale = max(1.0, min(memory_scale, limit_scale))
+    else:
+        memory_scale = 1.0
+    def _scale_memory(match):
+        return "-Xmx%dm" % int(_memory_to_gb(match.group(1), match.group(2)) * memory_scale * 1024)
+    def _scale_threads(match):
+        return "%s %d" % (match.group(1), max(1, int(int(match.group(2)) * cores_scale)))
+    if memory_scale == 1.0 and cores_scale == 1.0:
+        return cmd, memory_scale, cores_scale
+    if isinstance(cmd, basestring):
+        out = _THREADS_RE.sub(_scale_threads, _XMX_RE.sub(_scale_memory, cmd))
+    else:
+        out = [_XMX_RE.sub(_scale_memory, str(x)) for x in cmd]
+        for i, x in enumerate(out[:-1]):
+            if x in ["-nt", "-nct"]:
+                out[i + 1] = _THREADS_RE.sub(_scale_threads, "%s %s" % (x, out[i + 1])).split()[-1]
+    return out, memory_scale, cores_scale
+
+def _cmd_memory(cmd):
+    cmd = cmd if isinstance(cmd, basestring) else " ".join(str(x) for x in cmd)
+    return [_memory_to_gb(val, unit) for val, unit in _XMX_RE.findall(cmd)]
+
+def _cmd_threads(cmd):
+    cmd = cmd if isinstance(cmd, basestring) else " ".join(str(x) for x in cmd)
+    return [int(x) for _, x in _THREADS_RE.findall(cmd)]
+
+def _memory_to_gb(val, unit):
+    return float(val) / 1024.0 if unit.lower() == "m" else float(val)
+
 def _descr_str(descr, data, region):
     """Add additional useful information from data to description string.
     """
@@ -91,37 +197,71 @@ def _normalize_cmd_args(cmd):
     else:
         return cmd, False, None
 
-def _do_run(cmd, checks, log_stdout=False):
+def _wait4(pid):
+    """Wait for a process, providing resource usage for the finished process tree.
+
+    Retries waits interrupted by signals.
+    """
+    while True:
+        try:
+            return os.wait4(pid, 0)
+        except OSError as e:
+            if e.errno != errno.EINTR:
+                raise
+
+def _do_run(cmd, checks, log_stdout=False, sample_interval=0, output_file=None):
     """Perform running and check results, raising errors for issues.
+
+    Returns measured resource usage of the command and its subprocesses: wall and
+    CPU time in seconds, peak resident memory in Gb and block input/output operations.
+    With a sample_interval, also includes memory, CPU and I/O sampled from the
+    process tree at that interval in seconds. With an output_file, drains command
+    output to the file in a background thread instead of logging each line.
     """
     cmd, shell_arg, executable_arg = _normalize_cmd_args(cmd)
+    start = time.time()
     s = subprocess.Popen(cmd, shell=shell_arg, executable=executable_arg,
                          stdout=subprocess.PIPE,
                          stderr=subprocess.STDOUT, close_fds=True)
-    debug_stdout = collections.deque(maxlen=100)
-    with contextlib.closing(s.stdout) as stdout:
-        while 1:
-            line = stdout.readline()
-            if line:
+    proc_sampler = sampler.ProcessTreeSampler(s.pid, sample_interval).start()
+    if output_file:
+        output_drain = drain.OutputDrain(s.stdout, output_file, logger.debug).start()
+        _, status, rusage = _wait4(s.pid)
+        sampled = proc_sampler.stop()
+        debug_stdout = output_drain.wait()
+    else:
+        debug_stdout = collections.deque(maxlen=drain.TAIL_SIZE)
+        with contextlib.closing(s.stdout) as stdout:
+            for line in iter(stdout.readline, ""):
                 debug_stdout.append(line)
                 if log_stdout:
                     logger_stdout.debug(line.rstrip())
                 else:
                     logger.debug(line.rstrip())
-            exitcode = s.poll()
-            if exitcode is not None:
-                if exitcode is not None and exitcode != 0:
-                    error_msg = " ".join(cmd) if not isinstance(cmd, basestring) else cmd
-                    error_msg += "\n"
-                    error_msg += "".join(debug_stdout)
-                    raise subprocess.CalledProcessError(exitcode, error_msg)
-                else:
-                    break
+        sampled = proc_sampler.stop()
+        _, status, rusage = _wait4(s.pid)
+    s.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    if s.returncode != 0:
+        error_msg = " ".join(cmd) if not isinstance(cmd, basestring) else cmd
+        error_msg += "\n"
+        error_msg += "".join(debug_stdout)
+        if output_file:
+            error_msg += "Full output in %s\n" % output_file
+        raise subprocess.CalledProcessError(s.returncode, error_msg)
     # Check for problems not identified by shell return codes
     if checks:
         for check in checks:
             if not check():
                 raise IOError("External command failed")
+    # maxrss reported in kilobytes on Linux and bytes on Mac OSX
+    rss_scale = pow(1024.0, 3) if sys.platform == "darwin" else pow(1024.0, 2)
+    usage = {"wall": time.time() - start, "cpu": rusage.ru_utime + rusage.ru_stime,
+             "maxrss": rusage.ru_maxrss / rss_scale, "inblock": rusage.ru_inblock,
+             "oublock": rusage.ru_oublock, "exitcode": s.returncode}
+    if output_file:
+        usage["output_file"] = output_file
+    usage.update(sampled)
+    return usage
 
 # checks for validating run completed successfully
 
@@ -0,0 +1,100 @@
+"""Drain output from external commands to log files in a background thread.
+
+By default, every line of command output goes through the debug log, which
+for chatty tools like GATK, bwa and Picard sends megabytes through Python
+logging and, for distributed runs, over the network to the controlling process.
+Draining instead writes output directly to a log file for each command, keeping
+a bounded tail in memory for error reports and forwarding a rate limited
+subset of lines to the debug log.
+"""
+import collections
+import os
+import tempfile
+import threading
+import time
+
+from bcbio import log, utils
+
+MODES = ["log", "file"]
+# Size of command output files before rotating to a single backup
+_MAX_BYTES = 50 * 1024 * 1024
+# Lines per second passed along to the debug log when draining to a file
+_LOG_RATE = 10
+# Lines of output retained for error reports
+TAIL_SIZE = 100
+
+def get_output_file(data, program):
+    """Retrieve a new file to drain command output into, or None to log output directly.
+
+    Configured with `command_output: file` in the log section of resources.
+    """
+    try:
+        config = data["config"]
+        mode = config["resources"].get("log", {}).get("command_output", "log")
+    except (KeyError, TypeError, AttributeError):
+        return None
+    if mode not in MODES:
+        raise ValueError("Unexpected command_output in log resources: %s. Need one of %s"
+                         % (mode, MODES))
+    if mode != "file":
+        return None
+    out_dir = utils.safe_makedir(os.path.join(os.path.abspath(log.get_log_dir(config)), "commands"))
+    fd, out_file = tempfile.mkstemp(prefix="%s-%s-" % (program or "command", time.strftime("%Y%m%d%H%M%S")),
+                                    suffix=".log", dir=out_dir)
+    os.close(fd)
+    return out_file
+
+class OutputDrain:
+    """Read output from a command in a background thread, writing it to a rotating log file.
+    """
+    def __init__(self, in_handle, out_file, log_fn, rate=_LOG_RATE, max_bytes=_MAX_BYTES):
+        self.out_file = out_file
+        self._in_handle = in_handle
+        self._log_fn = log_fn
+        self._rate = rate
+        self._max_bytes = max_bytes
+        self._tail = collections.deque(maxlen=TAIL_SIZE)
+        self._skipped = 0
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, args=(log.current_handlers(),),
+                                        name="drain-%s" % os.path.basename(self.out_file))
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def wait(self):
+        """Wait for the command to close its output, returning the retained tail of lines.
+        """
+        self._thread.join()
+        if self._skipped:
+            self._log_fn("%s output lines not logged; full output in %s" % (self._skipped, self.out_file))
+        return list(self._tail)
+
+    def _run(self, handlers):
+        with log.thread_handlers(handlers):
+            out_handle = open(self.out_file, "w")
+            try:
+                written = 0
+                cur_second, cur_count = None, 0
+                for line in iter(self._in_handle.readline, ""):
+                    self._tail.append(line)
+                    if written + len(line) > self._max_bytes:
+                        out_handle.close()
+                        os.rename(self.out_file, self.out_file + ".1")
+                        out_handle = open(self.out_file, "w")
+                        written = 0
+                    out_handle.write(line)
+                    written += len(line)
+                    now = int(time.time())
+                    if now != cur_second:
+                        cur_second, cur_count = now, 0
+                    if cur_count < self._rate:
+                        cur_count += 1
+                        self._log_fn(line.rstrip())
+                    else:
+                        self._skipped += 1
+            finally:
+                out_handle.close()
+                self._in_handle.close()
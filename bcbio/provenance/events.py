@@ -0,0 +1,77 @@
+"""Machine readable events tracking progress of a run.
+
+Events go to the events logging channel as JSON, which the controlling process
+writes to log/bcbio-nextgen-events.log, with one record per line. Records from
+distributed workers travel over the same ZeroMQ connection as other logging.
+Every event has `event`, `time` (seconds since the epoch) and `host` fields:
+
+- stage_start, stage_end: Pipeline stages, with `stage`.
+- task_dispatch: A parallel task handed to a worker, with `fn`, `sample`,
+  `region` and `cores`.
+- task_start, task_complete, task_fail: Tasks running on workers, with the
+  same fields as dispatch, plus `wall` seconds for completed and failed tasks
+  and `error` for failures.
+- retry: Re-running of a command or task, with `reason` and details of the
+  resources used for the new run.
+"""
+import contextlib
+import json
+import socket
+import time
+
+from bcbio.log import logger, logger_events
+from bcbio.provenance import diagnostics
+
+def emit(event, **fields):
+    fields.update({"event": event, "time": time.time(), "host": socket.gethostname()})
+    logger_events.debug(json.dumps(fields))
+
+_current_stage = [None]
+
+def stage(name):
+    """Start a new pipeline stage, ending the previous one.
+
+    Also logs the stage as a Timing line in the main log.
+    """
+    logger.info("Timing: %s" % name)
+    if _current_stage[0]:
+        emit("stage_end", stage=_current_stage[0])
+    if name == "finished":
+        _current_stage[0] = None
+    else:
+        _current_stage[0] = name
+        emit("stage_start", stage=name)
+
+def task(event, fn_name, args, **fields):
+    """Emit an event for a parallel task, adding sample, region and cores from its arguments.
+    """
+    _, data = diagnostics.get_item_from_args(args or [])
+    if data is None:
+        data = next((x for x in args or [] if isinstance(x, dict)), None)
+    fields.update({"fn": fn_name or _entity_fn(data), "sample": diagnostics.data_sample(data),
+                   "region": diagnostics.data_region(data)})
+    if "cores" not in fields:
+        fields["cores"] = diagnostics.data_cores(data)
+    emit(event, **fields)
+
+def _entity_fn(data):
+    """Retrieve the name of the parallel function running on data from its provenance entity.
+    """
+    try:
+        return data["provenance"]["entity"].rsplit(".", 2)[-2]
+    except (KeyError, TypeError, IndexError):
+        return None
+
+@contextlib.contextmanager
+def tracked_task(fn_name, args):
+    """Emit start, then complete or fail events for a task run within the context.
+    """
+    start = time.time()
+    task("task_start", fn_name, args)
+    try:
+        yield None
+    except Exception, e:
+        task("task_fail", fn_name, args, wall=time.time() - start, error=str(e)[:1000])
+        raise
+    else:
+        task("task_complete", fn_name, args, wall=time.time() - start)
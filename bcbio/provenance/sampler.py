@@ -0,0 +1,105 @@
+"""Sample memory, CPU and I/O usage of running external commands.
+
+Resource usage from wait4 only provides the peak memory of the single largest
+process in a command. For piped commands, like alignment into sorting, a
+background thread polls the full process tree with psutil to find which
+program uses the memory, along with mean usage over the run.
+"""
+import collections
+import threading
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Default seconds between samples
+DEFAULT_INTERVAL = 2.0
+
+def get_interval(data):
+    """Retrieve sampling interval from configuration, with 0 disabling sampling.
+    """
+    try:
+        interval = data["config"]["resources"].get("log", {}).get("sample_interval")
+    except (KeyError, TypeError, AttributeError):
+        interval = None
+    return DEFAULT_INTERVAL if interval is None else float(interval)
+
+class ProcessTreeSampler:
+    """Poll a process and its children in a background thread.
+    """
+    def __init__(self, pid, interval=DEFAULT_INTERVAL):
+        self._pid = pid
+        self._interval = interval
+        self._procs = {}
+        self._stop = threading.Event()
+        self._rss = []
+        self._cpu = []
+        self._io = {}
+        self._peak_by_name = collections.defaultdict(float)
+        self._thread = None
+
+    def start(self):
+        if psutil is not None and self._interval > 0:
+            self._thread = threading.Thread(target=self._run, name="sampler-%s" % self._pid)
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop sampling, returning a summary of usage or an empty dictionary if not sampled.
+
+        Memory is in Gb, CPU in percent of a single core and I/O in bytes read and written.
+        """
+        if self._thread is None:
+            return {}
+        self._stop.set()
+        self._thread.join()
+        if not self._rss:
+            return {}
+        return {"rss_peak": max(self._rss), "rss_mean": sum(self._rss) / len(self._rss),
+                "cpu_peak": max(self._cpu), "cpu_mean": sum(self._cpu) / len(self._cpu),
+                "read_bytes": sum(r for r, _ in self._io.values()),
+                "write_bytes": sum(w for _, w in self._io.values()),
+                "processes": dict(self._peak_by_name)}
+
+    def _run(self):
+        while not self._stop.wait(self._interval) and not self._stop.is_set():
+            try:
+                self._sample()
+            except psutil.Error:
+                break
+
+    def _sample(self):
+        root = self._procs.get(self._pid) or psutil.Process(self._pid)
+        # finished commands end sampling, rather than adding empty samples until stopped
+        if _call(root, "status") == psutil.STATUS_ZOMBIE:
+            raise psutil.NoSuchProcess(self._pid)
+        procs = [root] + list(_call(root, "children", recursive=True))
+        total_rss = 0.0
+        total_cpu = 0.0
+        for proc in procs:
+            # reuse process objects so CPU percent covers the time since the last sample
+            proc = self._procs.setdefault(proc.pid, proc)
+            try:
+                rss = _call(proc, "memory_info").rss / pow(1024.0, 3)
+                cpu = _call(proc, "cpu_percent", interval=None)
+                name = _call(proc, "name")
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            try:
+                io = _call(proc, "io_counters")
+                self._io[proc.pid] = (io.read_bytes, io.write_bytes)
+            except (psutil.NoSuchProcess, psutil.AccessDenied, AttributeError, NotImplementedError):
+                pass
+            total_rss += rss
+            total_cpu += cpu
+            self._peak_by_name[name] = max(self._peak_by_name[name], rss)
+        self._rss.append(total_rss)
+        self._cpu.append(total_cpu)
+
+def _call(proc, name, **kwargs):
+    """Call psutil process methods, handling renaming from get_ prefixed methods in psutil 2.0.
+    """
+    fn = getattr(proc, name, None) or getattr(proc, "get_%s" % name)
+    return fn(**kwargs) if callable(fn) else fn
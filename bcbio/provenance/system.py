@@ -59,12 +59,19 @@ def _get_machine_info(parallel, sys_config, dirs, config):
 
 def _slurm_info(queue):
     """Returns machine information for a slurm job scheduler.
+
+    Partitions with multiple node configurations report one line per
+    configuration, each providing a machine class.
     """
     cl = "sinfo -h -p {} --format '%c %m'".format(queue)
-    num_cpus, mem = subprocess.check_output(shlex.split(cl)).split()
-    # if the queue contains multiple memory configurations, the minimum value is printed with a trailing '+'
-    mem = mem.replace('+', '')
-    return [{"cores": int(num_cpus), "memory": float(mem) / 1024.0, "name": "slurm_machine"}]
+    out = []
+    for line in subprocess.check_output(shlex.split(cl)).split("\n"):
+        if line.strip():
+            num_cpus, mem = line.split()
+            # grouped configurations with varying memory report the minimum with a trailing '+'
+            mem = mem.replace('+', '')
+            out.append({"cores": int(num_cpus), "memory": float(mem) / 1024.0, "name": "slurm_machine"})
+    return out
 
 def _torque_info(queue):
     """Return machine information for a torque job scheduler using pbsnodes.
@@ -117,15 +124,10 @@ def _sge_info(queue):
     qstat_out = subprocess.check_output(["qstat", "-f", "-xml", "-q", queue])
     slot_info = _sge_get_slots(qstat_out)
     mem_info = _sge_get_mem(qhost_out, queue)
-    machine_keys = slot_info.keys()
-    #num_cpus_vec = [slot_info[x]["slots_total"] for x in machine_keys]
-    #mem_vec = [mem_info[x]["mem_total"] for x in machine_keys]
-    mem_per_slot = [mem_info[x]["mem_total"] / float(slot_info[x]["slots_total"]) for x in machine_keys]
-    min_ratio_index = mem_per_slot.index(min(mem_per_slot))
-    mem_info[machine_keys[min_ratio_index]]["mem_total"]
-    return [{"cores": slot_info[machine_keys[min_ratio_index]]["slots_total"],
-             "memory": mem_info[machine_keys[min_ratio_index]]["mem_total"],
-             "name": "sge_machine"}]
+    machine_keys = [x for x in slot_info.keys() if x in mem_info]
+    classes = set([(slot_info[x]["slots_total"], mem_info[x]["mem_total"]) for x in machine_keys])
+    return [{"cores": cores, "memory": memory, "name": "sge_machine"}
+            for cores, memory in sorted(classes)]
 
 def _sge_get_slots(xmlstring):
     """ Get slot information from qstat
@@ -169,10 +171,25 @@ def _sge_get_mem(xmlstring, queue_name):
     return my_machine_dict
 
 def _combine_machine_info(xs):
-    if len(xs) == 1:
+    """Combine machine information, handling clusters with multiple machine types.
+
+    For non-homogeneous clusters, the default specification is the machine
+    type with the least memory per core, which safely fits jobs anywhere on the
+    cluster. The distinct machine types are available as `classes`, allowing
+    placement of high memory jobs on larger machines.
+    """
+    classes = []
+    for x in xs:
+        key = (int(x["cores"]), float(x["memory"]))
+        if key not in [(c["cores"], c["memory"]) for c in classes]:
+            classes.append({"cores": key[0], "memory": key[1], "name": x.get("name")})
+    if len(classes) == 1:
         return xs[0]
     else:
-        raise NotImplementedError("Add logic to pick specification from non-homogeneous clusters.")
+        classes.sort(key=lambda c: (c["memory"], c["cores"]))
+        out = dict(min(classes, key=lambda c: c["memory"] / float(c["cores"])))
+        out["classes"] = classes
+        return out
 
 def get_info(dirs, parallel):
     """Retrieve cluster or local filesystem resources from pre-retrieved information.
@@ -0,0 +1,224 @@
+"""Report where time went in a pipeline run, from the logs in the work directory.
+
+Combines stage boundaries from the `Timing:` lines of the main log with
+per-command records from the diagnostics database (or diagnostics log when the
+database is not available) to summarize:
+
+- Wall time of each pipeline stage.
+- The critical path: the chain of dependent stage and sample intervals that
+  sets total wall time, with the longest running command of each.
+- Core hour utilization for each block of parallel processing, comparing CPU
+  time used by commands to the cores allocated.
+- Command time by sample and the slowest regions during variant calling.
+"""
+import collections
+import json
+import os
+import re
+import sys
+import time
+
+from bcbio.log import LOG_NAME, diagnosticsdb
+
+_TIMING_RE = re.compile(r"^\[(?P<time>\d{4}-\d{2}-\d{2} \d{2}:\d{2})\] (?:.*: )?Timing: (?P<stage>.+)$")
+_TIME_RE = re.compile(r"^\[(?P<time>\d{4}-\d{2}-\d{2} \d{2}:\d{2})\] ")
+_TIME_FORMAT = "%Y-%m-%d %H:%M"
+_VARIANT_STAGE = "variant calling"
+
+def add_subparser(subparsers):
+    parser = subparsers.add_parser("timing", help="Report timing of pipeline stages, samples and regions")
+    parser.add_argument("--workdir", help="Work directory of the run to report on",
+                        default=os.getcwd())
+    parser.add_argument("--top", help="Number of slowest regions to report", type=int, default=10)
+
+def report(args, out_handle=None):
+    """Write a timing report for the run in args.workdir.
+    """
+    out_handle = out_handle or sys.stdout
+    log_dir = os.path.join(os.path.abspath(args.workdir), "log")
+    stages = read_stages(os.path.join(log_dir, "%s.log" % LOG_NAME))
+    commands, blocks = read_diagnostics(log_dir)
+    if not stages and not commands:
+        raise ValueError("Did not find timing information in logs in %s" % log_dir)
+    assign_stages(commands, stages)
+    _write_table(out_handle, "Stages", ["stage", "start", "hours"],
+                 [(s["name"], time.strftime(_TIME_FORMAT, time.localtime(s["start"])),
+                   _hours(s["end"] - s["start"])) for s in stages])
+    _write_table(out_handle, "Critical path", ["stage", "sample", "start", "wait hours", "hours",
+                                               "longest command", "command hours"],
+                 [(x["stage"], x["sample"], time.strftime(_TIME_FORMAT, time.localtime(x["start"])),
+                   _hours(x["wait"]), _hours(x["wall"]), x["descr"], _hours(x["cmd_wall"]))
+                  for x in critical_path(stages, commands)])
+    _write_table(out_handle, "Parallel blocks", ["block", "type", "cores", "hours", "core hours",
+                                                 "cpu hours", "utilization"],
+                 [(x["name"], x["type"], x["cores"], _hours(x["wall"]), "%.2f" % x["core_hours"],
+                   "%.2f" % x["cpu_hours"], "%.1f%%" % (100.0 * x["utilization"]))
+                  for x in block_utilization(blocks, commands)])
+    _write_table(out_handle, "Samples", ["sample", "commands", "command hours", "cpu hours"],
+                 [(x["name"], x["count"], _hours(x["wall"]), _hours(x["cpu"]))
+                  for x in summarize_by(commands, "sample")])
+    regions = [x for x in commands if x.get("stage") in [_VARIANT_STAGE, None]]
+    _write_table(out_handle, "Slowest variant calling regions", ["region", "commands", "command hours"],
+                 [(x["name"], x["count"], _hours(x["wall"]))
+                  for x in summarize_by(regions, "region")[:args.top]])
+
+# ## Reading logs
+
+def read_stages(log_file):
+    """Retrieve pipeline stages with start and end times from Timing lines in the main log.
+
+    The final stage ends at the last logged time, for runs still in progress.
+    """
+    stages = []
+    last_time = None
+    if os.path.exists(log_file):
+        with open(log_file) as in_handle:
+            for line in in_handle:
+                match = _TIME_RE.match(line)
+                if match:
+                    last_time = _parse_time(match.group("time"))
+                match = _TIMING_RE.match(line.rstrip("\r\n"))
+                if match:
+                    if stages and stages[-1]["end"] is None:
+                        stages[-1]["end"] = last_time
+                    stages.append({"name": match.group("stage").strip(), "start": last_time, "end": None})
+    if stages and stages[-1]["end"] is None:
+        stages[-1]["end"] = last_time
+    return [x for x in stages if x["name"] != "finished" and x["start"] is not None]
+
+def _parse_time(x):
+    return time.mktime(time.strptime(x, _TIME_FORMAT))
+
+def read_diagnostics(log_dir):
+    """Retrieve finished commands and parallel blocks from the diagnostics database or log.
+    """
+    db_file = os.path.join(log_dir, "%s-diagnostics.db" % LOG_NAME)
+    json_file = os.path.join(log_dir, "%s-diagnostics.log" % LOG_NAME)
+    commands, blocks = [], []
+    if os.path.exists(db_file):
+        conn = diagnosticsdb.connect(db_file)
+        try:
+            commands = [dict(x) for x in conn.execute("SELECT * FROM commands WHERE end_time IS NOT NULL")]
+            tables = set(x[0] for x in conn.execute("SELECT name FROM sqlite_master WHERE type='table'"))
+            if "parallel" in tables:
+                blocks = [dict(x) for x in conn.execute("SELECT * FROM parallel")]
+        finally:
+            conn.close()
+    elif os.path.exists(json_file):
+        with open(json_file) as in_handle:
+            for line in in_handle:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                if rec.get("event") == "parallel":
+                    blocks.append(rec)
+                elif rec.get("end_time") is not None:
+                    commands.append(rec)
+    return commands, blocks
+
+def assign_stages(commands, stages):
+    """Annotate commands with the pipeline stage they started in.
+    """
+    starts = [(s["start"], s["name"]) for s in stages]
+    for cmd in commands:
+        cmd["stage"] = None
+        # log times have minute resolution, so compare against the minute commands started in
+        cmd_start = cmd["start_time"] - cmd["start_time"] % 60
+        for stage_start, name in starts:
+            if stage_start <= cmd_start:
+                cmd["stage"] = name
+    return commands
+
+# ## Summaries
+
+def critical_path(stages, commands):
+    """Find the chain of dependent stage and sample intervals setting total wall time.
+
+    Each interval covers the commands of a sample, or batch commands without a
+    sample, within a stage. Starting from the interval finishing last, each step
+    back picks the interval from an earlier stage that finished latest before
+    the current one started, the one it waited on. Gaps between intervals show
+    time spent waiting for scheduling or on steps without external commands.
+    """
+    order = dict((s["name"], i) for i, s in enumerate(stages))
+    groups = collections.defaultdict(list)
+    for cmd in commands:
+        if cmd.get("stage") in order:
+            groups[(cmd["stage"], cmd.get("sample") or "")].append(cmd)
+    intervals = []
+    for (stage, sample), cmds in groups.items():
+        longest = max(cmds, key=lambda x: x["wall"])
+        intervals.append({"stage": stage, "sample": sample,
+                          "start": min(x["start_time"] for x in cmds),
+                          "end": max(x["end_time"] for x in cmds),
+                          "descr": longest["descr"], "cmd_wall": longest["wall"]})
+    if not intervals:
+        return []
+    path = [max(intervals, key=lambda x: x["end"])]
+    while True:
+        cur = path[-1]
+        prev = [x for x in intervals if order[x["stage"]] < order[cur["stage"]] and x["end"] <= cur["start"]]
+        if not prev:
+            break
+        path.append(max(prev, key=lambda x: x["end"]))
+    path.reverse()
+    prev_end = min(stages[0]["start"], path[0]["start"])
+    for x in path:
+        x["wall"] = x["end"] - x["start"]
+        x["wait"] = max(0.0, x["start"] - prev_end)
+        prev_end = x["end"]
+    return path
+
+def block_utilization(blocks, commands):
+    """Compare CPU time of commands to core hours allocated in each parallel block.
+
+    Commands without measured CPU time count as using all of their cores.
+    """
+    out = []
+    for block in sorted(blocks, key=lambda x: x["start_time"]):
+        wall = block["end_time"] - block["start_time"]
+        core_hours = wall * (block["cores"] or 1) / 3600.0
+        cpu = sum(_cmd_cpu(x) for x in commands
+                  if block["start_time"] <= x["start_time"] < block["end_time"])
+        out.append({"name": block["name"], "type": block["type"], "cores": block["cores"], "wall": wall,
+                    "core_hours": core_hours, "cpu_hours": cpu / 3600.0,
+                    "utilization": (cpu / 3600.0) / core_hours if core_hours > 0 else 0.0})
+    return out
+
+def summarize_by(commands, key):
+    """Total command wall and CPU time grouped by a command attribute, slowest first.
+    """
+    totals = collections.defaultdict(lambda: {"count": 0, "wall": 0.0, "cpu": 0.0})
+    for cmd in commands:
+        if cmd.get(key):
+            cur = totals[cmd[key]]
+            cur["count"] += 1
+            cur["wall"] += cmd["wall"] or 0.0
+            cur["cpu"] += _cmd_cpu(cmd)
+    out = []
+    for name, vals in totals.items():
+        vals["name"] = name
+        out.append(vals)
+    return sorted(out, key=lambda x: x["wall"], reverse=True)
+
+def _cmd_cpu(cmd):
+    if cmd.get("cpu") is not None:
+        return cmd["cpu"]
+    return (cmd.get("wall") or 0.0) * (cmd.get("cores") or 1)
+
+# ## Output
+
+def _hours(seconds):
+    return "" if seconds is None else "%.2f" % (seconds / 3600.0)
+
+def _write_table(out_handle, title, header, rows):
+    out_handle.write("## %s\n\n" % title)
+    if not rows:
+        out_handle.write("No information available\n\n")
+        return
+    rows = [header] + [["" if x is None else "%s" % x for x in row] for row in rows]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    for row in rows:
+        out_handle.write("  ".join(x.ljust(w) for x, w in zip(row, widths)).rstrip() + "\n")
+    out_handle.write("\n")
@@ -9,6 +9,8 @@ import itertools
 import functools
 import random
 import ConfigParser
+import json
+import socket
 try:
     from concurrent import futures
 except ImportError:
@@ -217,6 +219,34 @@ def file_uptodate(fname, cmp_fname):
     return (file_exists(fname) and file_exists(cmp_fname) and
             os.path.getmtime(fname) >= os.path.getmtime(cmp_fname))
 
+def read_json_cache(cache_file):
+    """Read a JSON dictionary of cached values, returning an empty dictionary if unavailable.
+    """
+    try:
+        with open(cache_file) as in_handle:
+            return json.load(in_handle)
+    except (IOError, ValueError):
+        return {}
+
+def update_json_cache(cache_file, key, value):
+    """Add a value to an on disk JSON cache, ignoring failures in read-only home directories.
+
+    Writes to a temporary file and renames, so concurrent processes never see
+    partially written caches.
+    """
+    try:
+        cache_dir = os.path.dirname(cache_file)
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        cache = read_json_cache(cache_file)
+        cache[key] = value
+        tmp_file = "%s.%s.%s.tmp" % (cache_file, socket.gethostname(), os.getpid())
+        with open(tmp_file, "w") as out_handle:
+            json.dump(cache, out_handle)
+        os.rename(tmp_file, cache_file)
+    except (IOError, OSError):
+        pass
+
 def create_dirs(config, names=None):
     if names is None:
         names = config["dir"].keys()
@@ -263,17 +293,22 @@ def splitext_plus(f):
 
 def symlink_plus(orig, new):
     """Create relative symlinks and handle associated biological index files.
+
+    Links are relative to the directory of the new file, calculated without
+    changing the working directory so it is safe to call from multiple threads.
     """
     for ext in ["", ".idx", ".gbi", ".tbi", ".bai"]:
         if os.path.exists(orig + ext) and not os.path.lexists(new + ext):
-            with chdir(os.path.dirname(new)):
-                os.symlink(os.path.relpath(orig + ext), os.path.basename(new + ext))
+            _relative_symlink(orig + ext, new + ext)
     orig_noext = splitext_plus(orig)[0]
     new_noext = splitext_plus(new)[0]
     for sub_ext in [".bai"]:
         if os.path.exists(orig_noext + sub_ext) and not os.path.lexists(new_noext + sub_ext):
-            with chdir(os.path.dirname(new_noext)):
-                os.symlink(os.path.relpath(orig_noext + sub_ext), os.path.basename(new_noext + sub_ext))
+            _relative_symlink(orig_noext + sub_ext, new_noext + sub_ext)
+
+def _relative_symlink(orig, new):
+    new_dir = safe_makedir(os.path.dirname(os.path.abspath(new)))
+    os.symlink(os.path.relpath(os.path.abspath(orig), new_dir), os.path.abspath(new))
 
 def append_stem(to_transform, word):
     """
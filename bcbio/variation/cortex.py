@@ -57,7 +57,8 @@ def run_cortex(align_bams, items, ref_file, assoc_files, region=None,
             _combine_variants(regional_vcfs, combine_file, ref_file, config)
             _select_final_variants(combine_file, out_file, config)
         else:
-            vcfutils.write_empty_vcf(out_file)
+            vcfutils.write_empty_vcf(out_file, vcfutils.get_sample_names(items),
+                                     ref_file, config)
     return out_file
 
 def _passes_cortex_depth(line, min_depth):
@@ -137,7 +138,8 @@ def _run_cortex_on_region(region, align_bam, ref_file, work_dir, out_file_base,
         if not file_exists(out_file):
             fastq = _get_fastq_in_region(region, align_bam, out_vcf_base)
             if _count_fastq_reads(fastq, min_reads) < min_reads:
-                vcfutils.write_empty_vcf(out_file)
+                vcfutils.write_empty_vcf(out_file, [get_sample_name(align_bam)],
+                                         ref_file, config)
             else:
                 local_ref, genome_size = _get_local_ref(region, ref_file, out_vcf_base)
                 indexes = _index_local_ref(local_ref, cortex_dir, stampy_dir, kmers)
@@ -149,7 +151,8 @@ def _run_cortex_on_region(region, align_bam, ref_file, work_dir, out_file_base,
                 if cortex_out:
                     _remap_cortex_out(cortex_out, region, out_file)
                 else:
-                    vcfutils.write_empty_vcf(out_file)
+                    vcfutils.write_empty_vcf(out_file, [get_sample_name(align_bam)],
+                                             ref_file, config)
     finally:
         if os.path.exists(base_dir):
             shutil.rmtree(base_dir)
@@ -16,6 +16,7 @@ from distutils.version import LooseVersion
 import itertools
 
 from bcbio import bam, broad, utils
+from bcbio.bam import callable, ref
 from bcbio.utils import file_exists, safe_makedir
 from bcbio.distributed.transaction import file_transaction
 from bcbio.distributed.split import grouped_parallel_split_combine
@@ -31,7 +32,7 @@ def _shared_gatk_call_prep(align_bams, ref_file, config, dbsnp, region, out_file
     """Shared preparation work for GATK variant calling.
     """
     broad_runner = broad.runner_from_config(config)
-    broad_runner.run_fn("picard_index_ref", ref_file)
+    ref.index_ref(ref_file, config)
     for x in align_bams:
         bam.index(x, config)
     coverage_depth = config["algorithm"].get("coverage_depth", "high").lower()
@@ -67,7 +68,8 @@ def unified_genotyper(align_bams, items, ref_file, assoc_files,
                                    region, out_file)
         if (not isinstance(region, (list, tuple)) and
                 not all(has_aligned_reads(x, region) for x in align_bams)):
-            vcfutils.write_empty_vcf(out_file)
+            vcfutils.write_empty_vcf(out_file, vcfutils.get_sample_names(items),
+                                     ref_file, items[0]["config"])
         else:
             with file_transaction(out_file) as tx_out_file:
                 params += ["-T", "UnifiedGenotyper",
@@ -93,7 +95,8 @@ def haplotype_caller(align_bams, items, ref_file, assoc_files,
         assert broad_runner.gatk_type() == "restricted", \
             "Require full version of GATK 2.4+ for haplotype calling"
         if not all(has_aligned_reads(x, region) for x in align_bams):
-            vcfutils.write_empty_vcf(out_file)
+            vcfutils.write_empty_vcf(out_file, vcfutils.get_sample_names(items),
+                                     ref_file, items[0]["config"])
         else:
             with file_transaction(out_file) as tx_out_file:
                 params += ["-T", "HaplotypeCaller",
@@ -460,6 +463,20 @@ def get_variantcallers():
             "varscan": varscan.run_varscan,
             "mutect": mutect.mutect_caller}
 
+def _batch_variant_regions(data):
+    """Restrict calling in batched analysis regions to the callable regions within them.
+
+    Batches span no coverage gaps between callable regions, so without input
+    variant regions calling uses the callable regions subset to the batch.
+    """
+    algorithm = data["config"]["algorithm"]
+    if algorithm.get("variant_regions") or not algorithm.get("batch_callable_regions"):
+        return data
+    data = copy.copy(data)
+    data["config"] = copy.copy(data["config"])
+    data["config"]["algorithm"] = dict(algorithm, variant_regions=algorithm["callable_regions"])
+    return data
+
 def variantcall_sample(data, region=None, out_file=None):
     """Parallel entry point for doing genotyping of a region of a sample.
     """
@@ -475,11 +492,19 @@ def variantcall_sample(data, region=None, out_file=None):
         align_bams = data["work_bam"]
         items = data["work_items"]
     call_file = "%s-raw%s" % os.path.splitext(out_file)
-    call_file = caller_fn(align_bams, items, sam_ref,
-                          data["genome_resources"]["variation"],
-                          region, call_file)
-    if data["config"]["algorithm"].get("phasing", False) == "gatk":
-        call_file = phasing.read_backed_phasing(call_file, align_bams, sam_ref, region, config)
+    if (not utils.file_exists(call_file) and
+          all(callable.region_has_reads(x, region) is False for x in items)):
+        # skip starting callers for regions without reads in any sample
+        vcfutils.write_empty_vcf(call_file, vcfutils.get_sample_names(items),
+                                 sam_ref, config)
+    else:
+        items = [_batch_variant_regions(x) for x in items]
+        call_file = caller_fn(align_bams, items, sam_ref,
+                              data["genome_resources"]["variation"],
+                              region, call_file)
+        if data["config"]["algorithm"].get("phasing", False) == "gatk":
+            call_file = phasing.read_backed_phasing(call_file, align_bams, sam_ref, region,
+                                                    items[0]["config"])
     utils.symlink_plus(call_file, out_file)
     if "work_items" in data:
         del data["work_items"]
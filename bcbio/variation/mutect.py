@@ -4,6 +4,7 @@ from distutils.version import LooseVersion
 import os
 
 from bcbio import bam, broad
+from bcbio.bam import ref
 from bcbio.utils import file_exists
 from bcbio.distributed.transaction import file_transaction
 from bcbio.variation.realign import has_aligned_reads
@@ -64,7 +65,7 @@ def _mutect_call_prep(align_bams, items, ref_file, assoc_files,
     broad_runner = broad.runner_from_config(base_config, "mutect")
     _check_mutect_version(broad_runner)
 
-    broad_runner.run_fn("picard_index_ref", ref_file)
+    ref.index_ref(ref_file, base_config)
     for x in align_bams:
         bam.index(x, base_config)
 
@@ -92,7 +93,8 @@ def mutect_caller(align_bams, items, ref_file, assoc_files, region=None,
                                    region, out_file)
         if (not isinstance(region, (list, tuple)) and
               not all(has_aligned_reads(x, region) for x in align_bams)):
-                vcfutils.write_empty_vcf(out_file)
+                vcfutils.write_empty_vcf(out_file, vcfutils.get_sample_names(items),
+                                         ref_file, items[0]["config"])
                 return
         with file_transaction(out_file) as tx_out_file:
             # Rationale: MuTect writes another table to stdout, which we don't need
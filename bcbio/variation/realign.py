@@ -130,8 +130,7 @@ def gatk_realigner(align_bam, ref_file, config, dbsnp=None, region=None,
     """
     runner = broad.runner_from_config(config)
     bam.index(align_bam, config)
-    runner.run_fn("picard_index_ref", ref_file)
-    ref.fasta_idx(ref_file)
+    ref.index_ref(ref_file, config)
     if region:
         align_bam = subset_bam_by_region(align_bam, region, out_file)
         bam.index(align_bam, config)
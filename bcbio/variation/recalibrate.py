@@ -9,7 +9,7 @@ import os
 import shutil
 
 from bcbio import bam, broad, utils
-from bcbio.bam import cram
+from bcbio.bam import cram, ref
 from bcbio.log import logger
 from bcbio.utils import curdir_tmpdir, file_exists
 from bcbio.distributed.split import parallel_split_combine
@@ -49,7 +49,7 @@ def prep_recal(data):
         dbsnp_file = data["genome_resources"]["variation"]["dbsnp"]
         broad_runner = broad.runner_from_config(config)
         platform = config["algorithm"].get("platform", "illumina")
-        broad_runner.run_fn("picard_index_ref", ref_file)
+        ref.index_ref(ref_file, config)
         if config["algorithm"].get("mark_duplicates", True):
             (dup_align_bam, _) = broad_runner.run_fn("picard_mark_duplicates", data["work_bam"])
         else:
@@ -35,7 +35,8 @@ def shared_variantcall(call_fn, name, align_bams, ref_file, items,
         if ((variant_regions is not None and isinstance(target_regions, basestring)
               and not os.path.isfile(target_regions))
               or not all(realign.has_aligned_reads(x, region) for x in align_bams)):
-            vcfutils.write_empty_vcf(out_file)
+            vcfutils.write_empty_vcf(out_file, vcfutils.get_sample_names(items),
+                                     ref_file, config)
         else:
             with file_transaction(out_file) as tx_out_file:
                 call_fn(align_bams, ref_file, items, target_regions,
@@ -13,7 +13,8 @@ from bcbio.provenance import do, programs
 from bcbio.utils import file_exists, append_stem
 from bcbio.variation import freebayes, samtools
 from bcbio.variation.vcfutils import (combine_variant_files, write_empty_vcf,
-                                      get_paired_bams, is_paired_analysis)
+                                      get_paired_bams, get_sample_names,
+                                      is_paired_analysis)
 
 import pysam
 
@@ -88,7 +89,8 @@ def _varscan_paired(align_bams, ref_file, items, target_regions, out_file):
         # just skip the rest of the analysis (VarScan will hang otherwise)
 
         if any(os.stat(filename).st_size == 0 for filename in cleanup_files):
-            write_empty_vcf(out_file)
+            write_empty_vcf(out_file, [paired.normal_name, paired.tumor_name],
+                            ref_file, config)
             return
 
         # First index is normal, second is tumor
@@ -127,7 +129,8 @@ def _varscan_paired(align_bams, ref_file, items, target_regions, out_file):
             _fix_varscan_vcf(indel_file, paired.normal_name, paired.tumor_name)
 
         if not to_combine:
-            write_empty_vcf(out_file)
+            write_empty_vcf(out_file, [paired.normal_name, paired.tumor_name],
+                            ref_file, config)
             return
 
         out_file = combine_variant_files([snp_file, indel_file],
@@ -140,7 +143,8 @@ def _varscan_paired(align_bams, ref_file, items, target_regions, out_file):
             os.remove(extra_file)
 
         if os.path.getsize(out_file) == 0:
-            write_empty_vcf(out_file)
+            write_empty_vcf(out_file, [paired.normal_name, paired.tumor_name],
+                            ref_file, config)
 
 
 def _fix_varscan_vcf(orig_file, normal_name, tumor_name):
@@ -300,7 +304,7 @@ def _varscan_work(align_bams, ref_file, items, target_regions, out_file):
         cmd = ("{mpileup} | {remove_zerocoverage} > {mpfile_tx}")
         do.run(cmd.format(**locals()), "mpileup for Varscan")
     if os.path.getsize(mpfile) == 0:
-        write_empty_vcf(out_file)
+        write_empty_vcf(out_file, get_sample_names(items), ref_file, config)
     else:
         cmd = ("cat {mpfile} "
                "| java {jvm_opts} -jar {varscan_jar} mpileup2cns --min-coverage 5 --p-value 0.98 "
@@ -313,7 +317,7 @@ def _varscan_work(align_bams, ref_file, items, target_regions, out_file):
     # VarScan can create completely empty files in regions without
     # variants, so we create a correctly formatted empty file
     if os.path.getsize(out_file) == 0:
-        write_empty_vcf(out_file)
+        write_empty_vcf(out_file, get_sample_names(items), ref_file, config)
     else:
         freebayes.clean_vcf_output(out_file, _clean_varscan_line)
 
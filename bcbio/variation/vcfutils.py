@@ -56,11 +56,28 @@ def get_paired_phenotype(data):
 
 # ## General utilities
 
-def write_empty_vcf(out_file):
+def write_empty_vcf(out_file, samples=None, ref_file=None, config=None):
+    """Write a VCF without variants, with genotype columns for samples if provided.
+
+    Includes contig lines from the reference and a genotype FORMAT line, so
+    the empty file combines with calls from other regions in GATK
+    CombineVariants and bcftools concat.
+    """
+    header = ["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO"]
+    meta = ["##fileformat=VCFv4.1", "## No variants; no reads aligned in region"]
+    if samples:
+        header += ["FORMAT"] + list(samples)
+        meta.append('##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">')
+    if ref_file:
+        meta += ["##contig=<ID=%s,length=%s>" % (c.name, c.size)
+                 for c in ref.file_contigs(ref_file, config)]
     with open(out_file, "w") as out_handle:
-        out_handle.write("##fileformat=VCFv4.1\n"
-                         "## No variants; no reads aligned in region\n"
-                         "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n")
+        out_handle.write("%s\n%s\n" % ("\n".join(meta), "\t".join(header)))
+
+def get_sample_names(items):
+    """Retrieve sample names, as used in read groups and VCF genotype columns.
+    """
+    return [x["rgnames"]["sample"] for x in items if "rgnames" in x]
 
 
 def split_snps_indels(orig_file, ref_file, config):
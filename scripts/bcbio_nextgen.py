@@ -33,7 +33,7 @@ from bcbio import install, workflow
 from bcbio.distributed import runfn
 from bcbio.pipeline.main import run_main, parse_cl_args
 from bcbio.server import main as server_main
-from bcbio.provenance import programs
+from bcbio.provenance import programs, timing
 
 def main(**kwargs):
     run_main(**kwargs)
@@ -48,6 +48,8 @@ if __name__ == "__main__":
         runfn.process(kwargs["args"])
     elif "version" in kwargs and kwargs["version"]:
         programs.write_versions({"work": kwargs["args"].workdir})
+    elif "timing" in kwargs and kwargs["timing"]:
+        timing.report(kwargs["args"])
     else:
         if kwargs.get("workflow"):
             setup_info = workflow.setup(kwargs["workflow"], kwargs.pop("inputs"))
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+"""Compare Picard run times per call with and without a persistent Nailgun JVM server.
+
+Usage:
+    benchmark_jvmserver.py <nailgun server jar> <Picard BuildBamIndex jar> <BAM file> [<number of calls>]
+
+Indexes a BAM file repeatedly, running each as a separate Picard call, first
+with a new JVM for each call and then through a JVM server.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from bcbio.broad import jvmserver
+
+def main(nailgun_jar, picard_jar, bam_file, num_calls=20):
+    config = {"resources": {"jvmserver": {"jar": os.path.abspath(nailgun_jar)}}}
+    work_dir = tempfile.mkdtemp()
+    try:
+        cls = [["java", "-Xmx2g", "-jar", os.path.abspath(picard_jar),
+                "INPUT=%s" % os.path.abspath(bam_file),
+                "OUTPUT=%s" % os.path.join(work_dir, "%s.bai" % i),
+                "TMP_DIR=%s" % work_dir, "VALIDATION_STRINGENCY=SILENT"]
+               for i in range(int(num_calls))]
+        print "Direct: %.2f seconds per call" % _time_runs(cls)
+        with jvmserver.local_server(config):
+            # first call loads Picard classes into the server
+            subprocess.check_call(jvmserver.route(cls[0]), stdout=open(os.devnull, "w"))
+            print "JVM server: %.2f seconds per call" % _time_runs([jvmserver.route(cl) for cl in cls])
+    finally:
+        shutil.rmtree(work_dir)
+
+def _time_runs(cls):
+    start = time.time()
+    with open(os.devnull, "w") as out_handle:
+        for cl in cls:
+            subprocess.check_call(cl, stdout=out_handle, stderr=subprocess.STDOUT)
+    return (time.time() - start) / len(cls)
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
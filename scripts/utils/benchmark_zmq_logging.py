@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""Measure throughput of log records sent over ZeroMQ with batching and compression.
+
+Usage:
+    benchmark_zmq_logging.py [<number of records>] [<number of senders>]
+
+Senders run in separate processes, pushing records of command output like
+those from GATK to a subscriber on a local socket, comparing one message per
+record to batched and compressed messages.
+"""
+import multiprocessing
+import sys
+import time
+
+import logbook
+import zmq
+
+from bcbio.log import logbook_zmqpush
+
+SETTINGS = [("unbatched", {"batch_size": 1}),
+            ("batched", {"batch_size": 200, "compress": False}),
+            ("batched and compressed", {"batch_size": 200, "compress": True})]
+
+def send(addr, num_records, opts):
+    handler = logbook_zmqpush.ZeroMQPushHandler(addr, **opts)
+    for i in range(num_records):
+        handler.emit(logbook.LogRecord("bcbio-nextgen", logbook.DEBUG,
+                                       "INFO  10:21:45,112 ProgressMeter - chr1:%s 1.2e+06 "
+                                       "30.0 s 25.0 s 0.3%% 2.7 h 2.7 h" % i))
+    handler.close()
+
+def run(name, opts, num_records, num_senders):
+    context = zmq.Context()
+    subscriber = logbook_zmqpush.ZeroMQPullSubscriber(context=context)
+    port = subscriber.socket.bind_to_random_port("tcp://127.0.0.1")
+    senders = [multiprocessing.Process(target=send, args=("tcp://127.0.0.1:%s" % port, num_records, opts))
+               for _ in range(num_senders)]
+    start = time.time()
+    for p in senders:
+        p.start()
+    for _ in range(num_records * num_senders):
+        subscriber.recv()
+    elapsed = time.time() - start
+    for p in senders:
+        p.join()
+    subscriber.socket.close(linger=0)
+    context.destroy(linger=0)
+    print "%-25s %10.0f records/second" % (name, num_records * num_senders / elapsed)
+
+def main(num_records=50000, num_senders=4):
+    for name, opts in SETTINGS:
+        run(name, opts, int(num_records), int(num_senders))
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,85 @@
+"""Tests for caching versions of Broad jars.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from bcbio import broad
+from bcbio.broad import jvmserver
+
+class JarVersionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.jar = os.path.join(self.work_dir, "GenomeAnalysisTK.jar")
+        open(self.jar, "w").close()
+        self.orig_cache_file = broad._VERSION_CACHE_FILE
+        broad._VERSION_CACHE_FILE = os.path.join(self.work_dir, "cache", "jar_versions.json")
+        broad._jar_versions.clear()
+
+    def tearDown(self):
+        broad._VERSION_CACHE_FILE = self.orig_cache_file
+        broad._jar_versions.clear()
+        shutil.rmtree(self.work_dir)
+
+    def test_failed_version_not_cached(self):
+        failed = lambda: "Error occurred during initialization of VM"
+        self.assertEqual(broad._cached_jar_version(self.jar, failed), failed())
+        self.assertEqual(broad._jar_versions, {})
+        self.assertEqual(broad._cached_jar_version(self.jar, lambda: "3.1-1-g07a4bf8"),
+                         "3.1-1-g07a4bf8")
+        broad._jar_versions.clear()
+        self.assertEqual(broad._cached_jar_version(self.jar, failed), "3.1-1-g07a4bf8")
+
+    def test_nightly_version_cached(self):
+        nightly = "nightly-2014-03-20-g65934ae"
+        self.assertEqual(broad._cached_jar_version(self.jar, lambda: nightly), nightly)
+        broad._jar_versions.clear()
+        self.assertEqual(broad._cached_jar_version(self.jar, lambda: "failed"), nightly)
+
+    def test_major_version(self):
+        """Nightly builds and GATK before 2.4 without version output get major versions.
+        """
+        for i, (version, major) in enumerate([("nightly-2014-03-20-g65934ae", "2.8"),
+                                              ("3.1-1-g07a4bf8", "3.1"),
+                                              ("##### ERROR MESSAGE: Invalid argument", "2.3")]):
+            jar = os.path.join(self.work_dir, "GenomeAnalysisTK-%s.jar" % i)
+            open(jar, "w").close()
+            runner = broad.BroadRunner(self.work_dir, self.work_dir, {})
+            runner._set_default_versions = lambda config: None
+            runner._get_jar = lambda command, alts=None: jar
+            orig_run = broad._run_gatk_version
+            broad._run_gatk_version = lambda jar: version
+            try:
+                self.assertEqual(runner.gatk_major_version(), major)
+            finally:
+                broad._run_gatk_version = orig_run
+
+class JvmServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.jar = "/opt/picard/SortSam.jar"
+        os.environ[jvmserver.PORT_ENV] = "2113"
+        jvmserver._main_classes[self.jar] = "picard.SortSam"
+        jvmserver._classpath.add(("2113", self.jar))
+
+    def tearDown(self):
+        os.environ.pop(jvmserver.PORT_ENV, None)
+        jvmserver._main_classes.pop(self.jar, None)
+        jvmserver._classpath.discard(("2113", self.jar))
+
+    def _cl(self, *args):
+        return ["java", "-Xmx2g", "-jar", self.jar, "TMP_DIR=/tmp/tx", "SORT_ORDER=coordinate",
+                "MAX_RECORDS_IN_RAM=500000", "VALIDATION_STRINGENCY=SILENT"] + list(args)
+
+    def test_route_absolute(self):
+        cl = self._cl("INPUT=/work/in.bam", "OUTPUT=/work/out.bam")
+        self.assertEqual(jvmserver.route(cl)[3:5], ["picard.SortSam", "TMP_DIR=/tmp/tx"])
+
+    def test_relative_outputs_not_routed(self):
+        """Relative outputs, which do not exist yet, run in their own JVM.
+        """
+        for output in ["OUTPUT=out.bam", "OUTPUT=align/out.bam", "O=out"]:
+            cl = self._cl("INPUT=/work/in.bam", output)
+            self.assertEqual(jvmserver.route(cl), cl)
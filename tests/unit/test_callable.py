@@ -0,0 +1,123 @@
+"""Tests for identifying callable regions and splitting them into analysis blocks.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from bcbio.bam import callable
+from bcbio.pipeline import intervals
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), os.pardir, "data", "callable")
+
+class NativeCallableTest(unittest.TestCase):
+    """Callable states from read depth on a 300bp reference with 10 N bases at 130-140.
+    """
+    expected = [(0, 10, "NO_COVERAGE"), (10, 30, "CALLABLE"), (30, 50, "EXCESSIVE_COVERAGE"),
+                (50, 90, "NO_COVERAGE"), (90, 112, "CALLABLE"), (112, 125, "NO_COVERAGE"),
+                (125, 130, "CALLABLE"), (130, 140, "REF_N"), (140, 145, "CALLABLE"),
+                (145, 150, "NO_COVERAGE"), (150, 160, "CALLABLE"), (160, 210, "NO_COVERAGE"),
+                (210, 220, "CALLABLE"), (220, 300, "NO_COVERAGE")]
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.data = {"work_bam": os.path.join(DATA_DIR, "reads.bam"),
+                     "sam_ref": os.path.join(DATA_DIR, "ref.fa"), "config": {}}
+        self.orig_window = callable._DEPTH_WINDOW
+
+    def tearDown(self):
+        callable._DEPTH_WINDOW = self.orig_window
+        shutil.rmtree(self.work_dir)
+
+    def _states(self, region=None, max_depth=3):
+        out_file = os.path.join(self.work_dir, "callable.bed")
+        callable._calc_callable_native(self.data, region, max_depth, out_file)
+        with open(out_file) as in_handle:
+            parts = [l.rstrip().split("\t") for l in in_handle]
+        self.assertEqual(set(x[0] for x in parts), set(["chr1"]))
+        return [(int(s), int(e), state) for _, s, e, state in parts]
+
+    def test_states(self):
+        """Boundaries of each state, with excessive coverage at max_depth.
+
+        Deletions count as coverage (90-112) while skipped regions of spliced
+        reads (160-210) and duplicates (250-270) do not.
+        """
+        self.assertEqual(self._states(), self.expected)
+
+    def test_excessive_depth(self):
+        states = self._states(max_depth=4)
+        self.assertEqual(states[1], (10, 50, "CALLABLE"))
+
+    def test_window_edges(self):
+        """Runs crossing window edges, at 100 and 200, join into a single run.
+        """
+        callable._DEPTH_WINDOW = 100
+        self.assertEqual(self._states(), self.expected)
+        callable._DEPTH_WINDOW = 7
+        self.assertEqual(self._states(), self.expected)
+
+    def test_region(self):
+        self.assertEqual(self._states(("chr1", 100, 215)),
+                         [(100, 112, "CALLABLE"), (112, 125, "NO_COVERAGE"),
+                          (125, 130, "CALLABLE"), (130, 140, "REF_N"), (140, 145, "CALLABLE"),
+                          (145, 150, "NO_COVERAGE"), (150, 160, "CALLABLE"),
+                          (160, 210, "NO_COVERAGE"), (210, 215, "CALLABLE")])
+
+class CostPickerTest(unittest.TestCase):
+    """Split points chosen from no coverage blocks every 1kb along a 100kb chromosome.
+    """
+    def setUp(self):
+        self.ref_regions = intervals.Intervals.from_tuples([("chr1", 0, 100000)])
+        self.nblocks = intervals.Intervals.from_tuples([("chr1", i + 400, i + 600)
+                                                        for i in range(0, 100000, 1000)])
+        self.config = {"algorithm": {"nomap_split_targets": 10}}
+
+    def _splits(self, histogram):
+        picker = callable.NBlockRegionPicker(self.ref_regions, self.config, histogram)
+        return [r.start for r in self.nblocks if picker.include_block(r)]
+
+    def test_uniform_spacing(self):
+        self.assertEqual(self._splits(None), range(10400, 100000, 11000))
+
+    def test_cost_spacing(self):
+        """The first 20kb holds 80% of callable bases and gets split more finely.
+        """
+        bounds = numpy.arange(0, 100001, 10000)
+        counts = [40000, 40000] + [2500] * 8
+        histogram = {"chr1": (bounds, numpy.concatenate([[0], numpy.cumsum(counts)]))}
+        self.assertEqual(self._splits(histogram),
+                         [3400, 6400, 9400, 12400, 15400, 18400, 38400, 79400])
+
+class BatchRegionsTest(unittest.TestCase):
+    """Batches of 100bp fully callable regions spaced every 200bp.
+    """
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.callable_bed = os.path.join(self.work_dir, "callable.bed")
+        with open(self.callable_bed, "w") as out_handle:
+            out_handle.write("chr1\t0\t2000\tCALLABLE\n")
+        self.regions = intervals.Intervals.from_tuples([("chr1", i, i + 100)
+                                                        for i in range(0, 2000, 200)])
+        self.samples = [{"regions": {"callable": self.callable_bed}}]
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def _batches(self, ec_regions, targets):
+        config = {"algorithm": {"nomap_batch_targets": targets}}
+        batches = callable._batch_regions_by_cost(self.regions, ec_regions, self.samples, config)
+        return [(r.chrom, r.start, r.stop) for r in batches]
+
+    def test_batch_by_cost(self):
+        """Batches reach half the total cost and never span excessive coverage at 1120-1190.
+        """
+        ec_regions = intervals.Intervals.from_tuples([("chr1", 1150, 1190), ("chr1", 1120, 1130)])
+        self.assertEqual(self._batches(ec_regions, 2),
+                         [("chr1", 0, 900), ("chr1", 1000, 1100), ("chr1", 1200, 1900)])
+
+    def test_few_regions(self):
+        self.assertEqual(self._batches(intervals.Intervals(), 10),
+                         [(r.chrom, r.start, r.stop) for r in self.regions])
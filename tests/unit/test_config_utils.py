@@ -0,0 +1,58 @@
+"""Tests for cached jar and program lookups from configuration.
+"""
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from bcbio.pipeline import config_utils
+
+class LookupCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.orig_path = os.environ["PATH"]
+        self.orig_glob = config_utils.glob.glob
+        config_utils._jar_cache.clear()
+        config_utils._program_cache.clear()
+
+    def tearDown(self):
+        os.environ["PATH"] = self.orig_path
+        config_utils.glob.glob = self.orig_glob
+        config_utils._jar_cache.clear()
+        config_utils._program_cache.clear()
+        shutil.rmtree(self.work_dir)
+
+    def _touch(self, fname, mtime=None):
+        open(fname, "w").close()
+        if mtime:
+            os.utime(os.path.dirname(fname), (mtime, mtime))
+        return fname
+
+    def test_get_jar_cached_until_directory_changes(self):
+        jar = self._touch(os.path.join(self.work_dir, "GenomeAnalysisTK-3.1.jar"), 1000)
+        calls = []
+        def _glob(pattern):
+            calls.append(pattern)
+            return self.orig_glob(pattern)
+        config_utils.glob.glob = _glob
+        self.assertEqual(config_utils.get_jar("GenomeAnalysisTK", self.work_dir), jar)
+        self.assertEqual(config_utils.get_jar("GenomeAnalysisTK", self.work_dir), jar)
+        self.assertEqual(len(calls), 1)
+        self._touch(os.path.join(self.work_dir, "GenomeAnalysisTK-3.2.jar"), 2000)
+        self.assertRaises(ValueError, config_utils.get_jar, "GenomeAnalysisTK", self.work_dir)
+        self.assertEqual(len(calls), 2)
+
+    def test_get_program_cached_by_path(self):
+        bin_dir = os.path.join(self.work_dir, "bin")
+        os.makedirs(bin_dir)
+        program = self._touch(os.path.join(bin_dir, "bcbio-test-program"))
+        os.chmod(program, stat.S_IRWXU)
+        os.environ["PATH"] = "%s:%s" % (bin_dir, self.orig_path)
+        self.assertEqual(config_utils.get_program("bcbio-test-program", {}), program)
+        os.remove(program)
+        self.assertEqual(config_utils.get_program("bcbio-test-program", {}), program)
+        os.environ["PATH"] = self.orig_path
+        self.assertRaises(config_utils.CmdNotFound, config_utils.get_program,
+                          "bcbio-test-program", {})
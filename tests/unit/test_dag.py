@@ -0,0 +1,46 @@
+"""Tests for dependency aware scheduling of pipeline steps.
+"""
+import threading
+import time
+import unittest
+
+from bcbio.distributed import dag
+
+class DagTest(unittest.TestCase):
+
+    def test_dependency_outputs(self):
+        graph = dag.Graph()
+        graph.add("a", lambda: 1)
+        graph.add("b", lambda: 2)
+        graph.add("c", lambda a, b: a + b, ["a", "b"])
+        graph.add("d", lambda c, a: c * 10 + a, ["c", "a"])
+        out = graph.run()
+        self.assertEqual(out["c"], 3)
+        self.assertEqual(out["d"], 31)
+
+    def test_missing_dependency(self):
+        graph = dag.Graph()
+        self.assertRaises(ValueError, graph.add, "b", lambda a: a, ["a"])
+
+    def test_error_propagation(self):
+        graph = dag.Graph()
+        graph.add("a", lambda: 1 / 0)
+        graph.add("b", lambda a: a, ["a"])
+        self.assertRaises(ZeroDivisionError, graph.run)
+
+    def test_no_stage_barrier(self):
+        """A slow sample does not hold up later steps for other samples.
+        """
+        fast_done = threading.Event()
+        def run_parallel(fn_name, items):
+            if items[0]["name"] == "slow" and fn_name == "align":
+                fast_done.wait(10)
+            elif items[0]["name"] == "fast" and fn_name == "call":
+                fast_done.set()
+            return [dict(items[0], **{fn_name: time.time()})]
+        samples = [{"name": "slow"}, {"name": "fast"}]
+        out = dag.run_sample_chains(samples, ["align", "call"], run_parallel)
+        self.assertEqual([x["name"] for x in out], ["slow", "fast"])
+        self.assertTrue(fast_done.is_set())
+        fast, slow = out[1], out[0]
+        self.assertTrue(fast["call"] <= slow["call"])
@@ -0,0 +1,71 @@
+"""Tests for recording diagnostics channel records in a SQLite database.
+"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from bcbio import log
+from bcbio.log import diagnosticsdb
+from bcbio.provenance import diagnostics
+
+class DiagnosticsDbTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.config = {"log_dir": self.work_dir}
+        self.db_file = os.path.join(self.work_dir, "%s-diagnostics.db" % log.LOG_NAME)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def _log_diagnostics(self, handler):
+        handler.push_thread()
+        try:
+            cmd_id = diagnostics.start_cmd("Align", {"name": ["", "S1"], "config": {}},
+                                           ["bwa", "mem", "ref.fa"])
+            diagnostics.end_cmd(cmd_id, usage={"cpu": 2.5, "maxrss": 1.5,
+                                               "processes": [{"name": "bwa"}]})
+            diagnostics.end_parallel("align", {"type": "local", "num_jobs": 2,
+                                               "cores_per_job": 4}, time.time())
+            diagnostics.record_escalation("bwa", "chr1:0-100", 2.0, 0.5)
+            log.logger_diagnostics.info("not json")
+            log.logger_diagnostics.info('{"event": "unknown"}')
+        finally:
+            handler.pop_thread()
+            handler.close()
+
+    def test_tables(self):
+        self._log_diagnostics(log._create_log_handler(self.config, diagnostics_db=True))
+        conn = diagnosticsdb.connect(self.db_file)
+        commands = [dict(x) for x in conn.execute("SELECT * FROM commands")]
+        self.assertEqual(len(commands), 1)
+        self.assertEqual((commands[0]["program"], commands[0]["sample"], commands[0]["cmd"]),
+                         ("bwa", "S1", "bwa mem ref.fa"))
+        self.assertEqual((commands[0]["cpu"], commands[0]["maxrss"], commands[0]["succeeded"]),
+                         (2.5, 1.5, 1))
+        self.assertEqual(commands[0]["processes"], '[{"name": "bwa"}]')
+        parallel = [dict(x) for x in conn.execute("SELECT * FROM parallel")]
+        self.assertEqual([(x["name"], x["type"], x["cores"]) for x in parallel],
+                         [("align", "local", 8)])
+        escalation = [dict(x) for x in conn.execute("SELECT * FROM escalation")]
+        self.assertEqual([(x["program"], x["region"], x["memory_scale"], x["cores_scale"])
+                          for x in escalation],
+                         [("bwa", "chr1:0-100", 2.0, 0.5)])
+        conn.close()
+
+    def test_not_opened_in_workers(self):
+        """Wrapped single core workers and multicore workers do not write the database.
+        """
+        handler = log.setup_local_logging(self.config, {"cores": 1, "wrapper": "runfn"})
+        self.assertFalse(any(isinstance(x, diagnosticsdb.SQLiteDiagnosticsHandler)
+                             for x in handler.objects))
+        handler.pop_thread()
+        self._log_diagnostics(handler)
+        self.assertFalse(os.path.exists(self.db_file))
+        handler = log.setup_local_logging(self.config, {"cores": 2})
+        handler.pop_thread()
+        self.assertFalse(isinstance(handler, diagnosticsdb.SQLiteDiagnosticsHandler))
+        self.assertFalse(any(isinstance(x, diagnosticsdb.SQLiteDiagnosticsHandler)
+                             for x in getattr(handler, "objects", [])))
@@ -0,0 +1,63 @@
+"""Tests for adjusting resources of external commands retried after memory errors.
+"""
+import unittest
+
+from bcbio.provenance import do
+
+class MemoryRetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cmd = ["java", "-Xms750m", "-Xmx2g", "-jar", "GenomeAnalysisTK.jar",
+                    "-T", "UnifiedGenotyper", "-nt", "4"]
+
+    def test_escalate_memory_to_limit(self):
+        memory, cores = 1.0, 1.0
+        for _ in range(5):
+            memory, cores = do._next_escalation(self.cmd, memory, cores, 5.0)
+        cmd, _, _ = do._escalate_cmd(self.cmd, memory, cores, 5.0)
+        self.assertEqual(cmd[2], "-Xmx4608m")
+        self.assertEqual(cmd[-1], "1")
+
+    def test_piped_command(self):
+        cmd = "bwa mem ref.fa in.fq | java -Xmx1500m -jar picard.jar > out.bam"
+        out, memory, _ = do._escalate_cmd(cmd, 8.0, 1.0, 5.0)
+        self.assertTrue(1.0 < memory < 8.0)
+        self.assertTrue("-Xmx4608m" in out)
+
+    def test_unknown_limit_reduces_threads(self):
+        """Without a job memory limit, retries keep the heap and reduce threads.
+        """
+        memory, cores = do._next_escalation(self.cmd, 1.0, 1.0, None)
+        self.assertEqual((memory, cores), (1.0, 0.5))
+        cmd, _, _ = do._escalate_cmd(self.cmd, 2.0, cores, None)
+        self.assertEqual(cmd[2], "-Xmx2048m")
+        self.assertEqual(cmd[-1], "2")
+
+    def test_job_memory_limit(self):
+        self.assertEqual(do._job_memory_limit({"config": {"parallel": {"mem": "3.5"}}}), 3.5)
+        self.assertEqual(do._job_memory_limit({"config": {"algorithm": {}}}), None)
+
+class WaitTest(unittest.TestCase):
+
+    def setUp(self):
+        self.orig_wait4 = do.os.wait4
+
+    def tearDown(self):
+        do.os.wait4 = self.orig_wait4
+
+    def test_retry_interrupted_wait(self):
+        calls = []
+        def _wait4(pid, options):
+            calls.append(pid)
+            if len(calls) < 3:
+                raise OSError(do.errno.EINTR, "Interrupted system call")
+            return pid, 0, None
+        do.os.wait4 = _wait4
+        self.assertEqual(do._wait4(10), (10, 0, None))
+        self.assertEqual(calls, [10, 10, 10])
+
+    def test_other_wait_errors(self):
+        def _wait4(pid, options):
+            raise OSError(do.errno.ECHILD, "No child processes")
+        do.os.wait4 = _wait4
+        self.assertRaises(OSError, do._wait4, 10)
@@ -0,0 +1,55 @@
+"""Tests for draining external command output to log files.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from bcbio.provenance import drain
+
+class OutputDrainTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.out_file = os.path.join(self.work_dir, "command.log")
+        self.logged = []
+        self.orig_time = drain.time.time
+        self.now = 0.0
+        drain.time.time = lambda: self.now
+
+    def tearDown(self):
+        drain.time.time = self.orig_time
+        shutil.rmtree(self.work_dir)
+
+    def _drain(self, lines, **kwargs):
+        in_handle = StringIO("".join(lines))
+        output_drain = drain.OutputDrain(in_handle, self.out_file, self.logged.append, **kwargs)
+        tail = output_drain.start().wait()
+        self.assertTrue(in_handle.closed)
+        return tail
+
+    def test_rotate_output_file(self):
+        lines = ["line %s\n" % i for i in range(10)]
+        self._drain(lines, max_bytes=30)
+        with open(self.out_file + ".1") as in_handle:
+            rotated = in_handle.read()
+        with open(self.out_file) as in_handle:
+            current = in_handle.read()
+        self.assertTrue(len(rotated) <= 30 and len(current) <= 30)
+        self.assertEqual(current, "".join(lines[-len(current.splitlines()):]))
+
+    def test_bounded_tail(self):
+        lines = ["line %s\n" % i for i in range(drain.TAIL_SIZE * 3)]
+        tail = self._drain(lines)
+        self.assertEqual(tail, lines[-drain.TAIL_SIZE:])
+        with open(self.out_file) as in_handle:
+            self.assertEqual(in_handle.readlines(), lines)
+
+    def test_rate_limited_logging(self):
+        lines = ["line %s\n" % i for i in range(25)]
+        tail = self._drain(lines, rate=5)
+        self.assertEqual(self.logged[:5], [x.rstrip() for x in lines[:5]])
+        self.assertEqual(len(self.logged), 6)
+        self.assertTrue(self.logged[-1].startswith("20 output lines not logged"))
+        self.assertEqual(tail, lines)
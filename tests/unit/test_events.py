@@ -0,0 +1,59 @@
+"""Tests for machine readable events tracking progress of a run.
+"""
+import json
+import unittest
+
+from bcbio.provenance import events
+
+class _Capture:
+    def __init__(self):
+        self.msgs = []
+
+    def debug(self, msg):
+        self.msgs.append(msg)
+
+    def info(self, msg):
+        pass
+
+class EventsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.orig_loggers = (events.logger, events.logger_events)
+        self.orig_stage = events._current_stage[0]
+        events.logger, events.logger_events = _Capture(), _Capture()
+        events._current_stage[0] = None
+
+    def tearDown(self):
+        events.logger, events.logger_events = self.orig_loggers
+        events._current_stage[0] = self.orig_stage
+
+    def _events(self):
+        return [json.loads(x) for x in events.logger_events.msgs]
+
+    def test_task_fields_from_args(self):
+        data = {"name": ["", "s1"], "region": ("chr1", 0, 100),
+                "config": {"algorithm": {"num_cores": 4}},
+                "provenance": {"entity": "run.s1.variantcall_sample.0"}}
+        events.task("task_dispatch", None, ["ref.fa", data])
+        events.task("task_start", "piped_bamprep", [data], cores=2)
+        dispatch, start = self._events()
+        self.assertEqual(dispatch["event"], "task_dispatch")
+        self.assertEqual((dispatch["fn"], dispatch["sample"], dispatch["region"], dispatch["cores"]),
+                         ("variantcall_sample", "s1", "chr1:0-100", 4))
+        self.assertEqual((start["fn"], start["cores"]), ("piped_bamprep", 2))
+        self.assertTrue("time" in start and "host" in start)
+
+    def test_task_without_data(self):
+        events.task("task_start", "combine_bam", [["a.bam", "b.bam"], "out.bam"])
+        out = self._events()[0]
+        self.assertEqual((out["fn"], out["sample"], out["region"], out["cores"]),
+                         ("combine_bam", None, None, 1))
+
+    def test_stage_closes_previous(self):
+        events.stage("alignment")
+        events.stage("variantcalling")
+        events.stage("finished")
+        self.assertEqual([(x["event"], x["stage"]) for x in self._events()],
+                         [("stage_start", "alignment"), ("stage_end", "alignment"),
+                          ("stage_start", "variantcalling"), ("stage_end", "variantcalling")])
+        self.assertEqual(events._current_stage[0], None)
@@ -0,0 +1,31 @@
+"""Tests for in memory interval operations on genomic regions.
+"""
+import unittest
+
+from bcbio.pipeline import intervals
+
+class IntervalsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.a = intervals.Intervals.from_tuples([("chr1", 0, 100), ("chr1", 50, 150),
+                                                  ("chr1", 200, 300), ("chr2", 10, 20)])
+        self.b = intervals.Intervals.from_tuples([("chr1", 120, 250), ("chr2", 30, 40)])
+
+    def test_merge_overlapping(self):
+        self.assertEqual(list(self.a), [("chr1", 0, 150), ("chr1", 200, 300), ("chr2", 10, 20)])
+        self.assertEqual(list(self.a.merge(d=50)), [("chr1", 0, 300), ("chr2", 10, 20)])
+
+    def test_union(self):
+        self.assertEqual(list(self.a.union(self.b)),
+                         [("chr1", 0, 300), ("chr2", 10, 20), ("chr2", 30, 40)])
+
+    def test_intersect(self):
+        c = intervals.Intervals.from_tuples([("chr1", 130, 210)])
+        self.assertEqual(list(self.a.intersect(self.b)), [("chr1", 120, 150), ("chr1", 200, 250)])
+        self.assertEqual(list(intervals.intersect([self.a, self.b, c])),
+                         [("chr1", 130, 150), ("chr1", 200, 210)])
+
+    def test_subtract(self):
+        self.assertEqual(list(self.a.subtract(self.b)),
+                         [("chr1", 0, 120), ("chr1", 250, 300), ("chr2", 10, 20)])
+        self.assertEqual(self.a.subtract(self.a).total_size(), 0)
@@ -0,0 +1,79 @@
+"""Tests for speculative re-running of straggling tasks on IPython clusters.
+"""
+import itertools
+import threading
+import time
+import unittest
+
+from bcbio.distributed import ipython
+
+class _Result:
+    def __init__(self, view, msg_id):
+        self._view = view
+        self.msg_ids = [msg_id]
+        self.metadata = {}
+
+    def ready(self):
+        return self.msg_ids[0] in self._view.done
+
+    def successful(self):
+        return self.ready()
+
+    def get(self):
+        return [self.msg_ids[0]]
+
+    def abort(self):
+        pass
+
+class _View:
+    """Minimal load balanced view, with tasks finished and running as set by the test.
+    """
+    def __init__(self):
+        self.client = self
+        self.done = set([])
+        self.running = set([])
+        self.launched = []
+        self._ids = itertools.count()
+
+    def apply_async(self, fn, args):
+        msg_id = "%s-%s" % (args[0], next(self._ids))
+        self.launched.append((args[0], time.time()))
+        if len([x for x, _ in self.launched if x == args[0]]) > 1:
+            self.done.add(msg_id)
+        return _Result(self, msg_id)
+
+    def queue_status(self, verbose=False):
+        return {0: {"tasks": list(self.running), "queue": [], "completed": []},
+                "unassigned": []}
+
+def _task(args):
+    return args
+
+class SpeculativeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.orig = (ipython._SPECULATE_MIN_SECONDS, ipython._POLL_INTERVAL)
+        ipython._SPECULATE_MIN_SECONDS = 0.2
+        ipython._POLL_INTERVAL = 0.01
+
+    def tearDown(self):
+        ipython._SPECULATE_MIN_SECONDS, ipython._POLL_INTERVAL = self.orig
+
+    def test_straggler_time_from_task_start(self):
+        """Tasks waiting in the queue do not count as running when finding stragglers.
+        """
+        view = _View()
+        view.done.update("%s-%s" % (i, i) for i in range(9))
+        def _start_last():
+            time.sleep(0.3)
+            view.running.add("9-9")
+        started = time.time()
+        starter = threading.Thread(target=_start_last)
+        starter.start()
+        out = list(ipython._iter_speculative(view, _task, [[i] for i in range(10)],
+                                             threading.Lock()))
+        starter.join()
+        self.assertEqual(sorted(i for i, _ in out), range(10))
+        retries = [t for args, t in view.launched if args == 9][1:]
+        self.assertEqual(len(retries), 1)
+        self.assertTrue(retries[0] - started >= 0.5)
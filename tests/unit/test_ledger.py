@@ -0,0 +1,50 @@
+"""Tests for the ledger of finished parallel tasks used when restarting runs.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from bcbio.distributed import ledger
+
+class LedgerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.task_ledger = ledger.TaskLedger(os.path.join(self.work_dir, "tasks.db"), self.work_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_reuse_finished(self):
+        out_file = os.path.join(self.work_dir, "s1.bam")
+        with open(out_file, "w") as out_handle:
+            out_handle.write("bam")
+        items = [[{"name": "s1", "provenance": {"entity": "a.0"}}],
+                 [{"name": "s2", "provenance": {"entity": "a.1"}}]]
+        finished, to_run = self.task_ledger.split_finished("align", items)
+        self.assertEqual(finished, [])
+        self.assertEqual(len(to_run), 2)
+        self.task_ledger.record("align", to_run[0][0], [[{"name": "s1", "work_bam": out_file}]])
+        # entity tracking differs between runs and does not affect reuse
+        items[0][0]["provenance"]["entity"] = "b.1"
+        finished, to_run = self.task_ledger.split_finished("align", items)
+        self.assertEqual(finished, [(0, [[{"name": "s1", "work_bam": out_file}]])])
+        self.assertEqual([x for _, x in to_run], [items[1]])
+        finished, to_run = self.task_ledger.split_finished("call", items)
+        self.assertEqual(len(to_run), 2)
+
+    def test_missing_outputs(self):
+        items = [[{"name": "s1"}]]
+        _, to_run = self.task_ledger.split_finished("align", items)
+        self.task_ledger.record("align", to_run[0][0],
+                                [[{"work_bam": os.path.join(self.work_dir, "missing.bam")}]])
+        finished, to_run = self.task_ledger.split_finished("align", items)
+        self.assertEqual(finished, [])
+        self.assertEqual(len(to_run), 1)
+
+    def test_combine_in_input_order(self):
+        finished = [(1, [{"name": "s2"}])]
+        outputs = [[{"name": "s1"}], None, [{"name": "s4"}, {"name": "s4b"}]]
+        self.assertEqual([x["name"] for x in ledger.combine_outputs(finished, outputs)],
+                         ["s1", "s2", "s4", "s4b"])
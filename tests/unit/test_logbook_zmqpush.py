@@ -0,0 +1,57 @@
+"""Tests for sending log records in batches through ZeroMQ.
+"""
+import unittest
+
+import logbook
+
+from bcbio.log import logbook_zmqpush
+
+class _FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, msg, *args):
+        self.sent.append(msg)
+
+    def close(self, *args, **kwargs):
+        pass
+
+class UnpackRecordsTest(unittest.TestCase):
+
+    def _handler(self, **kwargs):
+        handler = logbook_zmqpush.ZeroMQPushHandler(hostname=False, **kwargs)
+        handler.socket.close()
+        handler.socket = _FakeSocket()
+        return handler
+
+    def _emit(self, handler, msgs):
+        for msg in msgs:
+            handler.emit(logbook.LogRecord("bcbio", logbook.INFO, msg))
+        handler.flush()
+        sent = handler.socket.sent
+        handler.close()
+        return sent
+
+    def _unpack(self, sent):
+        return [r.msg for msg in sent for r in logbook_zmqpush.unpack_records(msg)]
+
+    def test_single_record(self):
+        sent = self._emit(self._handler(batch_size=1), ["one", "two"])
+        self.assertEqual(len(sent), 2)
+        self.assertEqual(self._unpack(sent), ["one", "two"])
+
+    def test_batched_records(self):
+        msgs = ["record %s" % i for i in range(5)]
+        sent = self._emit(self._handler(batch_size=2, compress=False), msgs)
+        self.assertEqual(len(sent), 3)
+        self.assertTrue(sent[0].startswith("["))
+        self.assertEqual(self._unpack(sent), msgs)
+
+    def test_compressed_records(self):
+        msgs = ["record %s" % i for i in range(5)]
+        sent = self._emit(self._handler(batch_size=10), msgs)
+        self.assertEqual(len(sent), 1)
+        self.assertTrue(sent[0].startswith(logbook_zmqpush._COMPRESSED))
+        records = logbook_zmqpush.unpack_records(sent[0])
+        self.assertEqual([r.msg for r in records], msgs)
+        self.assertEqual(set(r.channel for r in records), set(["bcbio"]))
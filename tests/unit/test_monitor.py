@@ -0,0 +1,57 @@
+"""Tests for adjusting local task dispatch from machine memory and load.
+"""
+import collections
+import unittest
+
+from bcbio.distributed import monitor
+
+_Memory = collections.namedtuple("_Memory", "available total")
+
+class _FakePsutil:
+    NUM_CPUS = 4
+
+    def __init__(self):
+        self.available = 60.0
+
+    def virtual_memory(self):
+        return _Memory(self.available, 100.0)
+
+class NodeMonitorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.orig_psutil = monitor.psutil
+        self.orig_getloadavg = monitor.os.getloadavg
+        self.orig_time = monitor.time.time
+        monitor.psutil = _FakePsutil()
+        self.load = 1.0
+        self.now = 1000.0
+        monitor.os.getloadavg = lambda: (self.load, self.load, self.load)
+        monitor.time.time = lambda: self.now
+
+    def tearDown(self):
+        monitor.psutil = self.orig_psutil
+        monitor.os.getloadavg = self.orig_getloadavg
+        monitor.time.time = self.orig_time
+
+    def test_can_start(self):
+        node = monitor.get_monitor({"resources": {"monitor": {"min_free_memory": 0.2}}})
+        self.assertTrue(node.can_start())
+        monitor.psutil.available = 15.0
+        self.assertFalse(node.can_start())
+
+    def test_is_underused(self):
+        node = monitor.NodeMonitor()
+        self.assertTrue(node.is_underused())
+        self.load = 3.0
+        self.assertFalse(node.is_underused())
+        self.load = 1.0
+        monitor.psutil.available = 40.0
+        self.assertFalse(node.is_underused())
+
+    def test_underused_after_ramp_time(self):
+        node = monitor.NodeMonitor()
+        node.started()
+        self.assertFalse(node.is_underused())
+        self.now += monitor._RAMP_TIME + 1
+        self.assertTrue(node.is_underused())
+        self.assertEqual(node.num_extra_jobs(6), 2)
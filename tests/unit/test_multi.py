@@ -0,0 +1,305 @@
+"""Tests for running tasks in parallel on the local machine.
+"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import logbook
+
+from bcbio import log, utils
+from bcbio.distributed import executor, multi, prun
+from bcbio.pipeline import config_utils
+
+def _config():
+    return {"algorithm": {"num_cores": 2}, "resources": {}}
+
+def _inner(args):
+    data = args[0]
+    return [dict(data, pid=os.getpid())]
+
+def _outer(args):
+    """Run a nested parallel step from within a pool worker.
+    """
+    data = args[0]
+    parallel = {"type": "local", "cores": 2}
+    with prun.start(parallel, [[data]], data["config"]) as run_parallel:
+        out = run_parallel("_inner", [[dict(data, i=i)] for i in range(2)])
+    return [dict(data, outer_pid=os.getpid(), inner=out)]
+
+def _update_config(args):
+    """Update nested configuration, like tasks adjusting resources for a region.
+    """
+    data = args[0]
+    seen = (data["config"]["algorithm"].get("region"),
+            data["config"]["resources"].get("gatk", {}).get("region"))
+    data["config"]["algorithm"]["region"] = data["name"]
+    data["config"]["resources"].setdefault("gatk", {})["region"] = data["name"]
+    return [{"name": data["name"], "seen": seen}]
+
+def variantcall_sample(args):
+    return _inner(args)
+
+def _symlink_outputs(args):
+    data = args[0]
+    for i in range(25):
+        utils.symlink_plus(data["orig"], os.path.join(data["out_dir"], "%s-%s.vcf" % (data["name"], i)))
+    return [dict(data, cwd=os.getcwd())]
+
+def concat_variant_files(args):
+    return _symlink_outputs(args)
+
+def combine_variant_files(args):
+    return _symlink_outputs(args)
+
+class PoolRunnerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.orig_get_fn = multi.get_fn
+        multi.get_fn = lambda fn_name, parallel: globals()[fn_name]
+        self.items = [[{"name": name, "config": _config()}] for name in ["s1", "s2"]]
+
+    def tearDown(self):
+        multi.get_fn = self.orig_get_fn
+
+    def test_nested_start(self):
+        """Nested parallel steps within pool workers run serially in the worker.
+        """
+        parallel = {"type": "local", "cores": 2}
+        items = [[{"name": name, "config": _config()}] for name in ["s1", "s2"]]
+        with prun.start(parallel, items, _config()) as run_parallel:
+            out = run_parallel("_outer", items)
+        self.assertEqual([x["name"] for x in out], ["s1", "s2"])
+        for x in out:
+            self.assertNotEqual(x["outer_pid"], os.getpid())
+            self.assertEqual([y["i"] for y in x["inner"]], [0, 1])
+            self.assertEqual(set(y["pid"] for y in x["inner"]), set([x["outer_pid"]]))
+
+    def test_resume_in_input_order(self):
+        """Outputs of tasks finished in a previous run get returned in the order of inputs.
+        """
+        work_dir = tempfile.mkdtemp()
+        try:
+            names = ["s1", "s2", "s3", "s4"]
+            items = [[{"name": name, "config": _config()}] for name in names]
+            for executor_type in [None, "processes", "threads"]:
+                parallel = {"type": "local", "cores": 2}
+                if executor_type:
+                    parallel["executor"] = executor_type
+                dirs = {"work": os.path.join(work_dir, executor_type or "pool")}
+                outs = []
+                for i, cur_items in enumerate([items[1::2], items]):
+                    with prun.start(parallel, cur_items, _config(), dirs, "inner%s" % i) as run_parallel:
+                        outs.append(run_parallel("_inner", cur_items))
+                    self.assertEqual([x["name"] for x in outs[-1]], [x[0]["name"] for x in cur_items])
+                self.assertEqual([x["pid"] for x in outs[1][1::2]], [x["pid"] for x in outs[0]])
+        finally:
+            shutil.rmtree(work_dir)
+
+    def test_in_process_tasks_copy_shared_config(self):
+        """Tasks run in the current process do not see updates from others to shared sections.
+        """
+        config = dict(_config(), resources={"gatk": {"jvm_opts": ["-Xmx2g"]}})
+        items = [[{"name": name, "config": config}] for name in ["r1", "r2", "r3"]]
+        for cores, executor_type in [(1, None), (2, "threads")]:
+            parallel = {"type": "local", "cores": cores}
+            if executor_type:
+                parallel["executor"] = executor_type
+            with prun.start(parallel, items, _config()) as run_parallel:
+                out = run_parallel("_update_config", items)
+            self.assertEqual([x["seen"] for x in out], [(None, None)] * 3)
+            self.assertEqual(config["resources"], {"gatk": {"jvm_opts": ["-Xmx2g"]}})
+            self.assertFalse("region" in config["algorithm"])
+        args = config_utils.add_cores_to_config(items[0], 2)
+        args[0]["config"]["resources"]["gatk"]["region"] = "r1"
+        self.assertEqual(config["resources"], {"gatk": {"jvm_opts": ["-Xmx2g"]}})
+
+    def test_dispatch_events_logged(self):
+        """Dispatch events from the scheduler thread reach handlers of the caller.
+        """
+        handler = logbook.TestHandler()
+        parallel = {"type": "local", "num_jobs": 2, "cores_per_job": 1}
+        handler.push_thread()
+        try:
+            with multi.pool_runner(parallel, _config()) as run_parallel:
+                run_parallel("_inner", self.items)
+        finally:
+            handler.pop_thread()
+        dispatched = [r for r in handler.records if r.channel == log.logger_events.name
+                      and '"task_dispatch"' in r.message]
+        self.assertEqual(len(dispatched), 2)
+
+    def test_single_job_in_process(self):
+        parallel = {"type": "local", "cores": 1}
+        items = [[{"name": "s1", "config": _config()}]]
+        with prun.start(parallel, items, _config()) as run_parallel:
+            out = run_parallel("_inner", items)
+        self.assertEqual(out[0]["pid"], os.getpid())
+        self.assertTrue(float(out[0]["config"]["parallel"]["mem"]) > 0)
+
+    def test_threads_executor_allowed_tasks(self):
+        """Only tasks safe to share the working directory run in threads.
+        """
+        parallel = {"type": "local", "cores": 2, "executor": "threads"}
+        with prun.start(parallel, self.items, _config()) as run_parallel:
+            threaded = run_parallel("variantcall_sample", self.items)
+            other = run_parallel("_inner", self.items)
+        self.assertIn("variantcall_sample", executor.THREAD_SAFE_TASKS)
+        self.assertEqual(set(x["pid"] for x in threaded), set([os.getpid()]))
+        self.assertNotIn(os.getpid(), [x["pid"] for x in other])
+
+    def test_threads_concurrent_symlinks(self):
+        """Thread safe tasks creating symlinks at the same time link the right files.
+        """
+        work_dir = tempfile.mkdtemp()
+        try:
+            items = {}
+            for fn_name in ["concat_variant_files", "combine_variant_files"]:
+                orig = os.path.join(utils.safe_makedir(os.path.join(work_dir, fn_name, "orig")),
+                                    "in.vcf")
+                with open(orig, "w") as out_handle:
+                    out_handle.write(fn_name)
+                out_dir = os.path.join(work_dir, fn_name, "out")
+                items[fn_name] = [[{"name": "s%s" % i, "config": _config(), "orig": orig,
+                                    "out_dir": out_dir}] for i in range(4)]
+            cwd = os.getcwd()
+            parallel = {"type": "local", "cores": 4, "executor": "threads"}
+            with prun.start(parallel, self.items, _config()) as run_parallel:
+                submitted = [run_parallel.submit(fn_name, xs) for fn_name, xs in items.items()]
+                out = [data for fs in submitted for f in fs for data in f.result()]
+            self.assertEqual(os.getcwd(), cwd)
+            self.assertEqual(set(x["cwd"] for x in out), set([cwd]))
+            for fn_name in items:
+                out_dir = os.path.join(work_dir, fn_name, "out")
+                links = os.listdir(out_dir)
+                self.assertEqual(len(links), 4 * 25)
+                for fname in links:
+                    link = os.path.join(out_dir, fname)
+                    self.assertFalse(os.path.isabs(os.readlink(link)))
+                    with open(link) as in_handle:
+                        self.assertEqual(in_handle.read(), fn_name)
+        finally:
+            shutil.rmtree(work_dir)
+
+def _task_cores(args):
+    data = args[0]
+    return [{"name": data["name"], "cores": data["config"]["algorithm"]["num_cores"]}]
+
+class _FakeResult:
+    def __init__(self, value):
+        self.value = value
+        self.finished = False
+
+    def ready(self):
+        return self.finished
+
+    def get(self, timeout=None):
+        return self.value
+
+class _FakePool:
+    """Record tasks started by the scheduler, finishing them on request.
+    """
+    def __init__(self):
+        self.started = []
+
+    def apply_async(self, fn, args, callback=None):
+        _, task_args, cores, _ = args
+        result = _FakeResult([{"name": task_args[0]["name"], "cores": cores}])
+        self.started.append((task_args[0]["name"], cores, result))
+        return result
+
+class _FakeMonitor:
+    def __init__(self):
+        self.available = True
+
+    def can_start(self):
+        return self.available
+
+    def is_underused(self):
+        return False
+
+    def free_memory(self):
+        return 0.05
+
+    def started(self):
+        pass
+
+class CoreSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.orig_poll = multi._POLL_INTERVAL
+        multi._POLL_INTERVAL = 0.01
+        self.pool = _FakePool()
+
+    def tearDown(self):
+        multi._POLL_INTERVAL = self.orig_poll
+
+    def _wait_started(self, count):
+        for _ in range(500):
+            if len(self.pool.started) >= count:
+                break
+            time.sleep(0.01)
+        time.sleep(0.05)
+        self.assertEqual(len(self.pool.started), count)
+
+    def _finish(self, scheduler, names):
+        for name, _, result in self.pool.started:
+            if name in names:
+                result.finished = True
+        scheduler._notify()
+
+    def _submit(self, scheduler, names):
+        return [scheduler.submit(_task_cores, [{"name": name, "config": _config()}])
+                for name in names]
+
+    def test_core_budget_and_idle_cores(self):
+        """Tasks start within the core budget and the last task uses freed cores.
+        """
+        scheduler = multi._CoreScheduler(self.pool, {"num_jobs": 2, "cores_per_job": 2})
+        tasks = self._submit(scheduler, ["t1", "t2", "t3"])
+        self._wait_started(2)
+        self.assertEqual([(n, c) for n, c, _ in self.pool.started], [("t1", 2), ("t2", 2)])
+        self._finish(scheduler, ["t1", "t2"])
+        self._wait_started(3)
+        self.assertEqual(self.pool.started[-1][:2], ("t3", 4))
+        self._finish(scheduler, ["t3"])
+        scheduler.close()
+        self.assertEqual([t.get(1)[0]["cores"] for t in tasks], [2, 2, 4])
+
+    def test_idle_cores_capped(self):
+        scheduler = multi._CoreScheduler(self.pool, {"num_jobs": 8, "cores_per_job": 2})
+        self._submit(scheduler, ["t1"])
+        self._wait_started(1)
+        self.assertEqual(self.pool.started[0][1], 2 * multi._MAX_CORE_SCALE)
+        self._finish(scheduler, ["t1"])
+        scheduler.close()
+
+    def test_single_core_jobs_not_scaled(self):
+        scheduler = multi._CoreScheduler(self.pool, {"num_jobs": 2, "cores_per_job": 1})
+        self._submit(scheduler, ["t1"])
+        self._wait_started(1)
+        self.assertEqual(self.pool.started[0][1], 1)
+        self._finish(scheduler, ["t1"])
+        scheduler.close()
+
+    def test_delay_on_low_memory(self):
+        node_monitor = _FakeMonitor()
+        node_monitor.available = False
+        scheduler = multi._CoreScheduler(self.pool, {"num_jobs": 4, "cores_per_job": 1},
+                                         node_monitor)
+        self._submit(scheduler, ["t1", "t2"])
+        self._wait_started(1)
+        node_monitor.available = True
+        scheduler._notify()
+        self._wait_started(2)
+        self._finish(scheduler, ["t1", "t2"])
+        scheduler.close()
+
+    def test_serial_fallback(self):
+        """Single job runs use the standard cores in the current process.
+        """
+        scheduler = multi._SerialScheduler({"num_jobs": 1, "cores_per_job": 3})
+        task = scheduler.submit(_task_cores, [{"name": "t1", "config": _config()}])
+        self.assertTrue(task.ready())
+        self.assertEqual(task.get(), [{"name": "t1", "cores": 3}])
@@ -0,0 +1,48 @@
+"""Tests for passing shared sample data to parallel tasks by reference.
+"""
+import cPickle
+import os
+import shutil
+import tempfile
+import unittest
+
+from bcbio.distributed import objectstore
+
+class ObjectStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        self.store = objectstore.FileStore(self.store_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.store_dir)
+
+    def test_roundtrip(self):
+        resources = {"gatk": {"jvm_opts": ["-Xms500m", "-Xmx3500m"]}}
+        items = [[{"name": name, "config": {"algorithm": {}, "resources": resources},
+                   "provenance": {"entity": name, "programs": {"gatk": "3.0"}}}, "chr1"]
+                 for name in ["s1", "s2"]]
+        refs = self.store.to_refs(items)
+        self.assertTrue(items[0][0]["config"]["resources"] is resources)
+        self.assertTrue(objectstore.REF_KEY in refs[1][0]["config"]["resources"])
+        self.assertEqual(len(os.listdir(self.store_dir)), 2)
+        worker_items = cPickle.loads(cPickle.dumps(refs))
+        self.assertEqual(objectstore.resolve(worker_items), items)
+
+class TempStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_shared_store_removed(self):
+        """Stored objects on the shared filesystem get removed after the parallel block.
+        """
+        base_dir = os.path.join(self.work_dir, "checkpoints_parallel", "objects")
+        with objectstore.shared_store(self.work_dir) as store:
+            ref = store.put({"gatk": {"jvm_opts": ["-Xmx3500m"]}})
+            self.assertEqual(os.path.dirname(ref["dir"]), base_dir)
+            self.assertEqual(len(os.listdir(ref["dir"])), 1)
+        self.assertEqual(os.listdir(base_dir), [])
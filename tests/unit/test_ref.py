@@ -0,0 +1,42 @@
+"""Tests for caching of parsed reference genome information.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from bcbio.bam import ref
+
+class RefInfoTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.ref_file = os.path.join(self.work_dir, "ref.fa")
+        with open(self.ref_file, "w") as out_handle:
+            out_handle.write(">chr1\nACGT\n>chr2\nAC\n")
+        with open(self.ref_file + ".fai", "w") as out_handle:
+            out_handle.write("chr1\t4\t6\t4\t5\nchr2\t2\t18\t2\t3\n")
+        self.orig_cache_file = ref._REF_CACHE_FILE
+        ref._REF_CACHE_FILE = os.path.join(self.work_dir, "cache", "ref_info.json")
+        ref._ref_info.clear()
+
+    def tearDown(self):
+        ref._REF_CACHE_FILE = self.orig_cache_file
+        ref._ref_info.clear()
+        shutil.rmtree(self.work_dir)
+
+    def test_contigs_cached(self):
+        expected = [("chr1", 4), ("chr2", 2)]
+        self.assertEqual(list(ref.file_contigs(self.ref_file, {})), expected)
+        with open(self.ref_file + ".fai", "w") as out_handle:
+            out_handle.write("chrX\t10\t6\t10\t11\n")
+        ref._ref_info.clear()
+        self.assertEqual([tuple(x) for x in ref.file_contigs(self.ref_file, {})], expected)
+
+    def test_updated_reference(self):
+        ref.file_contigs(self.ref_file, {}).next()
+        with open(self.ref_file + ".fai", "w") as out_handle:
+            out_handle.write("chrX\t10\t6\t10\t11\n")
+        mtime = os.path.getmtime(self.ref_file) + 10
+        os.utime(self.ref_file, (mtime, mtime))
+        self.assertEqual(list(ref.file_contigs(self.ref_file, {})), [("chrX", 10)])
@@ -0,0 +1,72 @@
+"""Tests for preparing samples for variant calling by region.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from bcbio.bam import callable, ref
+from bcbio.pipeline import intervals, region
+from bcbio.variation import genotype
+
+class NoReadRegionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.callable_bed = os.path.join(self.work_dir, "s1-callable.bed")
+        with open(self.callable_bed, "w") as out_handle:
+            out_handle.write("chr1\t0\t100\tCALLABLE\nchr1\t100\t500\tNO_COVERAGE\n")
+        ref_file = os.path.join(self.work_dir, "ref.fa")
+        with open(ref_file, "w") as out_handle:
+            out_handle.write(">chr1\n%s\n" % ("A" * 500))
+        with open(ref_file + ".fai", "w") as out_handle:
+            out_handle.write("chr1\t500\t6\t500\t501\n")
+        self.orig_cache_file = ref._REF_CACHE_FILE
+        ref._REF_CACHE_FILE = os.path.join(self.work_dir, "ref_info.json")
+        self.data = {"name": ["", "s1"], "sam_ref": ref_file, "work_bam": "s1.bam",
+                     "rgnames": {"sample": "s1"}, "genome_resources": {"variation": {}},
+                     "dirs": {"work": self.work_dir, "galaxy": self.work_dir, "flowcell": ""},
+                     "config": {"algorithm": {"variantcaller": "gatk"}, "resources": {},
+                                "galaxy_config": "universe_wsgi.ini"},
+                     "regions": {"callable": self.callable_bed}}
+        callable._write_region_coverage([self.data], intervals.Intervals.from_tuples(
+            [("chr1", 0, 100), ("chr1", 200, 300)]))
+        self.orig_get_variantcallers = genotype.get_variantcallers
+        genotype.get_variantcallers = lambda: {"gatk": self._fail_caller}
+
+    def tearDown(self):
+        genotype.get_variantcallers = self.orig_get_variantcallers
+        ref._REF_CACHE_FILE = self.orig_cache_file
+        shutil.rmtree(self.work_dir)
+
+    def _fail_caller(self, *args):
+        raise AssertionError("Variant caller run on region without reads")
+
+    def test_cleaned_sample_skips_caller(self):
+        samples = region.add_region_info([self.data], {"analysis_bed": "analysis.bed"})
+        data = region.clean_sample_data(samples)[0][0]
+        out_file = os.path.join(self.work_dir, "chr1", "s1-chr1_200_300-variants.vcf")
+        data = genotype.variantcall_sample(data, ("chr1", 200, 300), out_file)[0]
+        with open(data["vrn_file"]) as in_handle:
+            header = [x.rstrip() for x in in_handle if x.startswith("#")]
+        self.assertEqual(header[-1].split("\t")[-1], "s1")
+        self.assertIn("##contig=<ID=chr1,length=500>", header)
+        self.assertIn('##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">', header)
+        self.assertRaises(AssertionError, genotype.variantcall_sample, data,
+                          ("chr1", 0, 100), out_file.replace("200_300", "0_100"))
+
+    def test_batched_regions_call_callable_regions(self):
+        called = []
+        def _caller(align_bams, items, ref_file, assoc_files, region, out_file):
+            called.append(items)
+            open(out_file, "w").close()
+            return out_file
+        genotype.get_variantcallers = lambda: {"gatk": _caller}
+        samples = region.add_region_info([self.data], {"analysis_bed": "analysis.bed",
+                                                       "callable_bed": "callable.bed"})
+        data = region.clean_sample_data(samples)[0][0]
+        out_file = os.path.join(self.work_dir, "chr1", "s1-chr1_0_300-variants.vcf")
+        genotype.variantcall_sample(data, ("chr1", 0, 300), out_file)
+        self.assertEqual(called[0][0]["config"]["algorithm"]["variant_regions"], "callable.bed")
+        self.assertEqual(data["config"]["algorithm"]["callable_regions"], "callable.bed")
+        self.assertNotIn("variant_regions", data["config"]["algorithm"])
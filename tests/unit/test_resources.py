@@ -0,0 +1,79 @@
+"""Tests for estimating job resources on clusters with multiple machine types.
+"""
+import unittest
+
+from bcbio.distributed import resources
+from bcbio.pipeline import config_utils
+from bcbio.provenance import system
+
+class MachineClassTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sysinfo = system._combine_machine_info(
+            [{"cores": 16, "memory": 64.0, "name": "slurm_machine"},
+             {"cores": 16, "memory": 256.0, "name": "slurm_machine"},
+             {"cores": 16, "memory": 64.0, "name": "slurm_machine"}])
+
+    def test_combine(self):
+        self.assertEqual(self.sysinfo["memory"], 64.0)
+        self.assertEqual(len(self.sysinfo["classes"]), 2)
+
+    def test_high_memory_jobs(self):
+        config = {"algorithm": {"aligner": "star"},
+                  "resources": {"star": {"cores": 16, "memory": "8g"}}}
+        parallel = resources.calculate({"cores": 64, "progs": ["aligner"]}, [[config]] * 4,
+                                       self.sysinfo, config)
+        self.assertEqual(parallel["cores_per_job"], 16)
+        self.assertTrue(float(parallel["mem"]) > 64.0)
+
+    def test_single_core_jobs(self):
+        config = {"algorithm": {},
+                  "resources": {"gatk": {"jvm_opts": ["-Xms500m", "-Xmx1g"]}}}
+        parallel = resources.calculate({"cores": 64, "progs": ["gatk"]}, [[config]] * 100,
+                                       self.sysinfo, config)
+        self.assertEqual(parallel["cores_per_job"], 1)
+        self.assertEqual(parallel["num_jobs"], 64)
+
+class HistoryTest(unittest.TestCase):
+
+    def _runs(self, maxrss):
+        return {"gatk": [{"cores": 1, "wall": 60.0, "cpu": 60.0, "maxrss": maxrss}] * 3}
+
+    def test_history_raises_memory(self):
+        self.assertEqual(resources._adjust_from_history("gatk", 1, 2.0, self._runs(4.0)), (1, 5.0))
+
+    def test_history_lowers_memory_and_heap(self):
+        """Lower measured memory reduces the reservation and Java heap together.
+        """
+        config = {"algorithm": {},
+                  "resources": {"gatk": {"jvm_opts": ["-Xms750m", "-Xmx4g"]}}}
+        orig_read = resources.diagnostics.read_history
+        resources.diagnostics.read_history = lambda config: self._runs(0.4)
+        try:
+            parallel = resources.calculate({"cores": 4, "progs": ["gatk"]}, [[config]] * 4,
+                                           {}, config)
+        finally:
+            resources.diagnostics.read_history = orig_read
+        self.assertEqual(parallel["mem"], "0.8")
+        self.assertEqual(parallel["jvm_opts"], {"gatk": ["-Xms512m", "-Xmx512m"]})
+        args = config_utils.add_cores_to_config([config], 1, parallel)
+        self.assertEqual(args[0]["resources"]["gatk"]["jvm_opts"], ["-Xms512m", "-Xmx512m"])
+        self.assertEqual(config["resources"]["gatk"]["jvm_opts"], ["-Xms750m", "-Xmx4g"])
+
+    def test_history_keeps_configured_memory(self):
+        """Programs without a lowered heap keep configured memory used to size buffers.
+        """
+        config = {"algorithm": {}, "resources": {"samtools": {"memory": "3g"}}}
+        orig_read = resources.diagnostics.read_history
+        resources.diagnostics.read_history = lambda config: {"samtools": self._runs(0.4)["gatk"]}
+        try:
+            parallel = resources.calculate({"cores": 4, "progs": ["samtools"]}, [[config]] * 4,
+                                           {}, config)
+        finally:
+            resources.diagnostics.read_history = orig_read
+        self.assertEqual(parallel["mem"], "3.2")
+        self.assertNotIn("jvm_opts", parallel)
+
+    def test_history_keeps_smaller_heap(self):
+        self.assertEqual(resources._adjust_jvm_opts(["-Xms250m", "-Xmx1g"], 2.0),
+                         ["-Xms250m", "-Xmx1g"])
@@ -0,0 +1,51 @@
+"""Tests for sampling memory and CPU usage of external command process trees.
+"""
+import subprocess
+import sys
+import threading
+import unittest
+
+from bcbio.provenance import do, sampler
+
+# Parent process running a child which holds 200Mb while using CPU for a second
+_CHILD = "import time; x = bytearray(200 * 1024 * 1024); end = time.time() + 1.0\n" \
+         "while time.time() < end: pass"
+_PARENT = "import subprocess, sys; sys.exit(subprocess.call([sys.executable, '-c', %r]))" % _CHILD
+
+def _sampler_threads():
+    return [t for t in threading.enumerate() if t.name.startswith("sampler-")]
+
+class ProcessTreeSamplerTest(unittest.TestCase):
+
+    def test_child_tree(self):
+        proc = subprocess.Popen([sys.executable, "-c", _PARENT])
+        proc_sampler = sampler.ProcessTreeSampler(proc.pid, 0.1).start()
+        proc.wait()
+        usage = proc_sampler.stop()
+        self.assertEqual(proc.returncode, 0)
+        self.assertTrue(usage["rss_peak"] > 0.18, usage)
+        self.assertTrue(usage["rss_mean"] <= usage["rss_peak"])
+        self.assertTrue(usage["cpu_peak"] > 50.0, usage)
+        self.assertTrue(max(usage["processes"].values()) > 0.18, usage)
+        self.assertEqual(_sampler_threads(), [])
+
+    def test_stops_on_exit(self):
+        """Sampling ends once the process finishes, before stop gets called.
+        """
+        proc = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(0.3)"])
+        proc_sampler = sampler.ProcessTreeSampler(proc.pid, 0.05).start()
+        proc.wait()
+        proc_sampler._thread.join(5.0)
+        self.assertFalse(proc_sampler._thread.is_alive())
+        self.assertTrue(proc_sampler.stop()["rss_peak"] > 0)
+
+    def test_stops_on_failure(self):
+        cmd = [sys.executable, "-c", "import time, sys; time.sleep(0.3); sys.exit(1)"]
+        self.assertRaises(subprocess.CalledProcessError, do._do_run, cmd, None,
+                          sample_interval=0.05)
+        self.assertEqual(_sampler_threads(), [])
+
+    def test_disabled(self):
+        proc_sampler = sampler.ProcessTreeSampler(1, 0).start()
+        self.assertEqual(proc_sampler.stop(), {})
+        self.assertEqual(_sampler_threads(), [])
@@ -0,0 +1,64 @@
+"""Tests for splitting work by region and combining outputs as parts finish.
+"""
+import threading
+import unittest
+
+from bcbio.distributed import split
+
+_REGIONS = ["chr1", "chr2", "chr3"]
+
+def _split_fn(data):
+    out_file = "%s-final.bam" % data["name"]
+    return out_file, [(r, "%s-%s.bam" % (data["name"], r)) for r in _REGIONS]
+
+class _FakeParallel:
+    """Run parallel functions, streaming split outputs in an order different from inputs.
+    """
+    def __init__(self, extra_output=None):
+        self.combined = []
+        self._extra_output = extra_output
+        self._lock = threading.Lock()
+
+    def __call__(self, fn_name, items, stream=False):
+        if fn_name == "process_region":
+            out = [dict(data, work_bam=part_file, region=region)
+                   for data, region, part_file in items]
+            out = out[1::2] + out[::2]
+            if self._extra_output:
+                out.insert(2, dict(out[0], work_bam=self._extra_output))
+            return iter(out) if stream else out
+        elif fn_name == "combine_bam":
+            with self._lock:
+                self.combined.extend((x[1], x[0]) for x in items)
+            return iter([]) if stream else []
+        raise ValueError(fn_name)
+
+class ReadyCombinerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.args = [[{"name": name, "config": {}}] for name in ["s1", "s2", "s3"]]
+
+    def _run(self, parallel_fn):
+        return split.parallel_split_combine(self.args, _split_fn, parallel_fn, "process_region",
+                                            "combine_bam", "work_bam", ["config"])
+
+    def test_combine_once_in_order(self):
+        parallel_fn = _FakeParallel()
+        out = self._run(parallel_fn)
+        split_args, combine_map, _, _ = split._get_split_tasks(self.args, _split_fn, "work_bam")
+        in_order = [dict(data, work_bam=part_file, region=region)
+                    for data, region, part_file in split_args]
+        _, expected = split._organize_output(in_order, combine_map, "work_bam", ["config"])
+        self.assertEqual(out, expected)
+        self.assertEqual([(x[0]["work_bam"], x[0]["region"]) for x in out[:3]],
+                         [("s1-final.bam", "chr1"), ("s2-final.bam", "chr1"),
+                          ("s3-final.bam", "chr1")])
+        self.assertEqual(sorted(parallel_fn.combined),
+                         [("%s-final.bam" % s, ["%s-%s.bam" % (s, r) for r in _REGIONS])
+                          for s in ["s1", "s2", "s3"]])
+
+    def test_unexpected_output(self):
+        parallel_fn = _FakeParallel(extra_output="other.bam")
+        with self.assertRaises(ValueError) as cm:
+            self._run(parallel_fn)
+        self.assertIn("other.bam", str(cm.exception))
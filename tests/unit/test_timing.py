@@ -0,0 +1,65 @@
+"""Tests for reporting timing of pipeline stages from run logs.
+"""
+import json
+import os
+import shutil
+import StringIO
+import tempfile
+import time
+import unittest
+
+from bcbio.provenance import timing
+
+class TimingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        log_dir = os.path.join(self.work_dir, "log")
+        os.makedirs(log_dir)
+        self.start = time.mktime(time.strptime("2014-03-01 10:00", "%Y-%m-%d %H:%M"))
+        with open(os.path.join(log_dir, "bcbio-nextgen.log"), "w") as out_handle:
+            out_handle.write("[2014-03-01 10:00] Timing: alignment\n"
+                             "[2014-03-01 11:00] host1: Timing: variant calling\n"
+                             "[2014-03-01 13:00] Timing: finished\n")
+        cmds = [("s1", None, 0, 3000), ("s2", None, 0, 3500),
+                ("s1", "chr1:0-1000", 3700, 5000), ("s2", "chr1:0-1000", 3700, 4000),
+                ("s2", "chr2:0-1000", 3700, 10000)]
+        with open(os.path.join(log_dir, "bcbio-nextgen-diagnostics.log"), "w") as out_handle:
+            for sample, region, start, end in cmds:
+                out_handle.write(json.dumps({"sample": sample, "region": region, "descr": "call",
+                                             "start_time": self.start + start, "end_time": self.start + end,
+                                             "wall": end - start, "cpu": None, "cores": 1}) + "\n")
+            out_handle.write(json.dumps({"event": "parallel", "name": "full", "type": "local", "cores": 2,
+                                         "start_time": self.start + 3600,
+                                         "end_time": self.start + 10800}) + "\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_critical_path(self):
+        log_dir = os.path.join(self.work_dir, "log")
+        stages = timing.read_stages(os.path.join(log_dir, "bcbio-nextgen.log"))
+        self.assertEqual([x["name"] for x in stages], ["alignment", "variant calling"])
+        self.assertEqual(stages[1]["end"] - stages[1]["start"], 7200)
+        commands, blocks = timing.read_diagnostics(log_dir)
+        timing.assign_stages(commands, stages)
+        path = timing.critical_path(stages, commands)
+        self.assertEqual([(x["stage"], x["sample"]) for x in path],
+                         [("alignment", "s2"), ("variant calling", "s2")])
+        self.assertEqual([x["wait"] for x in path], [0, 200])
+        self.assertEqual(path[1]["cmd_wall"], 6300)
+        self.assertEqual(sum(x["wait"] + x["wall"] for x in path), 10000)
+        block = timing.block_utilization(blocks, commands)[0]
+        self.assertAlmostEqual(block["core_hours"], 4.0)
+        self.assertAlmostEqual(block["cpu_hours"], 7900 / 3600.0)
+
+    def test_report(self):
+        class Args:
+            workdir = self.work_dir
+            top = 1
+        out_handle = StringIO.StringIO()
+        timing.report(Args(), out_handle)
+        regions = out_handle.getvalue().split("## Slowest variant calling regions")[-1]
+        self.assertTrue("## Critical path" in out_handle.getvalue())
+        self.assertTrue("chr2:0-1000" in regions)
+        self.assertFalse("chr1:0-1000" in regions)
@@ -0,0 +1,47 @@
+"""Tests for file transactions moving finished outputs into place.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from bcbio.distributed import transaction
+
+class TransactionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.out_file = os.path.join(self.work_dir, "out.vcf")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def _write(self, content):
+        with transaction.file_transaction(self.out_file) as tx_out_file:
+            with open(tx_out_file, "w") as out_handle:
+                out_handle.write(content)
+            with open(tx_out_file + ".idx", "w") as out_handle:
+                out_handle.write(content)
+
+    def _read(self, fname):
+        with open(fname) as in_handle:
+            return in_handle.read()
+
+    def test_replace_existing(self):
+        self._write("first")
+        self._write("second")
+        self.assertEqual(self._read(self.out_file), "second")
+
+    def test_keep_existing(self):
+        """Copies of a task finishing later leave the first outputs in place.
+        """
+        self._write("first")
+        with transaction.keep_existing():
+            self._write("second")
+        self.assertEqual(self._read(self.out_file), "first")
+        self.assertEqual(self._read(self.out_file + ".idx"), "first")
+        self.assertEqual(os.listdir(os.path.join(self.work_dir, "tx")), [])
+        with transaction.keep_existing():
+            os.remove(self.out_file)
+            self._write("third")
+        self.assertEqual(self._read(self.out_file), "third")